@@ -0,0 +1,57 @@
+import tracemalloc
+from typing import Any, Callable
+
+import pytest
+
+from benchmarks.proofs import build_proof
+from tests import test_band_utils, test_consumer_evm_utils
+
+# The fixtures of the tests, registered here under their own names, so that the benchmarks run on the same data.
+mock_request_resp_fixture = test_band_utils.mock_request_resp
+mock_block_hash_fixture = test_consumer_evm_utils.mock_block_hash
+mock_encoded_chain_id_fixture = test_consumer_evm_utils.mock_encoded_chain_id
+mock_evm_proof_fixture = test_consumer_evm_utils.mock_evm_proof
+mock_validator_power_fixture = test_consumer_evm_utils.mock_validator_power
+
+VALIDATOR_COUNTS = ["fixture", 50, 100, 300]
+
+
+@pytest.fixture(params=VALIDATOR_COUNTS, ids=lambda count: f"validators={count}")
+def proof_case(
+    request,
+    mock_evm_proof_fixture,
+    mock_block_hash_fixture,
+    mock_encoded_chain_id_fixture,
+    mock_validator_power_fixture,
+) -> tuple[bytes, bytes, bytes, dict[str, int]]:
+    """Returns (evm_proof_bytes, block_hash, encoded_band_chain_id, validator_power) for each validator set size."""
+    if request.param == "fixture":
+        return (
+            mock_evm_proof_fixture,
+            mock_block_hash_fixture,
+            mock_encoded_chain_id_fixture,
+            mock_validator_power_fixture,
+        )
+
+    evm_proof_bytes, validator_power = build_proof(
+        mock_evm_proof_fixture, mock_block_hash_fixture, mock_encoded_chain_id_fixture, request.param
+    )
+    return evm_proof_bytes, mock_block_hash_fixture, mock_encoded_chain_id_fixture, validator_power
+
+
+@pytest.fixture
+def run_benchmark(benchmark) -> Callable[..., Any]:
+    """Benchmarks a function and records the peak memory allocated by a single call in `extra_info`."""
+
+    def run(fn: Callable[..., Any], *args: Any) -> Any:
+        tracemalloc.start()
+        try:
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_bytes"] = peak
+
+        return benchmark(fn, *args)
+
+    return run
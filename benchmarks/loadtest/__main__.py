@@ -0,0 +1,237 @@
+"""Load test for the VRF worker.
+
+Runs the real `main.py` entry point against in-process BandChain and EVM stand-ins, feeding it tasks at each of the
+given arrival rates, and reports throughput, per-stage latency and resource usage of the worker process.
+
+Usage:
+    uv run python -m benchmarks.loadtest --rates 30,60,120 --duration 120
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from eth_abi import encode
+from eth_account import Account
+from omegaconf import OmegaConf
+from web3 import Web3
+
+from benchmarks.loadtest.band import FakeBand
+from benchmarks.loadtest.common import Faults, Timeline, percentile
+from benchmarks.loadtest.evm import FakeEvm
+from benchmarks.proofs import build_proof
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+
+ROOT = Path(__file__).resolve().parents[2]
+
+BAND_MNEMONIC = "test test test test test test test test test test test junk"
+EVM_PRIVATE_KEY = "0x" + "11" * 32
+CALLER = "0x" + "ca" * 20
+BLOCK_HASH = bytes.fromhex("86193650adaf2d4a975406cd12bed968242527c579b0244360433598212824c5")
+ENCODED_BAND_CHAIN_ID = bytes.fromhex("321162616e642d76332d746573746e65742d31")
+
+
+def template_proof() -> bytes:
+    """Builds an unsigned proof whose common encoded vote part matches a real BandChain vote."""
+    multi_store = tuple(bytes(32) for _ in range(6))
+    merkle_parts = (bytes(32), 1, int(time.time()), 0, bytes(32), bytes(32), bytes(32), bytes(32))
+    cevp = (
+        bytes.fromhex("080211d66b4b000000000022480a20"),
+        bytes.fromhex("122408011220ead12b282c85aefb0d415df82c564287f3a6bbac44749470aeca8c88a191a806"),
+    )
+    relay_data = encode(RELAY_DATA_TYPES, (multi_store, merkle_parts, cevp, []))
+    return encode(("bytes", "bytes"), (relay_data, b""))
+
+
+def sample_process(pid: int) -> tuple[float, int] | None:
+    """Returns (cpu_seconds, rss_bytes) of a process, or None where /proc is not available."""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+        rss_pages = int(Path(f"/proc/{pid}/statm").read_text().split()[1])
+    except (FileNotFoundError, ProcessLookupError, IndexError):
+        return None
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(stat[11]) + int(stat[12])) / ticks, rss_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def write_config(path: Path, rpc_endpoint: str, grpc_endpoint: str, args: argparse.Namespace) -> None:
+    addresses = [Web3.to_checksum_address("0x" + f"{i:02x}" * 20) for i in (1, 2, 3, 4)]
+    config = {
+        "evm_chain_config": {
+            "chain_id": "loadtest",
+            "rpc_endpoint": rpc_endpoint,
+            "vrf_provider_address": addresses[0],
+            "vrf_lens_address": addresses[1],
+            "bridge_address": addresses[2],
+            "private_key": EVM_PRIVATE_KEY,
+            "whitelisted_callers": [Web3.to_checksum_address(CALLER)],
+            "start_nonce": 0,
+            "eip1559": True,
+            "relay_mode": args.relay_mode,
+            "batch_relayer_address": addresses[3] if args.batch_window > 0 else None,
+            "batch_window": args.batch_window,
+            # the template proof has no real block header or result to verify
+            "verify_proofs": False,
+        },
+        "band_chain_config": {
+            "grpc_endpoint": grpc_endpoint,
+            "grpc_ssl": False,
+            "mnemonic": BAND_MNEMONIC,
+        },
+        "worker_config": {"concurrency": args.concurrency},
+    }
+    OmegaConf.save(OmegaConf.create(config), path)
+
+
+async def run_rate(args: argparse.Namespace, rate: float, evm_proof_bytes: bytes, validator_power: dict) -> dict:
+    timeline = Timeline()
+    evm = FakeEvm(
+        timeline,
+        Web3.to_checksum_address(CALLER),
+        ENCODED_BAND_CHAIN_ID,
+        validator_power,
+        Faults(args.evm_latency, args.evm_jitter, args.evm_failure_rate),
+        block_time=args.evm_block_time,
+        batch_relayer_owner=Account.from_key(EVM_PRIVATE_KEY).address,
+    )
+    band = FakeBand(
+        timeline,
+        evm_proof_bytes,
+        BLOCK_HASH,
+        Faults(args.band_latency, args.band_jitter, args.band_failure_rate),
+        block_time=args.band_block_time,
+        resolve_time=args.band_resolve_time,
+        resolve_jitter=args.band_resolve_jitter,
+    )
+    rpc_endpoint = evm.start()
+    grpc_endpoint = await band.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.yaml"
+        write_config(config_path, rpc_endpoint, grpc_endpoint, args)
+        log = open(args.log, "ab") if args.log else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, str(ROOT / "main.py"), "--config", str(config_path)]
+            + (["--record", f"{args.record}.{rate}"] if args.record else []),
+            cwd=ROOT,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+        started_at = time.monotonic()
+        samples = []
+        next_arrival = started_at
+        try:
+            while time.monotonic() - started_at < args.duration + args.drain:
+                now = time.monotonic()
+                arriving = now - started_at < args.duration
+                while arriving and next_arrival <= now:
+                    evm.add_task()
+                    next_arrival += random.expovariate(rate / 60)
+                if (sample := sample_process(process.pid)) is not None:
+                    samples.append(sample)
+                if not arriving and timeline.count("relay_confirmed") >= evm.task_count:
+                    break
+                await asyncio.sleep(0.2)
+        finally:
+            elapsed = time.monotonic() - started_at
+            process.terminate()
+            process.wait()
+            if log is not subprocess.DEVNULL:
+                log.close()
+            await band.stop()
+            evm.stop()
+
+    relayed = timeline.count("relay_confirmed")
+    report = {
+        "arrival_rate_per_min": rate,
+        "tasks_created": evm.task_count,
+        "tasks_relayed": relayed,
+        "throughput_per_min": relayed / (elapsed / 60),
+        "elapsed_s": elapsed,
+        "relay_transactions": evm.transactions,
+        "relay_gas_used": evm.gas_used,
+        "block_relays": evm.block_relays,
+        "calldata_kb": evm.calldata_bytes / 1024,
+        "latency_s": {
+            stage: {"p50": percentile(values, 50), "p95": percentile(values, 95), "count": len(values)}
+            for stage, values in timeline.stage_latencies().items()
+        },
+    }
+    if samples:
+        report["cpu_s"] = samples[-1][0]
+        report["cpu_utilization"] = samples[-1][0] / elapsed
+        report["peak_rss_mb"] = max(rss for _, rss in samples) / 2**20
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"\n== arrival rate {report['arrival_rate_per_min']:.0f}/min: "
+        f"{report['tasks_relayed']}/{report['tasks_created']} relayed, "
+        f"throughput {report['throughput_per_min']:.1f}/min over {report['elapsed_s']:.0f}s"
+    )
+    print(
+        f"   {report['relay_transactions']} relay transactions using {report['relay_gas_used']} gas "
+        f"({report['block_relays']} block relays), {report['calldata_kb']:.0f} KiB of relay calldata"
+    )
+    if "cpu_s" in report:
+        print(
+            f"   cpu {report['cpu_s']:.1f}s ({report['cpu_utilization']:.0%}), peak rss {report['peak_rss_mb']:.0f} MiB"
+        )
+    for stage, latency in report["latency_s"].items():
+        print(f"   {stage:<34} p50 {latency['p50']:7.2f}s  p95 {latency['p95']:7.2f}s  n={latency['count']}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="VRF Worker load test")
+    parser.add_argument("--rates", type=str, default="30,60,120", help="Task arrival rates per minute")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds to generate tasks for at each rate")
+    parser.add_argument("--drain", type=float, default=60, help="Seconds to wait for in-flight tasks afterwards")
+    parser.add_argument("--validators", type=int, default=100, help="Number of validators signing each proof")
+    parser.add_argument("--concurrency", type=int, default=1, help="Worker task concurrency")
+    parser.add_argument("--relay-mode", type=str, default="proof", choices=["proof", "block"])
+    parser.add_argument(
+        "--batch-window", type=float, default=0, help="Relay proofs in batches collected over this many seconds"
+    )
+    parser.add_argument("--evm-latency", type=float, default=0.05)
+    parser.add_argument("--evm-jitter", type=float, default=0.02)
+    parser.add_argument("--evm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--evm-block-time", type=float, default=2.0)
+    parser.add_argument("--band-latency", type=float, default=0.05)
+    parser.add_argument("--band-jitter", type=float, default=0.02)
+    parser.add_argument("--band-failure-rate", type=float, default=0.0)
+    parser.add_argument("--band-block-time", type=float, default=2.0)
+    parser.add_argument("--band-resolve-time", type=float, default=6.0)
+    parser.add_argument("--band-resolve-jitter", type=float, default=2.0)
+    parser.add_argument("--log", type=str, default=None, help="Append the worker output to this file")
+    parser.add_argument("--json", type=str, default=None, help="Write the reports to this file as JSON")
+    parser.add_argument(
+        "--record", type=str, default=None, help="Record the worker's chain calls at each rate to <RECORD>.<rate>"
+    )
+    args = parser.parse_args()
+
+    evm_proof_bytes, validator_power = build_proof(template_proof(), BLOCK_HASH, ENCODED_BAND_CHAIN_ID, args.validators)
+    evm_address = Account.from_key(EVM_PRIVATE_KEY).address
+    print(f"worker evm address {evm_address}, {args.validators} validators")
+
+    reports = []
+    for rate in [float(rate) for rate in args.rates.split(",")]:
+        report = await run_rate(args, rate, evm_proof_bytes, validator_power)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
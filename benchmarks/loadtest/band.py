@@ -0,0 +1,239 @@
+import hashlib
+import random
+import time
+
+import grpclib
+from grpclib.server import Server
+from pyband.proto.band.base.oracle.v1 import (
+    OracleDataProof,
+    ProofRequest,
+    ProofResponse,
+    SingleProof,
+    SingleProofResult,
+)
+from pyband.proto.band.base.oracle.v1 import ServiceBase as OracleServiceBase
+from pyband.proto.band.oracle.v1 import MsgRequestData, ResolveStatus, Result
+from pyband.proto.cosmos.auth.v1beta1 import BaseAccount, QueryAccountInfoRequest, QueryAccountInfoResponse, QueryBase
+from pyband.proto.cosmos.base.abci.v1beta1 import GasInfo, TxResponse
+from pyband.proto.cosmos.base.tendermint.v1beta1 import (
+    GetBlockByHeightRequest,
+    GetBlockByHeightResponse,
+    GetLatestBlockRequest,
+    GetLatestBlockResponse,
+)
+from pyband.proto.cosmos.base.tendermint.v1beta1 import ServiceBase as TendermintServiceBase
+from pyband.proto.cosmos.tx.v1beta1 import (
+    AuthInfo,
+    BroadcastTxRequest,
+    BroadcastTxResponse,
+    GetTxRequest,
+    GetTxResponse,
+    SimulateRequest,
+    SimulateResponse,
+    TxBody,
+    TxRaw,
+)
+from pyband.proto.cosmos.tx.v1beta1 import ServiceBase as TxServiceBase
+from pyband.proto.tendermint.abci import Event, EventAttribute
+from pyband.proto.tendermint.types import Block, BlockId, Header
+
+from benchmarks.loadtest.common import Faults, InjectedFailure, Timeline
+from vrf_worker.band.client import VRF_OBI
+
+
+class FakeBand:
+    """A BandChain gRPC stand-in serving account, tx broadcast, tx lookup, proof and block queries.
+
+    Like a real node, a broadcast tx must have the next sequence of the account counting the txs in the mempool,
+    while account queries return the sequence as of the last committed block. A broadcast request tx is included
+    after `block_time` seconds and its request resolves `resolve_time` seconds
+    (plus up to `resolve_jitter`) after broadcast. Every block has the same hash, so a single proof signed over
+    that hash is served for every request. A tx uses `tx_gas` plus `msg_gas` per message, and one with a lower gas
+    limit runs out of gas.
+    """
+
+    def __init__(
+        self,
+        timeline: Timeline,
+        evm_proof_bytes: bytes,
+        block_hash: bytes,
+        faults: Faults,
+        block_time: float = 2.0,
+        resolve_time: float = 6.0,
+        resolve_jitter: float = 2.0,
+        chain_id: str = "band-loadtest",
+        tx_gas: int = 60_000,
+        msg_gas: int = 110_000,
+    ) -> None:
+        self.timeline = timeline
+        self.evm_proof_bytes = evm_proof_bytes
+        self.block_hash = block_hash
+        self.faults = faults
+        self.block_time = block_time
+        self.resolve_time = resolve_time
+        self.resolve_jitter = resolve_jitter
+        self.chain_id = chain_id
+        self.tx_gas = tx_gas
+        self.msg_gas = msg_gas
+
+        self._start = time.monotonic()
+        # next sequence of each account counting the mempool, and the heights its accepted txs are committed at
+        self._sequences: dict[str, int] = {}
+        self._commit_heights: dict[str, list[int]] = {}
+        self._txs: dict[str, tuple[float, int]] = {}
+        # request id -> (resolve time, task nonce, request message, request and resolve unix times)
+        self._requests: dict[int, tuple[float, int | None, MsgRequestData, tuple[int, int]]] = {}
+        self._server: Server | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = Server([_AuthQuery(self), _TendermintService(self), _TxService(self), _OracleService(self)])
+        await self._server.start(host, port)
+        (socket,) = self._server._server.sockets
+        return f"{host}:{socket.getsockname()[1]}"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def check(self) -> None:
+        try:
+            await self.faults.apply_async()
+        except InjectedFailure as e:
+            raise grpclib.GRPCError(grpclib.const.Status.UNAVAILABLE, str(e))
+
+    def height(self) -> int:
+        return int((time.monotonic() - self._start) / self.block_time) + 1
+
+    def committed_sequence(self, address: str) -> int:
+        """Returns the sequence of an account as of the last committed block."""
+        height = self.height()
+        return sum(1 for commit_height in self._commit_heights.get(address, []) if commit_height <= height)
+
+    def block(self, height: int) -> Block:
+        return Block(header=Header(chain_id=self.chain_id, height=height))
+
+    def gas_used(self, tx_bytes: bytes) -> int:
+        body = TxBody().parse(TxRaw().parse(tx_bytes).body_bytes)
+        return self.tx_gas + self.msg_gas * len(body.messages)
+
+    def broadcast(self, tx_bytes: bytes) -> TxResponse:
+        tx_raw = TxRaw().parse(tx_bytes)
+        body = TxBody().parse(tx_raw.body_bytes)
+        msg = MsgRequestData().parse(body.messages[0].value)
+
+        auth_info = AuthInfo().parse(tx_raw.auth_info_bytes)
+        if auth_info.fee.gas_limit < self.gas_used(tx_bytes):
+            return TxResponse(code=11, raw_log=f"out of gas, gas wanted {auth_info.fee.gas_limit}")
+        sequence = auth_info.signer_infos[0].sequence
+        expected_sequence = self._sequences.get(msg.sender, 0)
+        if sequence != expected_sequence:
+            return TxResponse(
+                code=32, raw_log=f"account sequence mismatch, expected {expected_sequence}, got {sequence}"
+            )
+        self._sequences[msg.sender] = expected_sequence + 1
+        self._commit_heights.setdefault(msg.sender, []).append(self.height() + 1)
+        request_id = len(self._requests) + 1
+        nonce = self.timeline.nonce_of_seed(bytes(VRF_OBI.decode_input(msg.calldata)["seed"]))
+        now = time.monotonic()
+        resolve_at = now + self.resolve_time + random.uniform(0, self.resolve_jitter)
+        unix_times = (int(time.time()), int(time.time() + resolve_at - now))
+        self._requests[request_id] = (resolve_at, nonce, msg, unix_times)
+
+        tx_hash = hashlib.sha256(tx_bytes).hexdigest().upper()
+        self._txs[tx_hash] = (now + self.block_time, request_id)
+        if nonce is not None:
+            self.timeline.mark(nonce, "band_requested")
+        return TxResponse(code=0, txhash=tx_hash)
+
+    def tx(self, tx_hash: str) -> TxResponse:
+        if tx_hash not in self._txs or time.monotonic() < self._txs[tx_hash][0]:
+            raise grpclib.GRPCError(grpclib.const.Status.NOT_FOUND, f"tx {tx_hash} not found")
+
+        request_id = self._txs[tx_hash][1]
+        event = Event(type="request", attributes=[EventAttribute(key="id", value=str(request_id))])
+        return TxResponse(code=0, txhash=tx_hash, height=self.height(), events=[event])
+
+    def proof(self, request_id: int, height: int) -> ProofResponse:
+        if request_id not in self._requests:
+            raise grpclib.GRPCError(grpclib.const.Status.NOT_FOUND, f"request {request_id} not found")
+
+        resolve_at, nonce, msg, (request_time, resolve_time) = self._requests[request_id]
+        resolved = time.monotonic() >= resolve_at
+        result = Result(
+            request_id=request_id,
+            ask_count=msg.ask_count,
+            min_count=msg.min_count,
+            request_time=request_time,
+            resolve_time=resolve_time if resolved else 0,
+            resolve_status=ResolveStatus.SUCCESS if resolved else ResolveStatus.OPEN_UNSPECIFIED,
+        )
+        current_height = height or self.height()
+        oracle_data_proof = OracleDataProof(result=result, version=current_height - 1)
+
+        evm_proof_bytes = b""
+        if resolved and height:
+            evm_proof_bytes = self.evm_proof_bytes
+            if nonce is not None:
+                self.timeline.mark(nonce, "proof_served")
+
+        return ProofResponse(
+            height=current_height,
+            result=SingleProofResult(
+                proof=SingleProof(block_height=current_height, oracle_data_proof=oracle_data_proof),
+                evm_proof_bytes=evm_proof_bytes,
+            ),
+        )
+
+
+class _AuthQuery(QueryBase):
+    def __init__(self, fake: FakeBand) -> None:
+        self.fake = fake
+
+    async def account_info(self, request: QueryAccountInfoRequest) -> QueryAccountInfoResponse:
+        await self.fake.check()
+        sequence = self.fake.committed_sequence(request.address)
+        return QueryAccountInfoResponse(info=BaseAccount(address=request.address, account_number=1, sequence=sequence))
+
+
+class _TendermintService(TendermintServiceBase):
+    def __init__(self, fake: FakeBand) -> None:
+        self.fake = fake
+
+    async def get_latest_block(self, request: GetLatestBlockRequest) -> GetLatestBlockResponse:
+        await self.fake.check()
+        return GetLatestBlockResponse(
+            block_id=BlockId(hash=self.fake.block_hash), block=self.fake.block(self.fake.height())
+        )
+
+    async def get_block_by_height(self, request: GetBlockByHeightRequest) -> GetBlockByHeightResponse:
+        await self.fake.check()
+        return GetBlockByHeightResponse(
+            block_id=BlockId(hash=self.fake.block_hash), block=self.fake.block(request.height)
+        )
+
+
+class _TxService(TxServiceBase):
+    def __init__(self, fake: FakeBand) -> None:
+        self.fake = fake
+
+    async def broadcast_tx(self, request: BroadcastTxRequest) -> BroadcastTxResponse:
+        await self.fake.check()
+        return BroadcastTxResponse(tx_response=self.fake.broadcast(request.tx_bytes))
+
+    async def simulate(self, request: SimulateRequest) -> SimulateResponse:
+        await self.fake.check()
+        return SimulateResponse(gas_info=GasInfo(gas_used=self.fake.gas_used(request.tx_bytes)))
+
+    async def get_tx(self, request: GetTxRequest) -> GetTxResponse:
+        await self.fake.check()
+        return GetTxResponse(tx_response=self.fake.tx(request.hash))
+
+
+class _OracleService(OracleServiceBase):
+    def __init__(self, fake: FakeBand) -> None:
+        self.fake = fake
+
+    async def proof(self, request: ProofRequest) -> ProofResponse:
+        await self.fake.check()
+        return self.fake.proof(request.request_id, request.height)
@@ -0,0 +1,85 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+STAGES = ["created", "band_requested", "proof_served", "relay_sent", "relay_confirmed"]
+
+
+class InjectedFailure(Exception):
+    """Raised by a stand-in when a call is picked to fail."""
+
+
+@dataclass
+class Faults:
+    """Latency, jitter and failure rate applied to every call served by a stand-in."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        return random.random() < self.failure_rate
+
+    def apply_sync(self) -> None:
+        time.sleep(self.delay())
+        if self.should_fail():
+            raise InjectedFailure("injected failure")
+
+    async def apply_async(self) -> None:
+        await asyncio.sleep(self.delay())
+        if self.should_fail():
+            raise InjectedFailure("injected failure")
+
+
+class Timeline:
+    """Thread-safe record of when each task nonce reached each pipeline stage."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stages: dict[int, dict[str, float]] = defaultdict(dict)
+        self._nonce_by_seed: dict[bytes, int] = {}
+
+    def register_seed(self, nonce: int, seed: bytes) -> None:
+        with self._lock:
+            self._nonce_by_seed[seed] = nonce
+
+    def nonce_of_seed(self, seed: bytes) -> int | None:
+        with self._lock:
+            return self._nonce_by_seed.get(seed)
+
+    def mark(self, nonce: int, stage: str) -> None:
+        with self._lock:
+            # keep the first time a stage is reached, retries do not reset the clock
+            self._stages[nonce].setdefault(stage, time.monotonic())
+
+    def count(self, stage: str) -> int:
+        with self._lock:
+            return sum(1 for stages in self._stages.values() if stage in stages)
+
+    def stage_latencies(self) -> dict[str, list[float]]:
+        """Returns the time spent between consecutive stages, for every task that reached both."""
+        latencies: dict[str, list[float]] = {f"{start}->{end}": [] for start, end in zip(STAGES, STAGES[1:])}
+        latencies["end_to_end"] = []
+        with self._lock:
+            for stages in self._stages.values():
+                for start, end in zip(STAGES, STAGES[1:]):
+                    if start in stages and end in stages:
+                        latencies[f"{start}->{end}"].append(stages[end] - stages[start])
+                if "created" in stages and "relay_confirmed" in stages:
+                    latencies["end_to_end"].append(stages["relay_confirmed"] - stages["created"])
+        return latencies
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
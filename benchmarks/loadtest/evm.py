@@ -0,0 +1,342 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rlp
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+from benchmarks.loadtest.common import Faults, InjectedFailure, Timeline
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+
+
+def _selector(signature: str) -> bytes:
+    return keccak(text=signature)[:4]
+
+
+TASK_NONCE = _selector("taskNonce()")
+ORACLE_SCRIPT_ID = _selector("oracleScriptID()")
+GET_TASKS_BULK = _selector("getTasksBulk(uint64[])")
+ENCODED_CHAIN_ID = _selector("encodedChainID()")
+GET_ALL_VALIDATOR_POWERS = _selector("getAllValidatorPowers()")
+RELAY_PROOF = _selector("relayProof(bytes,uint64)")
+BLOCK_DETAILS = _selector("blockDetails(uint256)")
+RELAY_BLOCK = _selector(
+    "relayBlock((bytes32,bytes32,bytes32,bytes32,bytes32,bytes32),"
+    "(bytes32,uint64,uint64,uint32,bytes32,bytes32,bytes32,bytes32),(bytes,bytes),(bytes32,bytes32,uint8,bytes)[])"
+)
+AGGREGATE3 = _selector("aggregate3((address,bool,bytes)[])")
+OWNER = _selector("owner()")
+
+CALL3_TYPE = "(address,bool,bytes)[]"
+TASK_TYPE = "(bool,uint64,address,uint256,bytes32,bytes32,bytes)"
+
+
+class FakeEvm:
+    """An EVM JSON-RPC stand-in serving the VRF provider, VRF lens and bridge contracts.
+
+    Tasks are created by `add_task`. A `relayProof` transaction resolves its task once it is mined, `block_time`
+    seconds after it was sent. A `relayBlock` transaction records its block once mined, after which proofs for the
+    block are accepted without signatures. Batches sent through `aggregate3` at any address relay each of their
+    calls, and revert as a whole if a call that does not allow failure fails. Any address answers `owner()` with
+    `batch_relayer_owner`, if it is set.
+    """
+
+    def __init__(
+        self,
+        timeline: Timeline,
+        caller: str,
+        encoded_band_chain_id: bytes,
+        validator_power: dict[str, int],
+        faults: Faults,
+        oracle_script_id: int = 1,
+        block_time: float = 2.0,
+        chain_id: int = 31337,
+        batch_relayer_owner: str | None = None,
+    ) -> None:
+        self.timeline = timeline
+        self.caller = caller
+        self.encoded_band_chain_id = encoded_band_chain_id
+        self.validator_power = validator_power
+        self.faults = faults
+        self.oracle_script_id = oracle_script_id
+        self.block_time = block_time
+        self.chain_id = chain_id
+        self.batch_relayer_owner = batch_relayer_owner
+
+        self._lock = threading.RLock()
+        self._start = time.monotonic()
+        self._tasks: list[list] = []
+        self._sent_txs: dict[bytes, tuple[float, str, bytes, int]] = {}
+        self._mined: dict[bytes, int] = {}
+        self._block_details: dict[int, tuple] = {}
+        self.transactions = 0
+        self.block_relays = 0
+        self.calldata_bytes = 0
+        self.gas_used = 0
+        self._account_nonces: dict[str, int] = {}
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def task_count(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def add_task(self) -> int:
+        with self._lock:
+            nonce = len(self._tasks)
+            seed = hashlib.sha256(nonce.to_bytes(8, "big")).digest()
+            self._tasks.append([False, int(time.time()), self.caller, 10**15, seed, bytes(32), b""])
+        self.timeline.register_seed(nonce, seed)
+        self.timeline.mark(nonce, "created")
+        return nonce
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                payload = [fake.handle(req) for req in body] if isinstance(body, list) else fake.handle(body)
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the worker was stopped while waiting for a response
+                    pass
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def handle(self, request: dict) -> dict:
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            self.faults.apply_sync()
+            response["result"] = self._dispatch(request["method"], request.get("params", []))
+        except InjectedFailure as e:
+            response["error"] = {"code": -32603, "message": str(e)}
+        except Exception as e:
+            response["error"] = {"code": 3, "message": f"execution reverted: {e}"}
+        return response
+
+    def _block_number(self) -> int:
+        return int((time.monotonic() - self._start) / self.block_time)
+
+    def _dispatch(self, method: str, params: list):
+        match method:
+            case "web3_clientVersion":
+                return "FakeEvm/v0"
+            case "eth_chainId":
+                return hex(self.chain_id)
+            case "eth_blockNumber":
+                return hex(self._block_number())
+            case "eth_getBlockByNumber":
+                return self._block(self._block_number())
+            case "eth_gasPrice" | "eth_maxPriorityFeePerGas":
+                return hex(10**9)
+            case "eth_getTransactionCount":
+                with self._lock:
+                    return hex(self._account_nonces.get(params[0].lower(), 0))
+            case "eth_call":
+                data = bytes.fromhex(params[0]["data"][2:])
+                if data[:4] == AGGREGATE3:
+                    return "0x" + self._aggregate3(data).hex()
+                return "0x" + self._call(data).hex()
+            case "eth_estimateGas":
+                return hex(self._estimate_gas(bytes.fromhex(params[0]["data"][2:])))
+            case "eth_sendRawTransaction":
+                return self._send_raw_transaction(bytes.fromhex(params[0][2:]))
+            case "eth_getTransactionReceipt":
+                return self._receipt(bytes.fromhex(params[0][2:]))
+        raise Exception(f"method {method} is not supported")
+
+    def _call(self, data: bytes) -> bytes:
+        selector, args = data[:4], data[4:]
+        with self._lock:
+            if selector == TASK_NONCE:
+                return encode(["uint64"], [len(self._tasks)])
+            if selector == ORACLE_SCRIPT_ID:
+                return encode(["uint64"], [self.oracle_script_id])
+            if selector == GET_TASKS_BULK:
+                (nonces,) = decode(["uint64[]"], args)
+                return encode([f"{TASK_TYPE}[]"], [[tuple(self._tasks[nonce]) for nonce in nonces]])
+            if selector == ENCODED_CHAIN_ID:
+                return encode(["bytes"], [self.encoded_band_chain_id])
+            if selector == GET_ALL_VALIDATOR_POWERS:
+                return encode(["(address,uint256)[]"], [list(self.validator_power.items())])
+            if selector == OWNER and self.batch_relayer_owner is not None:
+                return encode(["address"], [self.batch_relayer_owner])
+            if selector == BLOCK_DETAILS:
+                (height,) = decode(["uint256"], args)
+                detail = self._block_details.get(height, (bytes(32), 0, 0))
+                return encode(["bytes32", "uint64", "uint32"], list(detail))
+        raise Exception("unknown function selector")
+
+    def _relayed_nonces(self, data: bytes) -> list[int]:
+        """Returns the task nonces a relay transaction relays, checking each of them as the contracts would."""
+        selector = data[:4]
+        if selector == RELAY_BLOCK:
+            return []
+        if selector == RELAY_PROOF:
+            (proof, nonce) = decode(["bytes", "uint64"], data[4:])
+            (relay_data, _) = decode(["bytes", "bytes"], proof)
+            (height, detail, signatures) = self._block_of(relay_data)
+            with self._lock:
+                if self._tasks[nonce][0]:
+                    raise Exception("task already resolved")
+                if not signatures and self._block_details.get(height) != detail:
+                    raise Exception("block not relayed")
+            return [nonce]
+        if selector == AGGREGATE3:
+            (calls,) = decode([CALL3_TYPE], data[4:])
+            nonces = []
+            for _, allow_failure, call_data in calls:
+                try:
+                    nonces.extend(self._relayed_nonces(call_data))
+                except Exception:
+                    if not allow_failure:
+                        raise
+            return nonces
+        raise Exception("unknown function selector")
+
+    def _aggregate3(self, data: bytes) -> bytes:
+        (calls,) = decode([CALL3_TYPE], data[4:])
+        results = []
+        for _, allow_failure, call_data in calls:
+            try:
+                self._relayed_nonces(call_data)
+                results.append((True, b""))
+            except Exception as e:
+                if not allow_failure:
+                    raise
+                results.append((False, str(e).encode()))
+        return encode(["(bool,bytes)[]"], [results])
+
+    def _estimate_gas(self, data: bytes) -> int:
+        nonces = self._relayed_nonces(data)
+        if data[:4] == AGGREGATE3:
+            return 21_000 + 279_000 * len(nonces)
+        return 300_000
+
+    @staticmethod
+    def _block_of(relay_data: bytes) -> tuple[int, tuple, list]:
+        (multi_store, merkle_parts, _, signatures) = decode(RELAY_DATA_TYPES, relay_data)
+        return merkle_parts[1], (multi_store[0], merkle_parts[2], merkle_parts[3]), signatures
+
+    def _send_raw_transaction(self, raw_tx: bytes) -> str:
+        sender = Account.recover_transaction(HexBytes(raw_tx)).lower()
+        if raw_tx[0] <= 0x7F:
+            tx = TypedTransaction.from_bytes(HexBytes(raw_tx)).as_dict()
+            data, account_nonce = bytes(tx["data"]), tx["nonce"]
+        else:
+            fields = rlp.decode(raw_tx)
+            data, account_nonce = fields[5], int.from_bytes(fields[0], "big")
+
+        with self._lock:
+            if account_nonce != self._account_nonces.get(sender, 0):
+                raise Exception("nonce too low")
+            self._account_nonces[sender] = account_nonce + 1
+
+        gas = self._estimate_gas(data)
+        tx_hash = keccak(raw_tx)
+        with self._lock:
+            self._sent_txs[tx_hash] = (time.monotonic(), sender, data, gas)
+            self.calldata_bytes += len(data)
+        for task_nonce in self._relayed_nonces(data):
+            self.timeline.mark(task_nonce, "relay_sent")
+        return "0x" + tx_hash.hex()
+
+    def _execute(self, data: bytes) -> tuple[int, list[int]]:
+        """Applies a mined relay transaction and returns its status and the task nonces it resolved."""
+        with self._lock:
+            try:
+                nonces = self._relayed_nonces(data)
+            except Exception:
+                return 0, []
+
+            if data[:4] == RELAY_BLOCK:
+                (height, detail, _) = self._block_of(data[4:])
+                if self._block_details.get(height) != detail:
+                    self._block_details[height] = detail
+                    self.block_relays += 1
+            for task_nonce in nonces:
+                self._tasks[task_nonce][0] = True
+        return 1, nonces
+
+    def _receipt(self, tx_hash: bytes) -> dict | None:
+        with self._lock:
+            if tx_hash not in self._sent_txs:
+                return None
+            sent_at, sender, data, gas = self._sent_txs[tx_hash]
+            if time.monotonic() - sent_at < self.block_time:
+                return None
+            status = self._mined.get(tx_hash)
+
+        if status is None:
+            (status, nonces) = self._execute(data)
+            with self._lock:
+                self._mined[tx_hash] = status
+                self.transactions += 1
+                self.gas_used += gas
+            for task_nonce in nonces:
+                self.timeline.mark(task_nonce, "relay_confirmed")
+
+        block_number = self._block_number()
+        return {
+            "transactionHash": "0x" + tx_hash.hex(),
+            "transactionIndex": "0x0",
+            "blockHash": "0x" + keccak(block_number.to_bytes(32, "big")).hex(),
+            "blockNumber": hex(block_number),
+            "from": sender,
+            "to": None,
+            "cumulativeGasUsed": hex(gas),
+            "gasUsed": hex(gas),
+            "effectiveGasPrice": hex(10**9),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": hex(status),
+            "type": "0x2",
+        }
+
+    def _block(self, number: int) -> dict:
+        return {
+            "number": hex(number),
+            "hash": "0x" + keccak(number.to_bytes(32, "big")).hex(),
+            "parentHash": "0x" + keccak((number - 1).to_bytes(32, "big", signed=True)).hex(),
+            "nonce": "0x0000000000000000",
+            "sha3Uncles": "0x" + "00" * 32,
+            "logsBloom": "0x" + "00" * 256,
+            "transactionsRoot": "0x" + "00" * 32,
+            "stateRoot": "0x" + "00" * 32,
+            "receiptsRoot": "0x" + "00" * 32,
+            "miner": "0x" + "00" * 20,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x",
+            "size": "0x0",
+            "gasLimit": hex(30_000_000),
+            "gasUsed": "0x0",
+            "timestamp": hex(int(time.time())),
+            "baseFeePerGas": hex(10**9),
+            "transactions": [],
+            "uncles": [],
+        }
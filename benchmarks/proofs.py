@@ -0,0 +1,69 @@
+import hashlib
+
+from eth_abi import decode, encode
+from eth_keys import keys
+
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+
+
+def build_proof(
+    template_proof: bytes,
+    block_hash: bytes,
+    encoded_band_chain_id: bytes,
+    validator_count: int,
+) -> tuple[bytes, dict[str, int]]:
+    """Builds a synthetic EVM proof signed by `validator_count` deterministic validators.
+
+    The multistore, merkle parts, common encoded vote part and verify data are taken from the template proof, so
+    only the signature set changes with the validator count.
+
+    Args:
+        template_proof (bytes): An existing EVM proof to take the non-signature parts from.
+        block_hash (bytes): The block hash the template proof was generated for.
+        encoded_band_chain_id (bytes): The encoded BandChain ID.
+        validator_count (int): The number of validators to sign the block.
+
+    Returns:
+        tuple: (evm_proof_bytes, validator_power)
+    """
+    relay_data, verify_data = decode(("bytes", "bytes"), template_proof)
+    multi_store, merkle_parts, cevp, _ = decode(RELAY_DATA_TYPES, relay_data)
+    common = cevp[0] + block_hash + cevp[1]
+
+    signed = []
+    for i in range(validator_count):
+        private_key = keys.PrivateKey(hashlib.sha256(f"validator-{i}".encode()).digest())
+        address = private_key.public_key.to_address().lower()
+
+        # protobuf encoded timestamp, the nanosecond varint varies in length like it does on BandChain
+        nanos = 1_000_000 + i * (1 << 21 if i % 2 else 7)
+        encoded_timestamp = bytes.fromhex("08cfe493bf0610") + _encode_varint(nanos)
+        msg = common + bytes([42, len(encoded_timestamp)]) + encoded_timestamp + encoded_band_chain_id
+        msg_hash = hashlib.sha256(bytes([len(msg)]) + msg).digest()
+        signature = private_key.sign_msg_hash(msg_hash)
+
+        power = 1_000_000 + (i * 7919) % 100_000
+        signed.append(
+            (
+                address,
+                power,
+                (signature.r.to_bytes(32, "big"), signature.s.to_bytes(32, "big"), signature.v + 27, encoded_timestamp),
+            )
+        )
+
+    # the bridge requires signatures to be sorted by signer address
+    signed.sort(key=lambda item: int(item[0], 16))
+    sigs = [sig for _, _, sig in signed]
+    validator_power = {address: power for address, power, _ in signed}
+
+    synthetic_relay_data = encode(RELAY_DATA_TYPES, (multi_store, merkle_parts, cevp, sigs))
+    return encode(("bytes", "bytes"), (synthetic_relay_data, verify_data)), validator_power
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
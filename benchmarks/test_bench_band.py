@@ -0,0 +1,78 @@
+import pytest
+from pyband.messages.band.oracle.v1 import MsgRequestData
+from pyband.proto.cosmos.base.v1beta1 import Coin
+from pyband.transaction import Transaction
+from pyband.wallet import Wallet
+
+from vrf_worker.band.client import VRF_OBI
+from vrf_worker.band.tx import CLIENT_ID, RequestTxBuilder, encode_vrf_calldata
+from vrf_worker.band.types import TxParams
+from vrf_worker.band.utils import find_request_id
+
+SEED = bytes.fromhex("61c602247721b14eac135379ed5e43d73d499101fd15fda55006633b339b78ee")
+WORKER_ADDRESS = bytes.fromhex("ff1514e5a4e71702e4390cd160c33f30b529f881")
+TX_PARAMS = TxParams(
+    min_count=2,
+    ask_count=3,
+    prepare_gas=100000,
+    execute_gas=400000,
+    ds_fee_limit=1000000,
+    gas_limit=800000,
+    gas_price=0.0025,
+)
+
+
+@pytest.fixture(scope="module")
+def wallet() -> Wallet:
+    return Wallet.from_mnemonic("test test test test test test test test test test test junk")
+
+
+def test_vrf_obi_encode(run_benchmark):
+    params = {"seed": list(SEED), "time": 1665454656, "worker_address": list(WORKER_ADDRESS)}
+    run_benchmark(VRF_OBI.encode, params)
+
+
+def test_encode_vrf_calldata(run_benchmark):
+    run_benchmark(encode_vrf_calldata, SEED, 1665454656, WORKER_ADDRESS)
+
+
+def test_sign_and_build_request_tx(run_benchmark, wallet):
+    address = wallet.get_address().to_acc_bech32()
+
+    def build() -> bytes:
+        calldata = VRF_OBI.encode({"seed": list(SEED), "time": 1665454656, "worker_address": list(WORKER_ADDRESS)})
+        msg = MsgRequestData(
+            oracle_script_id=152,
+            calldata=calldata,
+            ask_count=TX_PARAMS.ask_count,
+            min_count=TX_PARAMS.min_count,
+            client_id=CLIENT_ID,
+            prepare_gas=TX_PARAMS.prepare_gas,
+            execute_gas=TX_PARAMS.execute_gas,
+            sender=address,
+            fee_limit=[Coin(amount=str(TX_PARAMS.ds_fee_limit), denom="uband")],
+        )
+        tx = Transaction(
+            msgs=[msg],
+            account_num=42,
+            sequence=1000,
+            chain_id="band-v3-testnet",
+            gas_price=TX_PARAMS.gas_price,
+            gas_limit=TX_PARAMS.gas_limit,
+        )
+        return wallet.sign_and_build(tx)
+
+    run_benchmark(build)
+
+
+def test_request_tx_builder(run_benchmark, wallet):
+    builder = RequestTxBuilder(wallet, 152, TX_PARAMS, "band-v3-testnet", 42)
+
+    def build() -> bytes:
+        return builder.build(encode_vrf_calldata(SEED, 1665454656, WORKER_ADDRESS), 1000)
+
+    run_benchmark(build)
+
+
+def test_find_request_id(run_benchmark, mock_request_resp_fixture):
+    run_benchmark(find_request_id, mock_request_resp_fixture)
@@ -0,0 +1,43 @@
+import pytest
+from eth_abi import decode, encode
+
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+from vrf_worker.consumer.evm.utils import _recover_address, _recover_addresses, trim_proof, verify_proof
+
+
+@pytest.fixture
+def relay_case(proof_case) -> tuple[bytes, tuple, bytes, bytes]:
+    """Returns (relay_data, decoded_relay_data, common, encoded_band_chain_id) for each validator set size."""
+    evm_proof_bytes, block_hash, encoded_band_chain_id, _ = proof_case
+    relay_data, _ = decode(("bytes", "bytes"), evm_proof_bytes)
+    decoded = decode(RELAY_DATA_TYPES, relay_data)
+    cevp = decoded[2]
+    return relay_data, decoded, cevp[0] + block_hash + cevp[1], encoded_band_chain_id
+
+
+def test_trim_proof(run_benchmark, proof_case):
+    run_benchmark(trim_proof, *proof_case)
+
+
+def test_verify_proof(run_benchmark, proof_case):
+    run_benchmark(verify_proof, trim_proof(*proof_case), *proof_case[1:])
+
+
+def test_recover_address(run_benchmark, relay_case):
+    _, (_, _, _, sigs), common, encoded_band_chain_id = relay_case
+    run_benchmark(_recover_address, sigs[0], common, encoded_band_chain_id)
+
+
+def test_recover_addresses(run_benchmark, relay_case):
+    _, (_, _, _, sigs), common, encoded_band_chain_id = relay_case
+    run_benchmark(_recover_addresses, sigs, common, encoded_band_chain_id)
+
+
+def test_decode_relay_data(run_benchmark, relay_case):
+    relay_data, _, _, _ = relay_case
+    run_benchmark(decode, RELAY_DATA_TYPES, relay_data)
+
+
+def test_encode_relay_data(run_benchmark, relay_case):
+    _, decoded, _, _ = relay_case
+    run_benchmark(encode, RELAY_DATA_TYPES, decoded)
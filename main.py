@@ -1,42 +1,100 @@
-import asyncio
 import argparse
-import sys
+import asyncio
+import atexit
 import os
+import signal
+import sys
 
-from eth_account import Account
-from eth_account.account import LocalAccount
-from logbook import StreamHandler
 from omegaconf import OmegaConf
-from pyband.wallet import Wallet
 
-from vrf_worker.band.client import Client as BandClient
-from vrf_worker.band.types import TxParams
-from vrf_worker.consumer.evm.client import Client as EvmClient
-from vrf_worker.consumer.evm.worker import Worker
+from vrf_worker.config import Config
+from vrf_worker.logs import setup_logging
+from vrf_worker.startup import StartupProfile
 
 
 async def main():
+    profile = StartupProfile()
+
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="VRF Worker")
     parser.add_argument(
         "--config", type=str, default="config.yaml", help="Path to the config file (default: config.yaml)"
     )
+    parser.add_argument("--startup-profile", action="store_true", help="Log the duration of each startup step")
+    parser.add_argument("--record", type=str, help="Record the chain client calls of the run to this file")
+    parser.add_argument(
+        "--replay",
+        type=str,
+        help="Serve the chain client calls from a file made with --record (gzipped JSON, only plain values are loaded)",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Speed of the replayed calls relative to the recording, 0 for no delay (default: 1)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill", help="Process the unresolved tasks in a range of nonces")
+    backfill_parser.add_argument("--from", dest="start", type=int, required=True, help="First nonce of the range")
+    backfill_parser.add_argument("--to", dest="end", type=int, required=True, help="Last nonce of the range")
+    backfill_parser.add_argument(
+        "--state",
+        type=str,
+        help="File to save progress to and resume from (default: backfill-<from>-<to>.json)",
+    )
+    backfill_parser.add_argument("--concurrency", type=int, help="Tasks to process at once (default: from config)")
+    backfill_parser.add_argument("--chunk-size", type=int, help="Nonces to read at once (default: from config)")
     args = parser.parse_args()
+    if args.record and args.replay:
+        print("--record and --replay cannot be used together")
+        sys.exit(1)
+    profile.enabled = args.startup_profile
 
     # Load configuration
     try:
-        config = OmegaConf.load(args.config)
+        config = OmegaConf.merge(OmegaConf.structured(Config), OmegaConf.load(args.config))
     except FileNotFoundError:
         print(f"{args.config} not found")
         sys.exit(1)
 
-    StreamHandler(sys.stdout).push_application()
+    try:
+        log_handler = setup_logging(config.worker_config)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+    log_handler.push_application()
+    # the queued lines are written out however the process exits
+    atexit.register(log_handler.close)
+
+    # the web3 and pyband module trees take most of the startup time, so only load them once the config is valid
+    with profile.step("import clients"):
+        from eth_account import Account
+        from eth_account.account import LocalAccount
+        from pyband.wallet import Wallet
+
+        from vrf_worker.band.cache import BlockHashCache
+        from vrf_worker.band.client import Client as BandClient
+        from vrf_worker.band.types import TxParams
+        from vrf_worker.consumer.evm.client import Client as EvmClient
+        from vrf_worker.consumer.evm.worker import Worker
 
     # initialize band
-    band_client = BandClient(config.band_chain_config.grpc_endpoint)
+    band_client = BandClient(
+        config.band_chain_config.grpc_endpoint,
+        config.band_chain_config.grpc_ssl,
+        rate_limit=config.band_chain_config.grpc_rate_limit,
+        rate_burst=config.band_chain_config.grpc_rate_burst,
+        gas_adjustment=config.band_chain_config.gas_adjustment,
+        gas_estimate_ttl=config.band_chain_config.gas_estimate_ttl,
+        max_gas_limit=config.band_chain_config.max_gas_limit,
+        block_hash_cache=BlockHashCache(
+            config.band_chain_config.block_hash_cache_size,
+            config.band_chain_config.block_hash_cache_path,
+            config.band_chain_config.block_hash_cache_persistent_size,
+        ),
+    )
     # Get Band mnemonic from env or config file
     band_mnemonic = os.environ.get("BAND_MNEMONIC") or config.band_chain_config.mnemonic
-    band_wallet = Wallet.from_mnemonic(band_mnemonic)
 
     # Get EVM private key from env or config file
     evm_private_key = os.environ.get("EVM_PRIVATE_KEY") or config.evm_chain_config.private_key
@@ -45,9 +103,37 @@ async def main():
         config.evm_chain_config.vrf_provider_address,
         config.evm_chain_config.vrf_lens_address,
         config.evm_chain_config.bridge_address,
+        check_connection=False,
+        batch_relayer_address=config.evm_chain_config.batch_relayer_address,
+        target_inclusion_time=config.evm_chain_config.target_inclusion_time,
+        fee_bump_percent=config.evm_chain_config.fee_bump_percent,
+        max_fee_per_gas=config.evm_chain_config.max_fee_per_gas,
+        rate_limit=config.evm_chain_config.rpc_rate_limit,
+        rate_burst=config.evm_chain_config.rpc_rate_burst,
     )
     evm_account: LocalAccount = Account.from_key(evm_private_key)
 
+    # the optional features are only imported when they are used
+    recording = None
+    if args.record:
+        from vrf_worker.recording import Recording, RecordingClient
+
+        recording = Recording()
+        band_client = RecordingClient(band_client, "band", recording)
+        evm_client = RecordingClient(evm_client, "evm", recording)
+    elif args.replay:
+        from vrf_worker.recording import Recording, ReplayClient
+
+        replay = Recording.load(args.replay)
+        band_client = ReplayClient(replay, "band", args.replay_speed)
+        evm_client = ReplayClient(replay, "evm", args.replay_speed)
+
+    # derive the band wallet while checking the rpc endpoint
+    (band_wallet, _) = await asyncio.gather(
+        profile.run("derive band wallet", Wallet.from_mnemonic, band_mnemonic),
+        profile.run("connect to evm rpc", evm_client.check_connection),
+    )
+
     # initialize worker
     band_tx_params = TxParams(
         prepare_gas=config.band_chain_config.prepare_gas,
@@ -59,6 +145,31 @@ async def main():
         gas_price=config.band_chain_config.gas_price,
     )
 
+    count_controller = None
+    if config.band_chain_config.target_resolve_time > 0:
+        from vrf_worker.band.counts import CountController
+
+        count_controller = CountController(
+            band_tx_params.ask_count,
+            band_tx_params.min_count,
+            tuple(config.band_chain_config.ask_count_bounds),
+            tuple(config.band_chain_config.min_count_bounds),
+            config.band_chain_config.target_resolve_time,
+            window=config.band_chain_config.count_window,
+            max_failure_rate=config.band_chain_config.max_failure_rate,
+        )
+
+    hedge_policy = None
+    if config.band_chain_config.hedge_fee_budget > 0:
+        from vrf_worker.band.hedging import HedgePolicy
+
+        hedge_policy = HedgePolicy(
+            config.band_chain_config.hedge_fee_budget,
+            percentile=config.band_chain_config.hedge_percentile,
+            min_delay=config.band_chain_config.hedge_min_delay,
+            max_delay=config.band_chain_config.hedge_max_delay,
+        )
+
     worker = Worker(
         evm_client=evm_client,
         band_client=band_client,
@@ -66,9 +177,37 @@ async def main():
         band_wallet=band_wallet,
         band_tx_params=band_tx_params,
         evm_config=config.evm_chain_config,
+        worker_config=config.worker_config,
+        startup_profile=profile,
+        count_controller=count_controller,
+        hedge_policy=hedge_policy,
     )
 
-    await worker.start()
+    if args.command == "backfill":
+        from vrf_worker.consumer.evm.backfill import Backfill
+
+        run = Backfill(
+            worker,
+            args.start,
+            args.end,
+            args.state or f"backfill-{args.start}-{args.end}.json",
+            chunk_size=args.chunk_size or config.worker_config.backfill_chunk_size,
+            concurrency=args.concurrency or config.worker_config.backfill_concurrency,
+        ).run()
+    else:
+        run = worker.start()
+
+    if recording is None and args.command is None:
+        await run
+        return
+
+    # save the recording and the backfill progress however the worker stops, SIGTERM included
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await run
+    finally:
+        if recording is not None:
+            recording.save(args.record)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from pyband.wallet import Wallet
+
+from vrf_worker.band.types import TxParams
+from vrf_worker.consumer.evm.backfill import Backfill, load_backfill_state
+from vrf_worker.types import TaskRecord
+
+from .test_band_client import StubBandNode, make_band_client
+from .test_worker import CALLER, make_worker
+
+
+class StubEvmClient:
+    def __init__(self, resolved: set[int], foreign: set[int]) -> None:
+        self.resolved = resolved
+        self.foreign = foreign
+        self.reads: list[list[int]] = []
+
+    def get_task_records_by_nonces(self, nonces: list[int]) -> list[tuple[bool, TaskRecord]]:
+        self.reads.append(nonces)
+        return [
+            (nonce in self.resolved, TaskRecord(nonce, bytes(32), 0, "0xother" if nonce in self.foreign else CALLER, 0))
+            for nonce in nonces
+        ]
+
+
+def run_backfill(
+    monkeypatch: pytest.MonkeyPatch,
+    client: StubEvmClient,
+    failing: set[int],
+    state_path: str,
+    raising: set[int] = frozenset(),
+):
+    worker = make_worker(client)
+    processed = []
+    in_flight = 0
+    max_in_flight = 0
+
+    async def bootstrap() -> int:
+        return 0
+
+    async def process_task(record, oracle_script_id, encoded_band_chain_id) -> bool:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        processed.append(record.nonce)
+        if record.nonce in raising:
+            raise Exception("unexpected error")
+        return record.nonce not in failing
+
+    monkeypatch.setattr(worker, "bootstrap", bootstrap)
+    monkeypatch.setattr(worker, "process_task", process_task)
+
+    backfill = Backfill(worker, 10, 29, state_path, chunk_size=8, concurrency=4)
+    state = asyncio.run(backfill.run())
+    return state, processed, max_in_flight
+
+
+def test_backfill(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    state_path = str(tmp_path / "backfill.json")
+    client = StubEvmClient(resolved={11, 12}, foreign={13})
+
+    (state, processed, max_in_flight) = run_backfill(monkeypatch, client, {20}, state_path)
+    assert client.reads == [list(range(10, 18)), list(range(18, 26)), list(range(26, 30))]
+    assert (state.relayed, state.resolved, state.not_whitelisted, state.failed) == (16, 2, 1, [20])
+    assert sorted(processed) == sorted([n for n in range(10, 30) if n not in (11, 12, 13)] + [20] * 2)
+    assert max_in_flight == 4
+    assert state.next_nonce == 30
+    assert load_backfill_state(state_path, 10, 29) == state
+
+    # resuming only retries the failed nonce
+    client.reads.clear()
+    (state, processed, _) = run_backfill(monkeypatch, client, set(), state_path)
+    assert client.reads == [[20]]
+    assert processed == [20]
+    assert (state.relayed, state.failed) == (17, [])
+
+
+def test_backfill_counts_errors_as_failures(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    client = StubEvmClient(resolved=set(), foreign=set())
+    (state, processed, _) = run_backfill(monkeypatch, client, set(), str(tmp_path / "backfill.json"), raising={15})
+    assert (state.relayed, state.failed) == (19, [15])
+    assert processed.count(15) == 1
+    assert state.next_nonce == 30
+
+
+def test_backfill_state_of_another_range(tmp_path):
+    state_path = str(tmp_path / "backfill.json")
+    assert load_backfill_state(state_path, 1, 5).next_nonce == 1
+    with open(state_path, "w") as f:
+        f.write('{"start": 0, "end": 5, "next_nonce": 3}')
+    assert load_backfill_state(state_path, 0, 5).next_nonce == 3
+    assert load_backfill_state(state_path, 1, 5).next_nonce == 1
+
+
+def test_concurrent_backfill_requests_use_the_next_sequences(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    wallet = Wallet.from_mnemonic("test test test test test test test test test test test junk")
+    tx_params = TxParams(2, 3, 100000, 400000, 1000000, 800000, 0.0025)
+    node = StubBandNode()
+    worker = make_worker(StubEvmClient(resolved=set(), foreign=set()))
+
+    async def bootstrap() -> int:
+        return 0
+
+    async def process_task(record, oracle_script_id, encoded_band_chain_id) -> bool:
+        tx_resp = await worker.band_client.request_vrf(
+            oracle_script_id, CALLER, record.seed, record.time, tx_params, wallet
+        )
+        return tx_resp.code == 0
+
+    monkeypatch.setattr(worker, "bootstrap", bootstrap)
+    monkeypatch.setattr(worker, "process_task", process_task)
+
+    async def run():
+        worker.band_client = make_band_client(node)
+
+        # queries only see the sequence of the last block, while the backfill sends many requests within each
+        async def produce_blocks():
+            while True:
+                await asyncio.sleep(0.01)
+                node.commit()
+
+        blocks = asyncio.create_task(produce_blocks())
+        try:
+            return await Backfill(worker, 0, 39, str(tmp_path / "backfill.json"), chunk_size=16, concurrency=8).run()
+        finally:
+            blocks.cancel()
+
+    state = asyncio.run(run())
+    assert (state.relayed, state.failed) == (40, [])
+    assert node.sent == list(range(40))
@@ -0,0 +1,55 @@
+import asyncio
+
+from vrf_worker.band.cache import BlockHashCache
+from vrf_worker.metrics import Metrics
+
+
+def test_block_hash_cache_memory():
+    async def run():
+        cache = BlockHashCache(size=2, metrics=Metrics())
+        await cache.put("band", 100, b"one")
+        await cache.put("band", 101, b"two")
+        assert await cache.get("band", 100) == b"one"
+        # the least recently used hash is dropped
+        await cache.put("band", 102, b"three")
+        assert await cache.get("band", 101) is None
+        assert await cache.get("band", 100) == b"one"
+        # blocks of another chain at the same height are kept apart
+        assert await cache.get("other", 100) is None
+        return cache.metrics
+
+    metrics = asyncio.run(run())
+    assert metrics.get("vrf_worker_band_cache_requests_total", result="miss") == 2
+    assert metrics.get("vrf_worker_band_cache_requests_total", result="memory") == 2
+
+
+def test_block_hash_cache_shared_database(tmp_path):
+    path = str(tmp_path / "blocks.db")
+
+    async def run():
+        worker = BlockHashCache(path=path, persistent_size=150, metrics=Metrics())
+        sibling = BlockHashCache(path=path, metrics=Metrics())
+
+        await worker.put("band", 100, b"hash")
+        assert await sibling.get("band", 100) == b"hash"
+        assert await sibling.get("other", 100) is None
+        assert sibling.metrics.get("vrf_worker_band_cache_requests_total", result="disk") == 1
+        # found in memory from then on
+        await sibling.get("band", 100)
+        assert sibling.metrics.get("vrf_worker_band_cache_requests_total", result="memory") == 1
+
+        # the database keeps the last persistent_size hashes
+        for height in range(101, 301):
+            await worker.put("band", height, b"hash")
+        restarted = BlockHashCache(path=path, metrics=Metrics())
+        assert await restarted.get("band", 100) is None
+        assert await restarted.get("band", 300) == b"hash"
+
+        # a hash fetched again replaces the one stored
+        await worker.put("band", 300, b"refetched")
+        refreshed = BlockHashCache(path=path, metrics=Metrics())
+        assert await refreshed.get("band", 300) == b"refetched"
+        for cache in (worker, sibling, restarted, refreshed):
+            cache.close()
+
+    asyncio.run(run())
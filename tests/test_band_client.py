@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+from pyband.proto.cosmos.base.abci.v1beta1 import TxResponse
+from pyband.proto.cosmos.tx.v1beta1 import AuthInfo, TxRaw
+from pyband.wallet import Wallet
+
+from vrf_worker.band.cache import BlockHashCache
+from vrf_worker.band.client import Client, GasEstimator
+from vrf_worker.band.types import TxParams
+from vrf_worker.metrics import Metrics
+
+
+def test_gas_estimator():
+    estimator = GasEstimator(adjustment=1.25, ttl=600, max_gas_limit=500_000, retry_interval=60, metrics=Metrics())
+    simulations = []
+
+    async def simulate(gas_used):
+        simulations.append(gas_used)
+        if isinstance(gas_used, Exception):
+            raise gas_used
+        return gas_used
+
+    def age(seconds):
+        for key, (gas_limit, expiry) in estimator._estimates.items():
+            estimator._estimates[key] = (gas_limit, expiry - seconds)
+
+    def estimate(key, gas_used):
+        return asyncio.run(estimator.estimate(key, 800_000, lambda: simulate(gas_used)))
+
+    assert estimate("one", 170_000) == 212_500
+    # cached by key until it expires or is invalidated
+    assert estimate("one", 999_999) == 212_500
+    assert estimate("two", 280_000) == 350_000
+    age(600)
+    assert estimate("one", 180_000) == 225_000
+    estimator.invalidate("one")
+    assert estimate("one", 900_000) == 500_000
+    assert simulations == [170_000, 280_000, 180_000, 900_000]
+
+    # a failed simulation falls back to the fixed limit and is retried sooner
+    assert estimate("three", Exception("unavailable")) == 800_000
+    age(59)
+    assert estimate("three", 100_000) == 800_000
+    age(1.5)
+    assert estimate("three", 100_000) == 125_000
+    assert estimator.metrics.get("vrf_worker_band_gas_simulations_total", result="failed") == 1
+
+
+def test_cached_block_hash_is_not_fetched():
+    async def get_block_hash():
+        cache = BlockHashCache(metrics=Metrics())
+        await cache.put("band-test", 100, b"hash")
+        # nothing listens on the endpoint, so any query would fail
+        client = Client("localhost:1", ssl=False, block_hash_cache=cache)
+        client.chain_id = "band-test"
+        return await client._get_block_hash(100)
+
+    assert asyncio.run(get_block_hash()) == b"hash"
+
+
+class StubBandNode:
+    """Accepts transactions with the next sequence of the mempool, while queries only see committed blocks."""
+
+    def __init__(self) -> None:
+        self.committed_sequence = 0
+        self.mempool_sequence = 0
+        self.sent: list[int] = []
+
+    def commit(self) -> None:
+        self.committed_sequence = self.mempool_sequence
+
+    async def get_account(self, address: str) -> SimpleNamespace:
+        return SimpleNamespace(account_number=1, sequence=self.committed_sequence)
+
+    async def get_chain_id(self) -> str:
+        return "band-test"
+
+    async def send_tx_sync_mode(self, payload: bytes) -> TxResponse:
+        sequence = AuthInfo().parse(TxRaw().parse(payload).auth_info_bytes).signer_infos[0].sequence
+        if sequence != self.mempool_sequence:
+            return TxResponse(
+                code=32, raw_log=f"account sequence mismatch, expected {self.mempool_sequence}, got {sequence}"
+            )
+        self.mempool_sequence += 1
+        self.sent.append(sequence)
+        return TxResponse(code=0, txhash=f"tx{sequence}")
+
+
+def make_band_client(node: StubBandNode) -> Client:
+    client = Client("localhost:1", ssl=False, gas_adjustment=0)
+    client.client = node
+    return client
+
+
+def test_requests_before_a_block_use_the_next_sequences():
+    wallet = Wallet.from_mnemonic("test test test test test test test test test test test junk")
+    tx_params = TxParams(2, 3, 100000, 400000, 1000000, 800000, 0.0025)
+    node = StubBandNode()
+
+    async def run():
+        client = make_band_client(node)
+
+        async def request(seed: int) -> TxResponse:
+            return await client.request_vrf(1, "0x" + "00" * 20, bytes([seed]) * 32, 0, tx_params, wallet)
+
+        # two requests go out before a block commits, then another after it
+        first = await asyncio.gather(request(1), request(2))
+        node.commit()
+        second = await request(3)
+        # a transaction sent by someone else with the same account is found from the node's answer
+        node.mempool_sequence += 1
+        (rejected, resynced) = (await request(4), await request(5))
+        return [tx.code for tx in [*first, second, rejected, resynced]]
+
+    assert asyncio.run(run()) == [0, 0, 0, 32, 0]
+    assert node.sent == [0, 1, 2, 4]
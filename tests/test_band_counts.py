@@ -0,0 +1,65 @@
+import pytest
+from pyband.proto.band.oracle.v1 import ResolveStatus, Result
+
+from vrf_worker.band.counts import CountController, percentile
+from vrf_worker.band.types import TxParams
+from vrf_worker.metrics import Metrics
+
+
+def make_result(counts: tuple[int, int], latency: int, status: ResolveStatus = ResolveStatus.SUCCESS) -> Result:
+    (ask_count, min_count) = counts
+    return Result(
+        ask_count=ask_count,
+        min_count=min_count,
+        request_time=1000,
+        resolve_time=1000 + latency,
+        resolve_status=status,
+    )
+
+
+def test_percentile():
+    assert percentile([5, 1, 4, 2, 3], 0.95) == 5
+    assert percentile(list(range(1, 101)), 0.95) == 95
+    assert percentile([7], 0.5) == 7
+
+
+def test_count_controller_meets_target_at_lowest_fee():
+    controller = CountController(3, 2, (3, 5), (2, 3), target=10, window=4, metrics=Metrics())
+    assert controller.settings == [(3, 3), (3, 2), (4, 3), (4, 2), (5, 3), (5, 2)]
+    assert controller.counts == (3, 2)
+
+    # too slow: one step faster
+    for _ in range(4):
+        controller.observe(make_result((3, 2), 14))
+    assert controller.counts == (4, 3)
+
+    # requests sent with the previous counts are not counted against the new ones
+    controller.observe(make_result((3, 2), 30))
+    for _ in range(3):
+        controller.observe(make_result((4, 3), 8))
+    assert controller.counts == (4, 3)
+    controller.observe(make_result((4, 3), 9))
+    assert controller.counts == (4, 3)
+
+    # expiries step up even when the resolved requests are fast
+    for status in [ResolveStatus.EXPIRED, ResolveStatus.SUCCESS, ResolveStatus.SUCCESS, ResolveStatus.SUCCESS]:
+        controller.observe(make_result((4, 3), 2, status))
+    assert controller.counts == (4, 2)
+
+    # well under the target: one step cheaper
+    for _ in range(4):
+        controller.observe(make_result((4, 2), 3))
+    assert controller.counts == (4, 3)
+    params = controller.tx_params(TxParams(2, 3, 100000, 400000, 48, 800000, 0.0025))
+    assert (params.ask_count, params.min_count, params.prepare_gas) == (4, 3, 100000)
+
+    assert controller.metrics.get("vrf_worker_band_count_adjustments_total", direction="up") == 2
+    assert controller.metrics.get("vrf_worker_band_count_adjustments_total", direction="down") == 1
+    assert controller.metrics.get("vrf_worker_band_requests_resolved_total", status="expired") == 1
+    assert controller.metrics.get("vrf_worker_band_ask_count") == 4
+
+
+def test_count_controller_bounds():
+    assert CountController(8, 1, (3, 4), (2, 2), target=10, metrics=Metrics()).counts == (4, 2)
+    with pytest.raises(Exception, match="no min count"):
+        CountController(3, 2, (2, 3), (4, 5), target=10, metrics=Metrics())
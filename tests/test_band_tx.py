@@ -0,0 +1,97 @@
+import pytest
+from pyband.messages.band.oracle.v1 import MsgRequestData
+from pyband.proto.cosmos.base.v1beta1 import Coin
+from pyband.transaction import Transaction
+from pyband.wallet import Wallet
+
+from vrf_worker.band.client import VRF_OBI
+from vrf_worker.band.tx import CLIENT_ID, RequestTxBuilder, encode_vrf_calldata
+from vrf_worker.band.types import TxParams
+
+
+@pytest.fixture
+def mock_wallet() -> Wallet:
+    return Wallet.from_mnemonic("test test test test test test test test test test test junk")
+
+
+@pytest.fixture
+def mock_tx_params() -> TxParams:
+    return TxParams(
+        min_count=2,
+        ask_count=3,
+        prepare_gas=100000,
+        execute_gas=400000,
+        ds_fee_limit=1000000,
+        gas_limit=800000,
+        gas_price=0.0025,
+    )
+
+
+def test_encode_vrf_calldata():
+    seed = bytes.fromhex("61c602247721b14eac135379ed5e43d73d499101fd15fda55006633b339b78ee")
+    worker_address = bytes.fromhex("ff1514e5a4e71702e4390cd160c33f30b529f881")
+    expected = VRF_OBI.encode({"seed": list(seed), "time": 1665454656, "worker_address": list(worker_address)})
+
+    assert encode_vrf_calldata(seed, 1665454656, worker_address) == expected
+
+
+@pytest.mark.parametrize("sequence", [0, 1, 300, 2**40])
+def test_request_tx_builder(mock_wallet, mock_tx_params, sequence):
+    calldata = encode_vrf_calldata(bytes(range(32)), 1743057486, bytes(range(20)))
+    address = mock_wallet.get_address().to_acc_bech32()
+
+    msg = MsgRequestData(
+        oracle_script_id=152,
+        calldata=calldata,
+        ask_count=mock_tx_params.ask_count,
+        min_count=mock_tx_params.min_count,
+        client_id=CLIENT_ID,
+        prepare_gas=mock_tx_params.prepare_gas,
+        execute_gas=mock_tx_params.execute_gas,
+        sender=address,
+        fee_limit=[Coin(amount=str(mock_tx_params.ds_fee_limit), denom="uband")],
+    )
+    tx = Transaction(
+        msgs=[msg],
+        account_num=42,
+        sequence=sequence,
+        chain_id="band-v3-testnet",
+        gas_price=mock_tx_params.gas_price,
+        gas_limit=mock_tx_params.gas_limit,
+        memo="",
+    )
+
+    builder = RequestTxBuilder(mock_wallet, 152, mock_tx_params, "band-v3-testnet", 42)
+    assert builder.build(calldata, sequence) == mock_wallet.sign_and_build(tx)
+
+
+def test_request_tx_builder_many(mock_wallet, mock_tx_params):
+    calldatas = [encode_vrf_calldata(bytes([i]) * 32, 1743057486 + i, bytes(range(20))) for i in range(3)]
+    address = mock_wallet.get_address().to_acc_bech32()
+
+    msgs = [
+        MsgRequestData(
+            oracle_script_id=152,
+            calldata=calldata,
+            ask_count=mock_tx_params.ask_count,
+            min_count=mock_tx_params.min_count,
+            client_id=CLIENT_ID,
+            prepare_gas=mock_tx_params.prepare_gas,
+            execute_gas=mock_tx_params.execute_gas,
+            sender=address,
+            fee_limit=[Coin(amount=str(mock_tx_params.ds_fee_limit), denom="uband")],
+        )
+        for calldata in calldatas
+    ]
+    tx = Transaction(
+        msgs=msgs,
+        account_num=42,
+        sequence=7,
+        chain_id="band-v3-testnet",
+        gas_price=mock_tx_params.gas_price,
+        gas_limit=412345,
+        memo="",
+    )
+
+    builder = RequestTxBuilder(mock_wallet, 152, mock_tx_params, "band-v3-testnet", 42)
+    assert builder.build_many(calldatas, 7, 412345) == mock_wallet.sign_and_build(tx)
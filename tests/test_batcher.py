@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from logbook import Logger
+
+from vrf_worker.consumer.evm.batcher import RelayBatcher
+from vrf_worker.metrics import Metrics
+
+
+class StubClient:
+    """Relays every call at once, except for the nonces in `failing`, which revert any batch they are in."""
+
+    def __init__(self, failing: set[int] = frozenset(), simulated_failing: set[int] = frozenset()) -> None:
+        self.failing = failing
+        self.simulated_failing = simulated_failing
+        self.transactions: list[list[int]] = []
+        self.statuses: dict[str, int] = {}
+
+    def encode_relay_proof(self, proof: bytes, nonce: int) -> bytes:
+        return nonce.to_bytes(8, "big") + proof
+
+    def simulate_relay_batch(self, calls, account) -> list[bool]:
+        return [int.from_bytes(call[:8], "big") not in self.simulated_failing for call in calls]
+
+    def relay_batch(self, calls, account, eip1559, gas_cap) -> str:
+        return self._send([int.from_bytes(call[:8], "big") for call in calls])
+
+    def relay_proof(self, proof, nonce, account, eip1559) -> str:
+        return self._send([nonce])
+
+    def get_tx_receipt_status(self, tx_hash: str) -> int:
+        return self.statuses[tx_hash]
+
+    def _send(self, nonces: list[int]) -> str:
+        tx_hash = f"0x{len(self.transactions)}"
+        self.transactions.append(nonces)
+        self.statuses[tx_hash] = 0 if self.failing & set(nonces) else 1
+        return tx_hash
+
+
+def relay_all(client: StubClient, nonces: list[int], max_size: int = 10) -> list[bool]:
+    async def run():
+        batcher = RelayBatcher(client, None, True, 0.01, max_size, 10**7, Logger("test"), Metrics())
+        return await asyncio.gather(*(batcher.relay(nonce, b"proof") for nonce in nonces))
+
+    return asyncio.run(run())
+
+
+def test_relays_ready_proofs_in_one_transaction():
+    client = StubClient()
+    assert relay_all(client, [1, 2, 3]) == [True, True, True]
+    assert client.transactions == [[1, 2, 3]]
+
+
+def test_batches_are_capped_in_size():
+    client = StubClient()
+    assert relay_all(client, [1, 2, 3, 4, 5], max_size=2) == [True] * 5
+    assert client.transactions == [[1, 2], [3, 4], [5]]
+
+
+def test_drops_calls_that_would_fail():
+    client = StubClient(simulated_failing={2})
+    assert relay_all(client, [1, 2, 3]) == [True, False, True]
+    assert client.transactions == [[1, 3]]
+
+
+def test_splits_reverted_batches():
+    client = StubClient(failing={3})
+    assert relay_all(client, [1, 2, 3, 4]) == [True, True, False, True]
+    assert client.transactions == [[1, 2, 3, 4], [1, 2], [3, 4], [3], [4]]
+
+
+def test_relaying_does_not_block_the_loop():
+    class SlowClient(StubClient):
+        def get_tx_receipt_status(self, tx_hash: str) -> int:
+            time.sleep(0.2)
+            return super().get_tx_receipt_status(tx_hash)
+
+    async def run():
+        batcher = RelayBatcher(SlowClient(), None, True, 0.01, 10, 10**7, Logger("test"), Metrics())
+        relay = asyncio.gather(*(batcher.relay(nonce, b"proof") for nonce in [1, 2]))
+        ticks = 0
+        while not relay.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return await relay, ticks
+
+    (results, ticks) = asyncio.run(run())
+    assert results == [True, True]
+    # the loop kept running while the receipt was awaited
+    assert ticks >= 10
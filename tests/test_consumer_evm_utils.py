@@ -1,6 +1,17 @@
 import pytest
+from eth_abi import decode, encode
 
-from vrf_worker.consumer.evm.utils import _recover_address, trim_proof
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+from vrf_worker.consumer.evm.utils import (
+    _recover_address,
+    _select_signatures_by_power,
+    get_block_detail,
+    get_block_relay_data,
+    strip_signatures,
+    trim_and_verify_proof,
+    trim_proof,
+    verify_proof,
+)
 
 
 @pytest.fixture
@@ -87,3 +98,88 @@ def test_recover_address():
     )
     encoded_band_chain_id = bytes.fromhex("321162616e642d76332d746573746e65742d31")
     assert _recover_address(sig, common, encoded_band_chain_id) == "0x0235461ee439f694e1aa58d9d3ab0b36eafa84f9"
+
+
+def _reencoded_trim_proof(evm_proof_bytes, block_hash, encoded_band_chain_id, validator_power) -> bytes:
+    relay_data, verify_data = decode(("bytes", "bytes"), evm_proof_bytes)
+    multi_store, merkle_parts, cevp, sigs = decode(RELAY_DATA_TYPES, relay_data)
+    selected = _select_signatures_by_power(block_hash, cevp, sigs, encoded_band_chain_id, validator_power)
+    minimized_relay_data = encode(
+        RELAY_DATA_TYPES, (multi_store, merkle_parts, cevp, [sigs[c.index] for c in selected])
+    )
+    return encode(("bytes", "bytes"), (minimized_relay_data, verify_data))
+
+
+@pytest.mark.parametrize("powerful_validators", [0, 1, 5, 20])
+def test_trim_proof_matches_reencoding(
+    mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power, powerful_validators
+):
+    # boosting the power of a few validators changes which signatures are kept
+    validator_power = dict(mock_validator_power)
+    for addr in list(validator_power)[-powerful_validators:] if powerful_validators else []:
+        validator_power[addr] *= 10
+
+    args = (mock_evm_proof, mock_block_hash, mock_encoded_chain_id, validator_power)
+    assert trim_proof(*args) == _reencoded_trim_proof(*args)
+
+
+def test_trim_proof_truncated(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power):
+    with pytest.raises(Exception, match="failed to parse proof"):
+        trim_proof(mock_evm_proof[:4000], mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+
+
+def test_block_relay_helpers(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power):
+    proof = trim_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+    relay_data, verify_data = decode(("bytes", "bytes"), proof)
+    multi_store, merkle_parts, cevp, _ = decode(RELAY_DATA_TYPES, relay_data)
+
+    assert get_block_relay_data(proof) == relay_data
+    assert get_block_detail(proof) == (merkle_parts[1], (multi_store[0], merkle_parts[2], merkle_parts[3]))
+
+    stripped_relay_data = encode(RELAY_DATA_TYPES, (multi_store, merkle_parts, cevp, []))
+    assert strip_signatures(proof) == encode(("bytes", "bytes"), (stripped_relay_data, verify_data))
+
+
+def _tampered(evm_proof_bytes, relay_word=None, verify_word=None) -> bytes:
+    relay_data, verify_data = decode(("bytes", "bytes"), evm_proof_bytes)
+    relay_data, verify_data = bytearray(relay_data), bytearray(verify_data)
+    if relay_word is not None:
+        relay_data[relay_word * 32 + 31] ^= 1
+    if verify_word is not None:
+        verify_data[verify_word * 32 + 31] ^= 1
+    return encode(("bytes", "bytes"), (bytes(relay_data), bytes(verify_data)))
+
+
+def test_verify_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power):
+    verify_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+    proof = trim_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+    verify_proof(proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+    assert trim_and_verify_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power) == proof
+
+
+@pytest.mark.parametrize(
+    "relay_word,verify_word,error",
+    [
+        # oracle state, params store hash and block height
+        (0, None, "block header hashes to"),
+        (1, None, "block header hashes to"),
+        (7, None, "block header hashes to"),
+        # block height and request ID of the result
+        (None, 0, "result is proven at height"),
+        (None, 9, "is not in the oracle store"),
+    ],
+)
+def test_verify_proof_tampered(
+    mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power, relay_word, verify_word, error
+):
+    proof = _tampered(mock_evm_proof, relay_word, verify_word)
+    with pytest.raises(Exception, match=error):
+        verify_proof(proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+
+
+def test_verify_proof_insufficient_power(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power):
+    proof = trim_proof(mock_evm_proof, mock_block_hash, mock_encoded_chain_id, mock_validator_power)
+    # a validator joined the set after the signatures were selected
+    validator_power = {**mock_validator_power, "0x" + "11" * 20: 5_000_000}
+    with pytest.raises(Exception, match="not more than 2/3"):
+        verify_proof(proof, mock_block_hash, mock_encoded_chain_id, validator_power)
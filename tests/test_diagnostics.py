@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+from logbook import Logger
+
+from vrf_worker.diagnostics import LoopLagMonitor, SamplingProfiler, timed
+from vrf_worker.metrics import Metrics
+
+
+def test_timed():
+    metrics = Metrics()
+
+    @timed("sync", metrics)
+    def add(a, b):
+        return a + b
+
+    @timed("async", metrics)
+    async def wait():
+        await asyncio.sleep(0.01)
+
+    assert add(1, 2) == 3
+    assert add(2, 3) == 5
+    asyncio.run(wait())
+
+    assert metrics.get("vrf_worker_function_calls_total", function="sync") == 2
+    assert metrics.get("vrf_worker_function_calls_total", function="async") == 1
+    assert metrics.get("vrf_worker_function_seconds_total", function="async") >= 0.01
+
+
+def test_loop_lag_monitor_names_blocking_task():
+    metrics = Metrics()
+
+    async def blocking_stage():
+        time.sleep(0.3)
+
+    async def run():
+        monitor = asyncio.create_task(LoopLagMonitor(Logger("test"), metrics, 0.02, 0.1).run())
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocking_stage())
+        await asyncio.sleep(0.05)
+        monitor.cancel()
+
+    asyncio.run(run())
+    assert (
+        metrics.get(
+            "vrf_worker_loop_stalls_total", task="test_loop_lag_monitor_names_blocking_task.<locals>.blocking_stage"
+        )
+        == 1
+    )
+    assert metrics.get("vrf_worker_loop_lag_max_seconds") >= 0.2
+
+
+def test_sampling_profiler_folds_stacks():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_loop, name="busy")
+    thread.start()
+    try:
+        folded = SamplingProfiler(interval=0.001).profile(0.1)
+    finally:
+        stop.set()
+        thread.join()
+
+    busy = [line for line in folded.splitlines() if line.startswith("busy;")]
+    assert busy
+    assert all("busy_loop (test_diagnostics.py:" in line and line.rsplit(" ", 1)[1].isdigit() for line in busy)
@@ -0,0 +1,85 @@
+import io
+import json
+import threading
+
+from logbook import Handler, Logger, StreamHandler
+
+from vrf_worker.logs import JsonFormatter, LogSampler, QueuedHandler, task_fields
+from vrf_worker.metrics import Metrics
+
+
+class SlowHandler(Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+        self.messages: list[str] = []
+
+    def emit(self, record) -> None:
+        self.release.wait()
+        self.messages.append(record.message)
+
+
+def test_queued_handler_json_lines():
+    stream = io.StringIO()
+    output = StreamHandler(stream)
+    output.formatter = JsonFormatter()
+    handler = QueuedHandler(output, metrics=Metrics())
+    logger = Logger("test")
+
+    with handler.applicationbound():
+        logger.info("Relaying VRF proof for nonce: {}", 7, extra=task_fields(7, "relay", started=0))
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Error polling tasks")
+    handler.close()
+
+    (relaying, error) = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert (relaying["message"], relaying["nonce"], relaying["stage"]) == (
+        "Relaying VRF proof for nonce: 7",
+        7,
+        "relay",
+    )
+    assert relaying["duration"] > 0
+    assert error["level"] == "ERROR" and "ValueError: boom" in error["exception"]
+
+
+def test_queued_handler_drops_when_full():
+    metrics = Metrics()
+    output = SlowHandler()
+    handler = QueuedHandler(output, maxsize=2, metrics=metrics)
+    logger = Logger("test")
+
+    with handler.applicationbound():
+        for i in range(10):
+            logger.info("line {}", i)
+    # the writer thread holds one line and two wait in the queue, the rest are dropped without waiting
+    dropped = metrics.get("vrf_worker_log_records_dropped_total")
+    assert dropped >= 6
+    output.release.set()
+    handler.close()
+
+    # the drop is reported as soon as the writer catches up
+    assert output.messages[1] == f"Dropped {dropped:.0f} log lines while output was slow"
+    assert len(output.messages) == 10 - dropped + 1
+
+
+def test_log_sampler():
+    sampler = LogSampler(limit=2, window=60)
+    logger = Logger("test")
+    records = []
+    handler = Handler()
+    handler.emit = lambda record: records.extend(sampler.sample(record))
+
+    with handler.applicationbound():
+        for i in range(5):
+            logger.error("Error polling tasks: {}", f"timeout {i}")
+            logger.info("Polled up to nonce {}", i)
+    assert [r.message for r in records if r.level_name == "ERROR"] == [
+        "Error polling tasks: timeout 0",
+        "Error polling tasks: timeout 1",
+    ]
+    assert len(records) == 7
+
+    (summary,) = sampler.flush()
+    assert summary.message.startswith("Suppressed 3 more lines like 'Error polling tasks: {}'")
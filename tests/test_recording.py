@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from pyband.proto.cosmos.base.abci.v1beta1 import TxResponse
+
+from vrf_worker.recording import Call, Recording, RecordingClient, ReplayClient
+from vrf_worker.types import TaskRecord
+
+
+class StubClient:
+    def __init__(self) -> None:
+        self.nonce = 0
+
+    def get_nonce(self) -> int:
+        self.nonce += 1
+        return self.nonce
+
+    def relay(self, proof: bytes, account: object) -> str:
+        if not proof:
+            raise Exception("empty proof")
+        return "0x" + proof.hex()
+
+    async def request(self, seed: bytes) -> bytes:
+        await asyncio.sleep(0)
+        return seed[::-1]
+
+
+def test_record_and_replay(tmp_path):
+    recording = Recording()
+    client = RecordingClient(StubClient(), "stub", recording)
+
+    assert [client.get_nonce() for _ in range(3)] == [1, 2, 3]
+    assert client.relay(b"\x01", object()) == "0x01"
+    with pytest.raises(Exception, match="empty proof"):
+        client.relay(b"", object())
+    assert asyncio.run(client.request(b"ab")) == b"ba"
+    assert client.nonce == 3
+
+    path = tmp_path / "run.rec"
+    recording.save(path)
+    replay = ReplayClient(Recording.load(path), "stub", speed=0)
+
+    # recorded calls are served in order, and the last one is repeated
+    assert [replay.get_nonce() for _ in range(4)] == [1, 2, 3, 3]
+    with pytest.raises(Exception, match="empty proof"):
+        replay.relay(b"", object())
+    assert replay.relay(b"\x01", object()) == "0x01"
+    assert asyncio.run(replay.request(b"ab")) == b"ba"
+    with pytest.raises(AttributeError):
+        replay.get_block_number()
+
+
+def test_replay_by_arguments():
+    recording = Recording()
+    client = RecordingClient(StubClient(), "stub", recording)
+    client.relay(b"\x01", None)
+    client.relay(b"\x02", None)
+
+    replay = ReplayClient(recording, "stub", speed=0)
+    assert replay.relay(b"\x02", None) == "0x02"
+    assert replay.relay(b"\x01", None) == "0x01"
+    with pytest.raises(Exception, match="no recorded call"):
+        replay.relay(b"\x03", None)
+    with pytest.raises(AttributeError):
+        ReplayClient(recording, "other", speed=0).relay(b"\x01", None)
+
+
+class CustomError(Exception):
+    pass
+
+
+def test_saved_values_round_trip(tmp_path):
+    values = [
+        (TaskRecord(7, b"\x07" * 32, 100, "0x0A", 2**200), [b"\x01", 2]),
+        {"0x0A": 3, "0x0B": 4},
+        TxResponse(code=32, txhash="AB", raw_log="account sequence mismatch"),
+        [(True, TaskRecord(8, b"\x08", 1, "0x0B", 0))],
+    ]
+    recording = Recording()
+    for i, value in enumerate(values):
+        recording.add(Call("stub", "get", ((i, b"\xff"), ()), True, 0.0, 0.1, value))
+    recording.add(Call("stub", "fail", ((1,), ()), False, 0.0, 0.1, error=TimeoutError("slow")))
+    recording.add(Call("stub", "fail", ((2,), ()), False, 0.0, 0.1, error=CustomError("odd")))
+
+    path = tmp_path / "run.rec"
+    recording.save(path)
+    loaded = Recording.load(path)
+
+    assert [call.result for call in loaded.calls[: len(values)]] == values
+    assert [call.key for call in loaded.calls] == [call.key for call in recording.calls]
+    (timeout, custom) = (loaded.calls[-2].error, loaded.calls[-1].error)
+    assert type(timeout) is TimeoutError and str(timeout) == "slow"
+    assert type(custom) is Exception and str(custom) == "CustomError: odd"
+
+
+def test_unknown_values_are_not_saved(tmp_path):
+    recording = Recording([Call("stub", "get", ((), ()), False, 0.0, 0.1, object())])
+    with pytest.raises(Exception, match="cannot record a value of type object"):
+        recording.save(tmp_path / "run.rec")
@@ -0,0 +1,88 @@
+import hashlib
+import json
+from types import SimpleNamespace
+
+import pytest
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+from vrf_worker.consumer.evm.replacement import TransactionReplacer
+
+
+class StubAccount:
+    def sign_transaction(self, tx: dict) -> SimpleNamespace:
+        return SimpleNamespace(raw_transaction=json.dumps(tx).encode())
+
+
+class StubEth:
+    """Mines a transaction as soon as it pays at least `min_fee`."""
+
+    def __init__(self, min_fee: int) -> None:
+        self.min_fee = min_fee
+        self.sent: dict[str, dict] = {}
+
+    def send_raw_transaction(self, raw_tx: bytes) -> HexBytes:
+        tx_hash = HexBytes(hashlib.sha256(raw_tx).digest())
+        self.sent[tx_hash.to_0x_hex()] = json.loads(raw_tx)
+        return tx_hash
+
+    def get_transaction_receipt(self, tx_hash: str) -> dict:
+        tx = self.sent[tx_hash]
+        if tx.get("maxFeePerGas", tx.get("gasPrice")) < self.min_fee:
+            raise TransactionNotFound(tx_hash)
+        return {"status": 1}
+
+    def wait_for_transaction_receipt(self, tx_hash: str, timeout: float) -> dict:
+        return {"status": 1}
+
+
+def make_replacer(eth: StubEth, **kwargs) -> TransactionReplacer:
+    params = dict(target_inclusion_time=0.01, fee_bump_percent=12.5, poll_interval=0.001, timeout=0.2)
+    params.update(kwargs)
+    return TransactionReplacer(SimpleNamespace(eth=eth), **params)
+
+
+TX = {"nonce": 7, "maxFeePerGas": 100, "maxPriorityFeePerGas": 10}
+
+
+def test_replaces_until_mined():
+    eth = StubEth(min_fee=130)
+    replacer = make_replacer(eth)
+    assert replacer.wait(replacer.send(TX, StubAccount())) == 1
+
+    sent = list(eth.sent.values())
+    assert [tx["maxFeePerGas"] for tx in sent] == [100, 113, 128, 144]
+    assert [tx["maxPriorityFeePerGas"] for tx in sent] == [10, 12, 14, 16]
+    assert {tx["nonce"] for tx in sent} == {7}
+
+
+def test_fees_are_clamped_to_ceiling():
+    eth = StubEth(min_fee=130)
+    replacer = make_replacer(eth, max_fee_per_gas=125)
+    with pytest.raises(Exception, match="was not mined"):
+        replacer.wait(replacer.send(TX, StubAccount()))
+    assert [tx["maxFeePerGas"] for tx in eth.sent.values()] == [100, 113, 125]
+    assert not replacer.pending
+
+
+def test_bump_is_at_least_ten_percent():
+    eth = StubEth(min_fee=110)
+    replacer = make_replacer(eth, fee_bump_percent=1)
+    assert replacer.wait(replacer.send({"nonce": 1, "gasPrice": 100}, StubAccount())) == 1
+    assert [tx["gasPrice"] for tx in eth.sent.values()] == [100, 110]
+
+
+def test_disabled():
+    eth = StubEth(min_fee=130)
+    replacer = make_replacer(eth, target_inclusion_time=0)
+    assert replacer.wait(replacer.send(TX, StubAccount())) == 1
+    assert len(eth.sent) == 1
+
+
+def test_unwaited_transactions_expire():
+    eth = StubEth(min_fee=0)
+    replacer = make_replacer(eth, timeout=0)
+    first = replacer.send(TX, StubAccount())
+    second = replacer.send({**TX, "nonce": 8}, StubAccount())
+    assert list(replacer.pending) == [second]
+    assert first != second
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from vrf_worker.consumer.evm.client import RpcGateMiddleware
+from vrf_worker.metrics import Metrics
+from vrf_worker.rpc import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, RateLimited, RpcGate, TokenBucket
+
+
+def test_call_coalesces_identical_requests():
+    gate = RpcGate("test", metrics=Metrics())
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(gate.call("nonce", PRIORITY_LOW, fn)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(gate.call("nonce", PRIORITY_LOW, fn)))
+    follower.start()
+    while gate.metrics.get("vrf_worker_rpc_coalesced_total", endpoint="test") == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert (results, len(calls)) == ([42, 42], 1)
+    # once the request is done, the next one with the same key is sent
+    assert gate.call("nonce", PRIORITY_LOW, lambda: 43) == 43
+
+
+def test_call_async_coalesces_and_outlives_cancelled_callers():
+    async def run():
+        gate = RpcGate("test", metrics=Metrics())
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return b"proof"
+
+        first = asyncio.create_task(gate.call_async(("proof", 1), PRIORITY_NORMAL, fn))
+        second = asyncio.create_task(gate.call_async(("proof", 1), PRIORITY_NORMAL, fn))
+        other = asyncio.create_task(gate.call_async(("proof", 2), PRIORITY_NORMAL, fn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, await other, len(calls), first.cancelled()
+
+    assert asyncio.run(run()) == (b"proof", b"proof", 2, True)
+
+
+def test_rate_limited_requests_are_retried():
+    gate = RpcGate("test", max_retries=3, backoff=0, metrics=Metrics())
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited("429 Too Many Requests", retry_after=0)
+        return "ok"
+
+    assert gate.call(None, PRIORITY_HIGH, flaky) == "ok"
+    assert gate.metrics.get("vrf_worker_rpc_rate_limited_total", endpoint="test") == 2
+
+    def failing():
+        attempts.append(1)
+        raise Exception("execution reverted")
+
+    attempts.clear()
+    with pytest.raises(Exception, match="execution reverted"):
+        gate.call(None, PRIORITY_HIGH, failing)
+    assert len(attempts) == 1
+
+
+def test_token_bucket_serves_urgent_requests_first():
+    bucket = TokenBucket(rate=0.001, burst=6)
+    bucket.tokens = 2.5
+
+    # a low priority request leaves 40% of the bucket above the last token for more urgent ones
+    assert bucket._take(PRIORITY_LOW) > 0
+    assert bucket._take(PRIORITY_NORMAL) == 0
+    assert bucket._take(PRIORITY_NORMAL) > 0
+    assert bucket._take(PRIORITY_HIGH) == 0
+    assert bucket._take(PRIORITY_HIGH) > 0
+
+    assert TokenBucket(rate=0, burst=1)._take(PRIORITY_LOW) == 0
+
+
+def test_middleware_retries_rate_limit_errors():
+    gate = RpcGate("test", backoff=0, metrics=Metrics())
+    responses = [{"error": {"code": -32005, "message": "limit exceeded"}}, {"result": "0x10"}]
+    make_request = RpcGateMiddleware(None, gate).wrap_make_request(lambda method, params: responses.pop(0))
+
+    assert make_request("eth_blockNumber", []) == {"result": "0x10"}
+    assert gate.metrics.get("vrf_worker_rpc_rate_limited_total", endpoint="test") == 1
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from vrf_worker.metrics import Metrics
+from vrf_worker.scheduler import TaskScheduler, _SpillQueue
+from vrf_worker.types import TaskRecord
+
+CALLER_A = "0x000000000000000000000000000000000000000A"
+CALLER_B = "0x000000000000000000000000000000000000000B"
+
+
+def make_task(nonce: int, age: float, fee: int = 0, caller: str = CALLER_A) -> TaskRecord:
+    return TaskRecord(nonce, nonce.to_bytes(32, "big"), int(time.time() - age), caller, fee)
+
+
+def make_scheduler(**kwargs) -> TaskScheduler:
+    params = dict(fee_per_second=100, max_fee_bonus=60, retry_penalty=30, starvation_age=3600)
+    params.update(kwargs)
+    return TaskScheduler(**params)
+
+
+async def drain(scheduler: TaskScheduler) -> list[int]:
+    nonces = []
+    while len(scheduler):
+        (record, _) = await scheduler.get()
+        await scheduler.done(record)
+        nonces.append(record.nonce)
+    return nonces
+
+
+def test_orders_by_age():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.put(make_task(1, age=10), 0)
+        await scheduler.put(make_task(2, age=30), 0)
+        await scheduler.put(make_task(3, age=20), 0)
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [2, 3, 1]
+
+
+def test_fee_bonus_is_capped():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.put(make_task(1, age=10, fee=100 * 40), 0)  # 40s bonus
+        await scheduler.put(make_task(2, age=45), 0)
+        await scheduler.put(make_task(3, age=0, fee=100 * 10_000), 0)  # capped at 60s
+        await scheduler.put(make_task(4, age=70), 0)
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [4, 3, 1, 2]
+
+
+def test_retry_penalty_and_caller_weight():
+    async def run():
+        scheduler = make_scheduler(caller_weights={CALLER_B.lower(): 3})
+        await scheduler.put(make_task(1, age=50), 1)  # 30s penalty
+        await scheduler.put(make_task(2, age=30), 0)
+        await scheduler.put(make_task(3, age=0, fee=100 * 15, caller=CALLER_B), 0)  # 15s bonus weighted to 45s
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [3, 2, 1]
+
+
+def test_weighted_fee_bonus_is_capped():
+    async def run():
+        scheduler = make_scheduler(caller_weights={CALLER_B.lower(): 3})
+        await scheduler.put(make_task(1, age=0, fee=100 * 40, caller=CALLER_B), 0)  # 120s bonus capped at 60s
+        await scheduler.put(make_task(2, age=65), 0)
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [2, 1]
+
+
+def test_starving_tasks_go_first():
+    async def run():
+        scheduler = make_scheduler(starvation_age=100)
+        await scheduler.put(make_task(1, age=0, fee=100 * 60), 0)
+        await scheduler.put(make_task(2, age=110), 5)
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [2, 1]
+
+
+def test_caller_max_in_flight():
+    async def run():
+        scheduler = make_scheduler(caller_max_in_flight={CALLER_A: 1})
+        await scheduler.put(make_task(1, age=30), 0)
+        await scheduler.put(make_task(2, age=20), 0)
+        await scheduler.put(make_task(3, age=10, caller=CALLER_B), 0)
+
+        (first, _) = await scheduler.get()
+        (second, _) = await scheduler.get()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.get(), 0.05)
+
+        await scheduler.done(first)
+        (third, _) = await scheduler.get()
+        return [first.nonce, second.nonce, third.nonce]
+
+    assert asyncio.run(run()) == [1, 3, 2]
+
+
+def test_exports_ordering():
+    async def run():
+        metrics = Metrics()
+        scheduler = make_scheduler(metrics=metrics)
+        await scheduler.put(make_task(7, age=10), 0)
+        await scheduler.put(make_task(8, age=20), 0)
+        return metrics.render()
+
+    rendered = asyncio.run(run())
+    assert "vrf_worker_queue_depth 2" in rendered
+    assert f'vrf_worker_queue_position{{caller="{CALLER_A.lower()}",nonce="8",retry="0"}} 0' in rendered
+    assert f'vrf_worker_queue_position{{caller="{CALLER_A.lower()}",nonce="7",retry="0"}} 1' in rendered
+
+
+def test_spills_past_max_in_memory():
+    async def run():
+        scheduler = make_scheduler(max_in_memory=2, starvation_age=100)
+        await scheduler.put(make_task(1, age=10), 0)
+        await scheduler.put(make_task(2, age=30), 0)
+        await scheduler.put(make_task(3, age=50, fee=100 * 20), 0)
+        await scheduler.put(make_task(4, age=20), 0)
+        await scheduler.put(make_task(5, age=120), 0)  # starving
+        assert (len(scheduler), scheduler.spilled) == (5, 3)
+        assert [record.nonce for record, _ in scheduler.ordered()] == [5, 3, 2, 4, 1]
+        return await drain(scheduler)
+
+    assert asyncio.run(run()) == [5, 3, 2, 4, 1]
+
+
+def test_spilled_record_round_trip(tmp_path):
+    async def run():
+        scheduler = make_scheduler(max_in_memory=0, spill_path=str(tmp_path / "spill.db"))
+        record = make_task(9, age=10, fee=2**200)
+        await scheduler.put(record, 2)
+        return record, await scheduler.get()
+
+    (record, (spilled, retry)) = asyncio.run(run())
+    assert spilled == record
+    assert retry == 2
+
+
+def test_spill_queue_is_used_off_the_event_loop(monkeypatch):
+    threads = []
+    for name in ("__init__", "push", "peek", "remove"):
+        method = getattr(_SpillQueue, name)
+
+        def recorded(self, *args, method=method):
+            threads.append(threading.get_ident())
+            return method(self, *args)
+
+        monkeypatch.setattr(_SpillQueue, name, recorded)
+
+    async def run():
+        scheduler = make_scheduler(max_in_memory=0)
+        await scheduler.put(make_task(1, age=10), 0)
+        return await scheduler.get()
+
+    (record, _) = asyncio.run(run())
+    assert record.nonce == 1
+    assert threads
+    assert threading.get_ident() not in threads
+
+
+def test_caller_max_in_flight_with_spilled_tasks():
+    async def run():
+        scheduler = make_scheduler(max_in_memory=1, caller_max_in_flight={CALLER_A: 1})
+        await scheduler.put(make_task(1, age=10, caller=CALLER_B), 0)
+        await scheduler.put(make_task(2, age=30), 0)
+        await scheduler.put(make_task(3, age=20), 0)
+
+        (first, _) = await scheduler.get()
+        (second, _) = await scheduler.get()
+        await scheduler.done(first)
+        (third, _) = await scheduler.get()
+        return [first.nonce, second.nonce, third.nonce]
+
+    assert asyncio.run(run()) == [2, 1, 3]
@@ -0,0 +1,67 @@
+import itertools
+import random
+
+import pytest
+from eth_abi import decode
+
+from vrf_worker.consumer.evm.selection import Candidate, required_power, select_by_gas, select_by_power
+from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+from vrf_worker.consumer.evm.utils import trim_proof
+
+from . import test_consumer_evm_utils
+
+# the fixtures of the utils tests, registered here under their own names
+mock_block_hash_fixture = test_consumer_evm_utils.mock_block_hash
+mock_encoded_chain_id_fixture = test_consumer_evm_utils.mock_encoded_chain_id
+mock_evm_proof_fixture = test_consumer_evm_utils.mock_evm_proof
+mock_validator_power_fixture = test_consumer_evm_utils.mock_validator_power
+
+
+def brute_force_gas(candidates: list[Candidate], total_power: int) -> int:
+    needed = required_power(total_power)
+    return min(
+        sum(c.gas for c in subset)
+        for size in range(1, len(candidates) + 1)
+        for subset in itertools.combinations(candidates, size)
+        if sum(c.power for c in subset) >= needed
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_select_by_gas_is_optimal(seed):
+    rng = random.Random(seed)
+    candidates = [
+        Candidate(i, f"0x{i:040x}", rng.randint(1, 100), rng.randint(6000, 12000)) for i in range(rng.randint(3, 12))
+    ]
+    total_power = sum(c.power for c in candidates) + rng.randint(0, 50)
+    if sum(c.power for c in candidates) < required_power(total_power):
+        with pytest.raises(Exception, match="does not exceed 2/3"):
+            select_by_gas(candidates, total_power)
+        return
+
+    selected = select_by_gas(candidates, total_power)
+    greedy = select_by_power(candidates, total_power)
+    assert sum(c.power for c in selected) * 3 > total_power * 2
+    assert sum(c.gas for c in selected) == brute_force_gas(candidates, total_power)
+    assert sum(c.gas for c in selected) <= sum(c.gas for c in greedy)
+
+
+def test_trim_proof_by_gas(
+    mock_evm_proof_fixture, mock_block_hash_fixture, mock_encoded_chain_id_fixture, mock_validator_power_fixture
+):
+    reports = []
+    proof = trim_proof(
+        mock_evm_proof_fixture,
+        mock_block_hash_fixture,
+        mock_encoded_chain_id_fixture,
+        mock_validator_power_fixture,
+        select_by_gas,
+        reports.append,
+    )
+    (report,) = reports
+    assert report.gas <= report.baseline_gas
+    assert report.saved_gas == report.baseline_gas - report.gas
+
+    relay_data, _ = decode(("bytes", "bytes"), proof)
+    signatures = decode(RELAY_DATA_TYPES, relay_data)[3]
+    assert len(signatures) == report.count
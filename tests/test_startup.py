@@ -0,0 +1,45 @@
+import json
+
+from vrf_worker.config import EvmConfig
+from vrf_worker.startup import SNAPSHOT_VERSION, ChainSnapshot, load_snapshot, save_snapshot
+
+EVM_CONFIG = EvmConfig(
+    chain_id="test",
+    rpc_endpoint="http://localhost:8545",
+    vrf_provider_address="0x0101010101010101010101010101010101010101",
+    vrf_lens_address="0x0202020202020202020202020202020202020202",
+    bridge_address="0x0303030303030303030303030303030303030303",
+    private_key="",
+    whitelisted_callers=[],
+)
+
+
+def make_snapshot() -> ChainSnapshot:
+    return ChainSnapshot.create(EVM_CONFIG, bytes.fromhex("0a0962616e64636861696e"), 152)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    save_snapshot(path, make_snapshot())
+    assert load_snapshot(path, EVM_CONFIG) == make_snapshot()
+
+
+def test_snapshot_is_ignored_when_missing_or_corrupt(tmp_path):
+    path = tmp_path / "snapshot.json"
+    assert load_snapshot(str(path), EVM_CONFIG) is None
+
+    path.write_text("{")
+    assert load_snapshot(str(path), EVM_CONFIG) is None
+
+
+def test_snapshot_is_ignored_for_other_version_or_contracts(tmp_path):
+    path = tmp_path / "snapshot.json"
+    save_snapshot(str(path), make_snapshot())
+
+    other_bridge = EvmConfig(**{**vars(EVM_CONFIG), "bridge_address": "0x0404040404040404040404040404040404040404"})
+    assert load_snapshot(str(path), other_bridge) is None
+
+    data = json.loads(path.read_text())
+    data["version"] = SNAPSHOT_VERSION + 1
+    path.write_text(json.dumps(data))
+    assert load_snapshot(str(path), EVM_CONFIG) is None
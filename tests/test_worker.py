@@ -0,0 +1,293 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from eth_account import Account
+from logbook import Logger
+from pyband.proto.cosmos.base.abci.v1beta1 import TxResponse
+from pyband.proto.tendermint.abci import Event, EventAttribute
+
+from vrf_worker.band.hedging import HedgePolicy
+from vrf_worker.band.types import TxParams
+from vrf_worker.config import EvmConfig, WorkerConfig
+from vrf_worker.consumer.evm import worker as worker_module
+from vrf_worker.consumer.evm.worker import Worker, poll_once
+from vrf_worker.metrics import Metrics
+from vrf_worker.rpc import PRIORITY_LOW, RpcGate
+from vrf_worker.scheduler import TaskScheduler
+from vrf_worker.types import TaskRecord
+
+CALLER = "0x000000000000000000000000000000000000000A"
+
+
+class StubEvmClient:
+    def __init__(self, resolved: set[int]) -> None:
+        self.resolved = resolved
+        self.block = 0
+
+    def get_block_number(self) -> int:
+        self.block += 1
+        return self.block
+
+    def get_task_records_by_nonces(self, nonces: list[int]) -> list[tuple[bool, TaskRecord]]:
+        return [(nonce in self.resolved, make_record(nonce)) for nonce in nonces]
+
+
+def make_record(nonce: int) -> TaskRecord:
+    return TaskRecord(nonce, bytes(32), 0, CALLER, 0)
+
+
+def make_worker(evm_client, batch_relayer_address=None, **worker_config) -> Worker:
+    evm_config = EvmConfig(
+        chain_id="test",
+        rpc_endpoint="",
+        vrf_provider_address="",
+        vrf_lens_address="",
+        bridge_address="",
+        private_key="",
+        whitelisted_callers=[CALLER],
+        batch_relayer_address=batch_relayer_address,
+    )
+    return Worker(
+        evm_client=evm_client,
+        band_client=None,
+        evm_account=None,
+        band_wallet=None,
+        band_tx_params=None,
+        evm_config=evm_config,
+        worker_config=WorkerConfig(**worker_config),
+        metrics=Metrics(),
+    )
+
+
+def test_batching_needs_concurrency():
+    with pytest.raises(Exception, match="concurrency of at least 2"):
+        make_worker(StubEvmClient(resolved=set()), batch_relayer_address=CALLER)
+    make_worker(StubEvmClient(resolved=set()), batch_relayer_address=CALLER, concurrency=2)
+
+
+def test_reconciler_cancels_resolved_tasks(monkeypatch: pytest.MonkeyPatch):
+    async def run():
+        worker = make_worker(StubEvmClient(resolved={2}), reconcile_interval=0.01)
+
+        async def process_task(record, oracle_script_id, encoded_band_chain_id) -> bool:
+            await asyncio.sleep(60)
+            return True
+
+        monkeypatch.setattr(worker, "process_task", process_task)
+
+        slots = asyncio.Semaphore(2)
+        for nonce in (1, 2):
+            await slots.acquire()
+            worker.running[nonce] = asyncio.create_task(worker._run_task(slots, make_record(nonce), 0, 1, b""))
+
+        reconciler = asyncio.create_task(worker.reconcile_tasks())
+        await asyncio.sleep(0.1)
+        reconciler.cancel()
+        result = (list(worker.running), worker.metrics.get("vrf_worker_tasks_total", result="cancelled"))
+
+        for task in worker.running.values():
+            task.cancel()
+        return result
+
+    assert asyncio.run(run()) == ([1], 1)
+
+
+def test_reconciler_leaves_relaying_tasks(monkeypatch: pytest.MonkeyPatch):
+    async def run():
+        worker = make_worker(StubEvmClient(resolved={1, 2}), reconcile_interval=0.01)
+
+        async def process_task(record, oracle_script_id, encoded_band_chain_id) -> bool:
+            if record.nonce == 2:
+                await asyncio.sleep(60)
+            # the relay of nonce 1 resolves it on-chain while its receipt is awaited
+            worker.relaying.add(record.nonce)
+            try:
+                await asyncio.sleep(0.1)
+            finally:
+                worker.relaying.discard(record.nonce)
+            return True
+
+        monkeypatch.setattr(worker, "process_task", process_task)
+
+        slots = asyncio.Semaphore(2)
+        for nonce in (1, 2):
+            await slots.acquire()
+            worker.running[nonce] = asyncio.create_task(worker._run_task(slots, make_record(nonce), 0, 1, b""))
+
+        reconciler = asyncio.create_task(worker.reconcile_tasks())
+        await asyncio.sleep(0.2)
+        reconciler.cancel()
+        return [worker.metrics.get("vrf_worker_tasks_total", result=result) for result in ("relayed", "cancelled")]
+
+    assert asyncio.run(run()) == [1, 1]
+
+
+class StubBandClient:
+    def __init__(self, proof_delays: list[float], request_delay: float = 0) -> None:
+        self.proof_delays = proof_delays
+        self.request_delay = request_delay
+        self.requests = []
+        self.fetches = []
+
+    async def request_vrf(self, oracle_script_id, worker_address, seed, time, tx_params, signer):
+        await asyncio.sleep(self.request_delay)
+        self.requests.append((seed, time))
+        # request 1 is the one already sent
+        return TxResponse(code=0, txhash=f"tx{len(self.requests) + 1}")
+
+    async def get_transaction(self, tx_hash):
+        event = Event(type="request", attributes=[EventAttribute(key="id", value=tx_hash[2:])])
+        return TxResponse(code=0, txhash=tx_hash, events=[event])
+
+    async def get_evm_proof_and_block_hash(self, request_id, on_result=None, refresh=False):
+        await asyncio.sleep(self.proof_delays[request_id - 1])
+        self.fetches.append((request_id, refresh))
+        return (f"proof{request_id}".encode(), b"hash")
+
+
+def test_slow_request_is_hedged():
+    def get_proof(proof_delays: list[float], fee_budget: int, request_delay: float = 0):
+        worker = make_worker(None)
+        worker.band_client = StubBandClient(proof_delays, request_delay)
+        worker.evm_account = Account.create()
+        worker.hedge_policy = HedgePolicy(fee_budget, min_delay=0.05, max_delay=0.05, metrics=worker.metrics)
+        tx_params = TxParams(2, 3, 100000, 400000, 48, 800000, 0.0025)
+        record = make_record(1)
+
+        async def run():
+            proof = await worker.get_proof(record, 1, 1, tx_params)
+            return (proof, worker.band_client.requests)
+
+        return (asyncio.run(run()), worker.metrics)
+
+    # the hedge resolves first and the same task is requested again
+    ((proof, requests), metrics) = get_proof([10, 0.01], fee_budget=10_000)
+    assert proof == (2, b"proof2", b"hash")
+    assert requests == [(bytes(32), 0)]
+    assert metrics.get("vrf_worker_band_hedges_total", result="won") == 1
+    assert metrics.get("vrf_worker_band_hedge_fees_total") == 2048
+
+    # a fast request is not hedged
+    ((proof, requests), _) = get_proof([0.01], fee_budget=10_000)
+    assert (proof, requests) == ((1, b"proof1", b"hash"), [])
+
+    # a hedge over the fee budget is not sent
+    ((proof, requests), metrics) = get_proof([0.2], fee_budget=1000)
+    assert (proof, requests) == ((1, b"proof1", b"hash"), [])
+    assert metrics.get("vrf_worker_band_hedges_total", result="over_budget") == 1
+
+    # a request resolved while its hedge is being sent is not held up by it, and the hedge is dropped
+    started = time.monotonic()
+    ((proof, requests), metrics) = get_proof([0.1], fee_budget=10_000, request_delay=10)
+    assert time.monotonic() - started < 5
+    assert (proof, requests) == ((1, b"proof1", b"hash"), [])
+    assert metrics.get("vrf_worker_band_hedges_total", result="lost") == 1
+
+
+@pytest.mark.parametrize("rejections,relayed", [(1, True), (2, False)])
+def test_rejected_proof_is_fetched_again(monkeypatch: pytest.MonkeyPatch, rejections: int, relayed: bool):
+    class RelayingEvmClient:
+        def get_validators_from_bridge(self) -> dict[str, int]:
+            return {}
+
+        def relay_proof(self, proof, nonce, account, eip1559) -> str:
+            return "0x01"
+
+        def get_tx_receipt_status(self, tx_hash) -> int:
+            return 1
+
+    worker = make_worker(RelayingEvmClient())
+    worker.band_client = StubBandClient([0, 0])
+    worker.evm_account = Account.create()
+    checks = []
+
+    def check(*args):
+        checks.append(args[0])
+        if len(checks) <= rejections:
+            raise Exception("invalid proof")
+        return b"trimmed"
+
+    monkeypatch.setattr("vrf_worker.consumer.evm.worker.trim_and_verify_proof", check)
+
+    assert asyncio.run(worker.process_task(make_record(1), 1, b"")) == relayed
+    # the proof of the same request is fetched once more, and no new request is paid for
+    assert worker.band_client.fetches == [(2, False), (2, True)]
+    assert worker.band_client.requests == [(bytes(32), 0)]
+    assert worker.metrics.get("vrf_worker_proofs_rejected_total") == rejections
+
+
+class StubBlockRelayClient:
+    def __init__(self) -> None:
+        self.relayed: list[int] = []
+        # fails unless the relays of two different blocks are in progress at once
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def get_block_detail(self, height: int) -> tuple[bytes, int, int]:
+        return (b"", 0, 0)
+
+    def relay_block(self, relay_data: bytes, account: object, eip1559: bool) -> str:
+        self.relayed.append(relay_data[0])
+        self.barrier.wait()
+        return "0x01"
+
+    def get_tx_receipt_status(self, tx_hash: str) -> int:
+        return 1
+
+
+def test_blocks_are_relayed_once_each_and_concurrently(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(worker_module, "get_block_detail", lambda proof: (proof[0], (proof, 0, 0)))
+    monkeypatch.setattr(worker_module, "get_block_relay_data", lambda proof: proof)
+    evm_client = StubBlockRelayClient()
+    worker = make_worker(evm_client)
+
+    async def run():
+        await asyncio.gather(*(worker.ensure_block_relayed(bytes([height])) for height in (1, 1, 2, 1, 2)))
+        await worker.ensure_block_relayed(bytes([1]))
+
+    asyncio.run(run())
+    assert sorted(evm_client.relayed) == [1, 2]
+    assert sorted(worker.relayed_blocks) == [1, 2]
+    assert worker.block_relays == {}
+
+
+def test_profile_endpoint_is_capped():
+    worker = make_worker(StubEvmClient(resolved=set()), profile_seconds=0.05)
+    durations = []
+    worker.profiler.profile = lambda seconds: durations.append(seconds) or ""
+
+    asyncio.run(worker._serve_profile({"seconds": "3600"}))
+    asyncio.run(worker._serve_profile({}))
+    assert durations == [0.05, 0.05]
+
+
+def test_throttled_poll_does_not_block_the_loop():
+    # one request per 0.2s, so the second read of the poll waits for the rate limit
+    gate = RpcGate("test", rate=5, burst=1, metrics=Metrics())
+
+    class ThrottledClient:
+        def get_current_task_nonce_from_vrf_provider(self) -> int:
+            return gate.call(None, PRIORITY_LOW, lambda: 2)
+
+        def get_task_records_by_nonces(self, nonces: list[int]) -> list[tuple[bool, TaskRecord]]:
+            return gate.call(None, PRIORITY_LOW, lambda: [(False, make_record(nonce)) for nonce in nonces])
+
+    async def run():
+        scheduler = TaskScheduler(fee_per_second=1, max_fee_bonus=0, retry_penalty=0, starvation_age=3600)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        next_nonce = await poll_once(Logger("test"), ThrottledClient(), 0, scheduler, [CALLER])
+        ticker.cancel()
+        return next_nonce, len(scheduler), ticks
+
+    (next_nonce, queued, ticks) = asyncio.run(run())
+    assert (next_nonce, queued) == (2, 2)
+    assert ticks >= 10
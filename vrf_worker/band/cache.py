@@ -0,0 +1,125 @@
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from vrf_worker.metrics import METRICS, Metrics
+
+# rows written to the database between two prunings of it
+PRUNE_INTERVAL = 100
+
+BlockKey = tuple[str, int]
+
+
+class BlockHashCache:
+    """Keeps the hashes of BandChain blocks, which never change, so that each is only fetched once.
+
+    Many requests resolve in the same block, and each of their proofs needs its hash. Hashes are stored by chain ID
+    and height, so that workers of different chains never mix them up. Up to `size` are kept in memory, the least
+    recently used dropped first. With a `path`, they are also written to a SQLite database there, keeping the last
+    `persistent_size`, so that they survive restarts and are shared by the workers on the same host. The database is
+    read and written in a thread, and is only a cache: an error using it is counted in
+    `vrf_worker_band_cache_errors_total` and treated as a miss.
+    """
+
+    def __init__(
+        self,
+        size: int = 256,
+        path: Optional[str] = None,
+        persistent_size: int = 10000,
+        metrics: Metrics = METRICS,
+    ) -> None:
+        self.size = size
+        self.persistent_size = persistent_size
+        self.metrics = metrics
+
+        self.block_hashes: OrderedDict[BlockKey, bytes] = OrderedDict()
+        self._writes = 0
+
+        self.conn: Optional[sqlite3.Connection] = None
+        # the connection is used from the threads of asyncio.to_thread, one at a time
+        self._lock = threading.Lock()
+        if path:
+            # Several workers may read and write the database at once, so it is in WAL mode, and waits a little for
+            # a lock instead of failing. A cache does not need to survive a power loss, so commits are not synced.
+            self.conn = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = OFF")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS block_hashes (chain_id TEXT, height INTEGER, hash BLOB, "
+                "PRIMARY KEY (chain_id, height))"
+            )
+
+    async def get(self, chain_id: str, height: int) -> Optional[bytes]:
+        """Returns the cached hash of a block, if any.
+
+        Args:
+            chain_id (str): The BandChain chain ID.
+            height (int): The block height.
+
+        Returns:
+            Optional[bytes]: The block hash.
+        """
+        key = (chain_id, height)
+        if key in self.block_hashes:
+            self.block_hashes.move_to_end(key)
+            self.metrics.inc("vrf_worker_band_cache_requests_total", result="memory")
+            return self.block_hashes[key]
+
+        row = await asyncio.to_thread(self._query, key) if self.conn is not None else None
+        if row is None:
+            self.metrics.inc("vrf_worker_band_cache_requests_total", result="miss")
+            return None
+        self.metrics.inc("vrf_worker_band_cache_requests_total", result="disk")
+        self._remember(key, row[0])
+        return row[0]
+
+    async def put(self, chain_id: str, height: int, block_hash: bytes) -> None:
+        """Caches the hash of a block, replacing any cached before."""
+        key = (chain_id, height)
+        self._remember(key, block_hash)
+        if self.conn is not None:
+            await asyncio.to_thread(self._insert, key, block_hash)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _remember(self, key: BlockKey, block_hash: bytes) -> None:
+        if self.size <= 0:
+            return
+        self.block_hashes[key] = block_hash
+        self.block_hashes.move_to_end(key)
+        while len(self.block_hashes) > self.size:
+            self.block_hashes.popitem(last=False)
+
+    def _query(self, key: BlockKey) -> Optional[tuple]:
+        with self._lock:
+            if self.conn is None:
+                return None
+            try:
+                return self.conn.execute(
+                    "SELECT hash FROM block_hashes WHERE chain_id = ? AND height = ?", key
+                ).fetchone()
+            except sqlite3.Error:
+                self.metrics.inc("vrf_worker_band_cache_errors_total")
+                return None
+
+    def _insert(self, key: BlockKey, block_hash: bytes) -> None:
+        with self._lock:
+            if self.conn is None:
+                return
+            try:
+                # another worker may have written the same row, or a hash fetched again may replace a wrong one
+                self.conn.execute("INSERT OR REPLACE INTO block_hashes VALUES (?, ?, ?)", (*key, block_hash))
+                self._writes += 1
+                if self._writes % PRUNE_INTERVAL == 0:
+                    self.conn.execute(
+                        "DELETE FROM block_hashes WHERE rowid <= (SELECT MAX(rowid) FROM block_hashes) - ?",
+                        (self.persistent_size,),
+                    )
+            except sqlite3.Error:
+                self.metrics.inc("vrf_worker_band_cache_errors_total")
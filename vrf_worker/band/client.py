@@ -1,40 +1,136 @@
 import asyncio
+import re
 import time
+from collections import OrderedDict
+from dataclasses import astuple
+from math import ceil
+from typing import Awaitable, Callable, Hashable, Optional
 
 import grpclib
 import pyband
-from pyband.messages.band.oracle.v1 import MsgRequestData
 from pyband.obi import PyObi
 from pyband.proto.band.base.oracle.v1 import ProofRequest
-from pyband.proto.band.oracle.v1 import ResolveStatus
+from pyband.proto.band.oracle.v1 import ResolveStatus, Result
 from pyband.proto.cosmos.base.abci.v1beta1 import TxResponse
 from pyband.proto.cosmos.base.tendermint.v1beta1 import GetBlockByHeightRequest
-from pyband.proto.cosmos.base.v1beta1 import Coin
-from pyband.transaction import Transaction
 from pyband.wallet import Wallet
 
+from vrf_worker.band.cache import BlockHashCache
+from vrf_worker.band.tx import RequestTxBuilder, encode_vrf_calldata
 from vrf_worker.band.types import TxParams
+from vrf_worker.diagnostics import timed
+from vrf_worker.metrics import METRICS, Metrics
+from vrf_worker.rpc import PRIORITY_HIGH, PRIORITY_NORMAL, RpcGate
 
 VRF_OBI = PyObi("{seed:[u8],time:u64,worker_address:[u8]}/{proof:[u8],result:[u8]}")
 
+# the cosmos-sdk codes of a transaction that ran out of gas, and of one signed with the wrong account sequence
+OUT_OF_GAS_CODE = 11
+SEQUENCE_MISMATCH_CODE = 32
+SEQUENCE_MISMATCH_PATTERN = re.compile(r"account sequence mismatch, expected (\d+)")
+
+
+class GasEstimator:
+    """Sets the gas limit of request transactions from simulations of them, cached by message shape.
+
+    The gas used by a simulation, times `adjustment` and capped at `max_gas_limit`, is the gas limit of the
+    transactions with the same key for `ttl` seconds. If the simulation fails, the fallback limit is used and the
+    simulation is tried again after `retry_interval` seconds. An estimate is dropped as soon as a transaction sent
+    with it runs out of gas, so the next one is simulated again.
+    """
+
+    def __init__(
+        self,
+        adjustment: float = 1.3,
+        ttl: float = 600,
+        max_gas_limit: int = 2_000_000,
+        retry_interval: float = 60,
+        metrics: Metrics = METRICS,
+    ) -> None:
+        self.adjustment = adjustment
+        self.ttl = ttl
+        self.max_gas_limit = max_gas_limit
+        self.retry_interval = retry_interval
+        self.metrics = metrics
+        # key -> (gas limit, expiry)
+        self._estimates: dict[Hashable, tuple[int, float]] = {}
+
+    async def estimate(self, key: Hashable, fallback: int, simulate: Callable[[], Awaitable[int]]) -> int:
+        """Returns the gas limit for a transaction, simulating it if there is no fresh estimate for its key.
+
+        Args:
+            key (Hashable): The shape of the transaction.
+            fallback (int): The gas limit to use if the simulation fails.
+            simulate (Callable[[], Awaitable[int]]): Simulates the transaction and returns the gas it used.
+
+        Returns:
+            int: The gas limit.
+        """
+        now = time.monotonic()
+        if key in self._estimates and now < self._estimates[key][1]:
+            return self._estimates[key][0]
+
+        try:
+            gas_limit = min(ceil(await simulate() * self.adjustment), self.max_gas_limit)
+            self._estimates[key] = (gas_limit, now + self.ttl)
+            self.metrics.inc("vrf_worker_band_gas_simulations_total", result="ok")
+        except Exception:
+            gas_limit = fallback
+            self._estimates[key] = (gas_limit, now + min(self.retry_interval, self.ttl))
+            self.metrics.inc("vrf_worker_band_gas_simulations_total", result="failed")
+        return gas_limit
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drops the estimate for a key, e.g. after a transaction sent with it ran out of gas."""
+        if self._estimates.pop(key, None) is not None:
+            self.metrics.inc("vrf_worker_band_gas_estimates_invalidated_total")
+
 
 class Client:
     """This class contains methods that interact with the BandChain Client."""
 
-    def __init__(self, grpc_endpoint: str) -> None:
+    def __init__(
+        self,
+        grpc_endpoint: str,
+        ssl: bool = True,
+        rate_limit: float = 0,
+        rate_burst: int = 10,
+        gas_adjustment: float = 1.3,
+        gas_estimate_ttl: float = 600,
+        max_gas_limit: int = 2_000_000,
+        block_hash_cache: Optional[BlockHashCache] = None,
+    ) -> None:
         try:
             (grpc_endpoint, port) = grpc_endpoint.split(":")
         except Exception as _:
             raise Exception("invalid grpc endpoint. endpoint must be in the format of host:port")
 
-        self.client = pyband.Client.from_endpoint(grpc_endpoint, port)
+        self.client = pyband.Client.from_endpoint(grpc_endpoint, port, ssl=ssl)
         self.channel = self.client.__channel
 
+        self.chain_id: str | None = None
+        self.request_tx_builders: dict[tuple, RequestTxBuilder] = {}
+        self.broadcast_lock = asyncio.Lock()
+        # address -> (account number, sequence of its next transaction), used and updated under broadcast_lock
+        self.accounts: dict[str, tuple[int, int]] = {}
+        # merges identical reads in flight and limits the request rate to the endpoint
+        self.gate = RpcGate("band", rate_limit, rate_burst)
+        # request transactions get the gas limit of their simulation instead of the fixed one of the tx params
+        self.gas_estimator = (
+            GasEstimator(gas_adjustment, gas_estimate_ttl, max_gas_limit) if gas_adjustment > 0 else None
+        )
+        # estimate keys of the request transactions sent and not yet looked up, to drop those that ran out of gas
+        self.estimated_txs: OrderedDict[str, Hashable] = OrderedDict()
+        # block hashes never change, so each is only fetched once. Proofs are not cached: a task that is retried
+        # sends a new request, and a proof that is fetched again was rejected.
+        self.block_hash_cache = block_hash_cache if block_hash_cache is not None else BlockHashCache()
+
+    @timed("band.request_vrf")
     async def request_vrf(
         self,
         oracle_script_id: int,
         worker_address: str,
-        seed: str,
+        seed: bytes,
         time: int,
         tx_params: TxParams,
         signer: Wallet,
@@ -44,7 +140,7 @@ class Client:
         Args:
             oracle_script_id (int): The ID of the oracle script to request VRF from.
             worker_address (str): Worker address.
-            seed (str): Seed.
+            seed (bytes): Seed.
             time (int): Time.
             request_params (OracleRequestParams): The parameters for the transaction.
             signer (PrivateKey): Signer.
@@ -56,51 +152,89 @@ class Client:
             Exception: Account not found.
             Exception: Transaction failed.
         """
-        address = signer.get_address().to_acc_bech32()
-        account = await self.client.get_account(address)
-        if account is None:
-            raise Exception("Account not found")
+        calldata = encode_vrf_calldata(seed, time, bytes.fromhex(worker_address[2:]))
+        return await self._send_requests(oracle_script_id, [calldata], tx_params, signer)
 
-        try:
-            calldata = VRF_OBI.encode(
-                {
-                    "seed": list(bytes.fromhex(seed)),
-                    "time": time,
-                    "worker_address": list(bytes.fromhex(worker_address[2:])),
-                }
-            )
+    async def _send_requests(
+        self, oracle_script_id: int, calldatas: list[bytes], tx_params: TxParams, signer: Wallet
+    ) -> TxResponse:
+        address = signer.get_address().to_acc_bech32()
 
-            msg = MsgRequestData(
-                oracle_script_id=oracle_script_id,
-                calldata=calldata,
-                ask_count=tx_params.ask_count,
-                min_count=tx_params.min_count,
-                client_id="vrf_worker",
-                prepare_gas=tx_params.prepare_gas,
-                execute_gas=tx_params.execute_gas,
-                sender=address,
-                fee_limit=[Coin(amount=str(tx_params.ds_fee_limit), denom="uband")],
-            )
+        # The account sequence queried from a node only counts the transactions of committed blocks, so requests
+        # sent before the next block would all reuse it. It is read once, counted up locally for every transaction
+        # accepted into the mempool, and read again only when a transaction is rejected for its sequence.
+        async with self.broadcast_lock:
+            if address not in self.accounts:
+                account = await self.gate.call_async(None, PRIORITY_HIGH, lambda: self.client.get_account(address))
+                if account is None:
+                    raise Exception("Account not found")
+                self.accounts[address] = (account.account_number, account.sequence)
+            (account_number, sequence) = self.accounts[address]
 
-            chain_id = await self.client.get_chain_id()
+            builder = await self._get_request_tx_builder(oracle_script_id, tx_params, signer, address, account_number)
+            # the gas used depends on the oracle script and the number and size of the messages
+            key = (oracle_script_id, astuple(tx_params), tuple(len(calldata) for calldata in calldatas))
+            gas_limit = tx_params.gas_limit
+            if self.gas_estimator is not None:
+                gas_limit = await self.gas_estimator.estimate(
+                    key,
+                    tx_params.gas_limit,
+                    lambda: self._simulate(builder.build_many(calldatas, sequence)),
+                )
+            payload = builder.build_many(calldatas, sequence, gas_limit)
 
-            tx = Transaction(
-                msgs=[msg],
-                account_num=account.account_number,
-                sequence=account.sequence,
-                chain_id=chain_id,
-                gas_price=tx_params.gas_price,
-                gas_limit=tx_params.gas_limit,
-                memo="",
-            )
+            try:
+                tx_resp = await self.gate.call_async(
+                    None, PRIORITY_HIGH, lambda: self.client.send_tx_sync_mode(payload)
+                )
+            except BaseException:
+                # the transaction may or may not have been accepted
+                del self.accounts[address]
+                raise
+            if tx_resp.code == 0:
+                self.accounts[address] = (account_number, sequence + 1)
+            elif tx_resp.code == SEQUENCE_MISMATCH_CODE:
+                # the node tells the sequence it expects, counting its mempool, otherwise it is read again
+                expected = SEQUENCE_MISMATCH_PATTERN.search(tx_resp.raw_log)
+                if expected is not None:
+                    self.accounts[address] = (account_number, int(expected.group(1)))
+                else:
+                    del self.accounts[address]
+            self._track_gas(key, tx_resp)
+            return tx_resp
 
-            payload = signer.sign_and_build(tx)
+    async def _simulate(self, tx: bytes) -> int:
+        resp = await self.gate.call_async(None, PRIORITY_HIGH, lambda: self.client.simulate_tx(tx))
+        return resp.gas_info.gas_used
 
-            return await self.client.send_tx_sync_mode(payload)
+    def _track_gas(self, key: Hashable, tx_resp: TxResponse) -> None:
+        """Drops the gas estimate of a transaction that ran out of gas, or remembers it until the tx is looked up."""
+        if self.gas_estimator is None:
+            return
+        if tx_resp.code == OUT_OF_GAS_CODE:
+            self.gas_estimator.invalidate(key)
+        elif tx_resp.code == 0:
+            self.estimated_txs[tx_resp.txhash] = key
+            if len(self.estimated_txs) > 1000:
+                self.estimated_txs.popitem(last=False)
 
-        except Exception as e:
-            raise e
+    async def _get_request_tx_builder(
+        self,
+        oracle_script_id: int,
+        tx_params: TxParams,
+        signer: Wallet,
+        address: str,
+        account_number: int,
+    ) -> RequestTxBuilder:
+        key = (address, oracle_script_id, astuple(tx_params), account_number)
+        if key not in self.request_tx_builders:
+            chain_id = await self._get_chain_id()
+            self.request_tx_builders[key] = RequestTxBuilder(
+                signer, oracle_script_id, tx_params, chain_id, account_number
+            )
+        return self.request_tx_builders[key]
 
+    @timed("band.get_transaction")
     async def get_transaction(self, tx_hash: str, timeout: int = 30) -> TxResponse:
         """Get a transaction response from BandChain.
 
@@ -117,59 +251,101 @@ class Client:
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                return await self.client.get_tx_response(tx_hash)
+                tx_resp = await self.gate.call_async(
+                    ("tx", tx_hash), PRIORITY_NORMAL, lambda: self.client.get_tx_response(tx_hash)
+                )
+                key = self.estimated_txs.pop(tx_hash, None)
+                if key is not None and tx_resp.code == OUT_OF_GAS_CODE:
+                    self.gas_estimator.invalidate(key)
+                return tx_resp
             except Exception:
                 await asyncio.sleep(1)
         raise Exception(f"Transaction `{tx_hash}` not found after timeout")
 
-    async def get_evm_proof_and_block_hash(self, request_id: int, timeout: int = 60) -> tuple[bytes, bytes]:
+    @timed("band.get_evm_proof_and_block_hash")
+    async def get_evm_proof_and_block_hash(
+        self,
+        request_id: int,
+        timeout: int = 60,
+        on_result: Optional[Callable[[Result], None]] = None,
+        refresh: bool = False,
+    ) -> tuple[bytes, bytes]:
         """Gets the evm proof and block hash from the request id.
 
         Args:
             request_id (int): The request id.
             timeout (int): The timeout for the request in seconds.
+            on_result (Optional[Callable[[Result], None]]): Called with the result of the request once it is
+                resolved, or with the last one seen, still open, on timeout.
+            refresh (bool): Fetch the block hash again instead of using the cached one, e.g. because the proof was
+                rejected, and replace it in the cache.
 
         Returns:
             tuple: (evm_proof_bytes, block_hash)
         """
         start_time = time.time()
+        result = None
+        reported = on_result is None
         while time.time() - start_time < timeout:
-            asyncio.sleep(1)
             try:
                 # Get initial proof
-                proof_request = ProofRequest(request_id=request_id)
-                resp = await self.client.get_proof(proof_request)
-                resolve_status = resp.result.proof.oracle_data_proof.result.resolve_status
-                match resolve_status:
+                resp = await self._get_proof(request_id)
+                result = resp.result.proof.oracle_data_proof.result
+                if result.resolve_status != ResolveStatus.OPEN_UNSPECIFIED and not reported:
+                    on_result(result)
+                    reported = True
+                match result.resolve_status:
                     case ResolveStatus.OPEN_UNSPECIFIED:
+                        await asyncio.sleep(1)
                         continue
                     case ResolveStatus.SUCCESS:
                         pass
                     case ResolveStatus.FAILURE:
-                        raise Exception("request for request id {request_id} has failed")
+                        raise Exception(f"request for request id {request_id} has failed")
                     case ResolveStatus.EXPIRED:
-                        raise Exception("request for request id {request_id} is expired")
+                        raise Exception(f"request for request id {request_id} is expired")
 
                 # Set block height to the next block after request is resolved
                 block_height = resp.result.proof.oracle_data_proof.version + 1
 
                 # Get proof at block height
-                proof_request = ProofRequest(request_id=request_id, height=block_height)
-                resp = await self.client.get_proof(proof_request)
+                resp = await self._get_proof(request_id, block_height)
                 evm_proof_bytes = resp.result.evm_proof_bytes
 
-                block_response = await self.client.tendermint_service_stub.get_block_by_height(
-                    GetBlockByHeightRequest(height=block_height)
-                )
-
-                block_hash = block_response.block_id.hash
-                return (evm_proof_bytes, block_hash)
+                return (evm_proof_bytes, await self._get_block_hash(block_height, refresh))
             except grpclib.exceptions.GRPCError as e:
                 if e.status == grpclib.const.Status.UNKNOWN:
-                    pass
+                    await asyncio.sleep(1)
                 else:
                     raise e
             except Exception as e:
                 raise e
 
+        if result is not None and not reported:
+            on_result(result)
         raise Exception(f"Failed to get evm proof and block hash for request id {request_id} after timeout")
+
+    async def _get_block_hash(self, height: int, refresh: bool = False) -> bytes:
+        chain_id = await self._get_chain_id()
+        block_hash = None if refresh else await self.block_hash_cache.get(chain_id, height)
+        if block_hash is None:
+            block_response = await self.gate.call_async(
+                ("block", height),
+                PRIORITY_NORMAL,
+                lambda: self.client.tendermint_service_stub.get_block_by_height(GetBlockByHeightRequest(height=height)),
+            )
+            block_hash = block_response.block_id.hash
+            await self.block_hash_cache.put(chain_id, height, block_hash)
+        return block_hash
+
+    async def _get_chain_id(self) -> str:
+        if self.chain_id is None:
+            self.chain_id = await self.gate.call_async(("chain_id",), PRIORITY_NORMAL, self.client.get_chain_id)
+        return self.chain_id
+
+    async def _get_proof(self, request_id: int, height: int = 0):
+        return await self.gate.call_async(
+            ("proof", request_id, height),
+            PRIORITY_NORMAL,
+            lambda: self.client.get_proof(ProofRequest(request_id=request_id, height=height)),
+        )
@@ -0,0 +1,146 @@
+from dataclasses import replace
+from math import ceil
+from typing import Optional
+
+from logbook import Logger
+from pyband.proto.band.oracle.v1 import ResolveStatus, Result
+
+from vrf_worker.band.types import TxParams
+from vrf_worker.metrics import METRICS, Metrics
+
+RESOLVE_STATUS_NAMES = {
+    ResolveStatus.SUCCESS: "success",
+    ResolveStatus.FAILURE: "failure",
+    ResolveStatus.EXPIRED: "expired",
+    # a request still open when the worker stopped waiting for it
+    ResolveStatus.OPEN_UNSPECIFIED: "timeout",
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Returns the nearest-rank `q` percentile, 0 to 1, of a non-empty list of values."""
+    ordered = sorted(values)
+    return ordered[max(ceil(q * len(ordered)) - 1, 0)]
+
+
+class CountController:
+    """Adjusts the ask and min counts of VRF requests to resolve them within a target time for the lowest fee.
+
+    The settings within the bounds are ordered from the cheapest to the fastest: by ask count, since data source
+    fees are paid for every validator asked, then by decreasing min count, since a request resolves once min count
+    of them report. Once `window` requests sent with the current setting have resolved, the controller steps one
+    setting up if their p95 resolve time is over `target` or more than `max_failure_rate` of them failed, expired or
+    timed out, and one setting down if the p95 is under `headroom` times the target and few enough failed.
+    """
+
+    def __init__(
+        self,
+        ask_count: int,
+        min_count: int,
+        ask_bounds: tuple[int, int],
+        min_bounds: tuple[int, int],
+        target: float,
+        window: int = 20,
+        max_failure_rate: float = 0.05,
+        headroom: float = 0.6,
+        logger: Logger = Logger("vrf_worker.counts", 11),
+        metrics: Metrics = METRICS,
+    ) -> None:
+        (min_ask, max_ask) = ask_bounds
+        (min_min, max_min) = min_bounds
+        if not 1 <= min_min <= max_min or not min_ask <= max_ask:
+            raise Exception(f"invalid count bounds: ask count {ask_bounds}, min count {min_bounds}")
+
+        self.settings = [
+            (ask, min_count)
+            for ask in range(min_ask, max_ask + 1)
+            for min_count in range(min(max_min, ask), min_min - 1, -1)
+        ]
+        if not self.settings:
+            raise Exception(f"no min count in {min_bounds} is at most an ask count in {ask_bounds}")
+
+        self.target = target
+        self.window = window
+        self.max_failure_rate = max_failure_rate
+        self.headroom = headroom
+        self.logger = logger
+        self.metrics = metrics
+
+        # start from the configured counts brought within the bounds, or the cheapest setting
+        ask_count = min(max(ask_count, min_ask), max_ask)
+        start = (ask_count, min(max(min_count, min_min), max_min, ask_count))
+        self.level = self.settings.index(start) if start in self.settings else 0
+        self.latencies: list[float] = []
+        self.failures = 0
+        self._export()
+
+    @property
+    def counts(self) -> tuple[int, int]:
+        """The ask count and min count to request with."""
+        return self.settings[self.level]
+
+    def tx_params(self, tx_params: TxParams) -> TxParams:
+        """Returns the tx params with the current ask count and min count."""
+        (ask_count, min_count) = self.counts
+        return replace(tx_params, ask_count=ask_count, min_count=min_count)
+
+    def observe(self, result: Result) -> None:
+        """Records how a request resolved, and adjusts the counts once enough requests with the current ones did.
+
+        Args:
+            result (Result): The result of the request on BandChain, open if it timed out.
+        """
+        status = RESOLVE_STATUS_NAMES.get(result.resolve_status, "timeout")
+        self.metrics.inc("vrf_worker_band_requests_resolved_total", status=status)
+        # requests sent before the last adjustment say nothing about the current counts
+        if (result.ask_count, result.min_count) != self.counts:
+            return
+
+        if result.resolve_status == ResolveStatus.SUCCESS:
+            latency = max(result.resolve_time - result.request_time, 0)
+            self.latencies.append(latency)
+            self.metrics.inc("vrf_worker_band_resolve_seconds_total", latency)
+        else:
+            self.failures += 1
+
+        if len(self.latencies) + self.failures >= self.window:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        observed = len(self.latencies) + self.failures
+        failure_rate = self.failures / observed
+        p95: Optional[float] = percentile(self.latencies, 0.95) if self.latencies else None
+        if p95 is not None:
+            self.metrics.set("vrf_worker_band_resolve_p95_seconds", p95)
+        self.metrics.set("vrf_worker_band_request_failure_rate", failure_rate)
+        self.latencies.clear()
+        self.failures = 0
+
+        if failure_rate > self.max_failure_rate or p95 is None or p95 > self.target:
+            step = 1
+        elif p95 < self.target * self.headroom:
+            step = -1
+        else:
+            return
+
+        level = min(max(self.level + step, 0), len(self.settings) - 1)
+        if level == self.level:
+            return
+
+        (old, self.level) = (self.counts, level)
+        direction = "up" if step > 0 else "down"
+        self.metrics.inc("vrf_worker_band_count_adjustments_total", direction=direction)
+        self._export()
+        self.logger.info(
+            "Adjusted ask/min count from {}/{} to {}/{}: p95 resolve time {}s against a target of {}s, {:.0%} failed",
+            *old,
+            *self.counts,
+            "n/a" if p95 is None else f"{p95:.0f}",
+            self.target,
+            failure_rate,
+        )
+
+    def _export(self) -> None:
+        (ask_count, min_count) = self.counts
+        self.metrics.set("vrf_worker_band_ask_count", ask_count)
+        self.metrics.set("vrf_worker_band_min_count", min_count)
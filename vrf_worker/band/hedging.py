@@ -0,0 +1,69 @@
+import time
+from collections import deque
+from math import ceil
+
+from vrf_worker.band.counts import percentile
+from vrf_worker.band.types import TxParams
+from vrf_worker.metrics import METRICS, Metrics
+
+
+def request_fee(tx_params: TxParams) -> int:
+    """Returns the most a VRF request can cost in uband: its transaction fee and its data source fee limit."""
+    return ceil(tx_params.gas_limit * tx_params.gas_price) + tx_params.ds_fee_limit
+
+
+class HedgePolicy:
+    """Decides when a VRF request that is slow to resolve is hedged with a second one, within a fee budget.
+
+    A request is hedged once it has waited longer than the `percentile` of the last `window` proof wait times,
+    kept between `min_delay` and `max_delay` seconds, and `max_delay` until `min_samples` of them are known. Hedges
+    are sent while the most they can cost over the last minute stays within `fee_budget` uband.
+    """
+
+    def __init__(
+        self,
+        fee_budget: int,
+        percentile: float = 0.95,
+        min_delay: float = 10,
+        max_delay: float = 30,
+        window: int = 200,
+        min_samples: int = 20,
+        metrics: Metrics = METRICS,
+    ) -> None:
+        self.fee_budget = fee_budget
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.metrics = metrics
+
+        self.latencies: deque[float] = deque(maxlen=window)
+        # (time, fee) of the hedges sent in the last minute
+        self.spent: deque[tuple[float, int]] = deque()
+
+    def delay(self) -> float:
+        """Returns how long to wait for a request to resolve before hedging it."""
+        if len(self.latencies) < self.min_samples:
+            delay = self.max_delay
+        else:
+            delay = min(max(percentile(list(self.latencies), self.percentile), self.min_delay), self.max_delay)
+        self.metrics.set("vrf_worker_band_hedge_delay_seconds", delay)
+        return delay
+
+    def observe(self, latency: float) -> None:
+        """Records how long the proof of a request took to be ready."""
+        self.latencies.append(latency)
+
+    def try_spend(self, tx_params: TxParams) -> bool:
+        """Returns whether a hedge request fits in the fee budget, and if so counts its fee against it."""
+        now = time.monotonic()
+        while self.spent and now - self.spent[0][0] >= 60:
+            self.spent.popleft()
+
+        fee = request_fee(tx_params)
+        if sum(spent for _, spent in self.spent) + fee > self.fee_budget:
+            self.metrics.inc("vrf_worker_band_hedges_total", result="over_budget")
+            return False
+        self.spent.append((now, fee))
+        self.metrics.inc("vrf_worker_band_hedge_fees_total", fee)
+        return True
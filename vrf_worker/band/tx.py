@@ -0,0 +1,151 @@
+import struct
+from math import ceil
+from typing import Optional
+
+from betterproto.lib.google.protobuf import Any as AnyProto
+from pyband.messages.band.oracle.v1 import MsgRequestData
+from pyband.proto.cosmos.base.v1beta1 import Coin
+from pyband.proto.cosmos.tx.signing.v1beta1 import SignMode
+from pyband.proto.cosmos.tx.v1beta1 import AuthInfo, Fee, ModeInfo, ModeInfoSingle, SignDoc, SignerInfo, TxBody
+from pyband.wallet import Wallet
+
+from vrf_worker.band.types import TxParams
+
+CLIENT_ID = "vrf_worker"
+
+
+def encode_vrf_calldata(seed: bytes, time: int, worker_address: bytes) -> bytes:
+    """OBI encodes the `{seed:[u8],time:u64,worker_address:[u8]}` VRF input.
+
+    Produces the same bytes as `VRF_OBI.encode` without converting the byte strings to lists of ints.
+
+    Args:
+        seed (bytes): Seed.
+        time (int): Time.
+        worker_address (bytes): Worker address.
+
+    Returns:
+        bytes: The encoded calldata.
+    """
+    return struct.pack(
+        f">I{len(seed)}sQI{len(worker_address)}s", len(seed), seed, time, len(worker_address), worker_address
+    )
+
+
+class RequestTxBuilder:
+    """Builds signed `MsgRequestData` transactions from precomputed templates.
+
+    Everything but the calldata, the account sequence, the gas limit and the signature is the same for every request
+    from one worker, so the protobuf encoding of those parts is computed once and the transaction is assembled by
+    concatenation. The output is identical to building a `Transaction` and signing it with `Wallet.sign_and_build`.
+    """
+
+    def __init__(
+        self,
+        signer: Wallet,
+        oracle_script_id: int,
+        tx_params: TxParams,
+        chain_id: str,
+        account_number: int,
+        memo: str = "",
+    ) -> None:
+        if signer._sign_mode != SignMode.DIRECT:
+            raise Exception("request tx builder only supports direct sign mode")
+
+        self.signer = signer
+        address = signer.get_address().to_acc_bech32()
+
+        # MsgRequestData fields are serialized in field order and calldata is field 2, so the message is split into
+        # the part before and after it.
+        msg = MsgRequestData(
+            ask_count=tx_params.ask_count,
+            min_count=tx_params.min_count,
+            client_id=CLIENT_ID,
+            prepare_gas=tx_params.prepare_gas,
+            execute_gas=tx_params.execute_gas,
+            sender=address,
+            fee_limit=[Coin(amount=str(tx_params.ds_fee_limit), denom="uband")],
+        )
+        self._msg_prefix = bytes(MsgRequestData(oracle_script_id=oracle_script_id))
+        self._msg_suffix = bytes(msg)
+        self._type_url_field = _field(1, msg.type_url.encode())
+        self._memo_field = bytes(TxBody(memo=memo))
+
+        public_key = AnyProto(
+            type_url="/cosmos.crypto.secp256k1.PubKey", value=bytes(signer.get_public_key().to_public_key_proto())
+        )
+        self._signer_info = bytes(
+            SignerInfo(public_key=public_key, mode_info=ModeInfo(ModeInfoSingle(mode=SignMode.DIRECT)))
+        )
+        self.gas_limit = tx_params.gas_limit
+        self.gas_price = tx_params.gas_price
+        self._fee_fields: dict[int, bytes] = {}
+        self._sign_doc_suffix = bytes(SignDoc(chain_id=chain_id, account_number=account_number))
+
+    def build(self, calldata: bytes, sequence: int, gas_limit: Optional[int] = None) -> bytes:
+        """Builds and signs a request transaction.
+
+        Args:
+            calldata (bytes): The OBI encoded oracle script calldata.
+            sequence (int): The account sequence.
+            gas_limit (Optional[int]): The gas limit, by default the one of the tx params.
+
+        Returns:
+            bytes: The signed transaction, ready to broadcast.
+        """
+        return self.build_many([calldata], sequence, gas_limit)
+
+    def build_many(self, calldatas: list[bytes], sequence: int, gas_limit: Optional[int] = None) -> bytes:
+        """Builds and signs a transaction with one request per calldata.
+
+        Args:
+            calldatas (list[bytes]): The OBI encoded oracle script calldata of each request.
+            sequence (int): The account sequence.
+            gas_limit (Optional[int]): The gas limit, by default the one of the tx params.
+
+        Returns:
+            bytes: The signed transaction, ready to broadcast.
+        """
+        if not calldatas:
+            raise Exception("a request transaction needs at least one message")
+
+        msgs = (self._msg_prefix + _field(2, calldata) + self._msg_suffix for calldata in calldatas)
+        body = b"".join(_field(1, self._type_url_field + _field(2, msg)) for msg in msgs) + self._memo_field
+
+        signer_info = self._signer_info + (_key(3, 0) + _varint(sequence) if sequence else b"")
+        auth_info = _field(1, signer_info) + self._fee_field(gas_limit or self.gas_limit)
+
+        body_field = _field(1, body)
+        auth_info_field = _field(2, auth_info)
+        signature = self.signer._signer.sign(body_field + auth_info_field + self._sign_doc_suffix)
+
+        return body_field + auth_info_field + _field(3, signature)
+
+    def _fee_field(self, gas_limit: int) -> bytes:
+        if gas_limit not in self._fee_fields:
+            if len(self._fee_fields) >= 64:
+                self._fee_fields.clear()
+            fee = Fee(
+                amount=[Coin(amount=str(ceil(gas_limit * self.gas_price)), denom="uband")],
+                gas_limit=gas_limit,
+            )
+            self._fee_fields[gas_limit] = bytes(AuthInfo(fee=fee))
+        return self._fee_fields[gas_limit]
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Encodes a length-delimited protobuf field."""
+    return _key(number, 2) + _varint(len(payload)) + payload
+
+
+def _key(number: int, wire_type: int) -> bytes:
+    return _varint(number << 3 | wire_type)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
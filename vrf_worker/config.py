@@ -1,18 +1,47 @@
-from dataclasses import dataclass
-from typing import Literal
+from dataclasses import dataclass, field
+from typing import Literal, Optional
 
 
 @dataclass
 class BandConfig:
     grpc_endpoint: str
     mnemonic: str
+    grpc_ssl: bool = True
     min_count: int = 2
     ask_count: int = 3
     prepare_gas: int = 100000
     execute_gas: int = 400000
     ds_fee_limit: int = 48
+    # request txs are simulated, and get the gas used times gas_adjustment as their limit, up to max_gas_limit.
+    # Simulations are cached for gas_estimate_ttl seconds. gas_limit is used when a simulation fails, or for every
+    # tx if gas_adjustment is 0
     gas_limit: int = 800000
     gas_price: float = 0.0025
+    gas_adjustment: float = 1.3
+    gas_estimate_ttl: float = 600
+    max_gas_limit: int = 2_000_000
+    # ask_count and min_count are adjusted within these bounds to keep the p95 resolve time of the last
+    # count_window requests under target_resolve_time seconds for the lowest fee, 0 to keep them fixed
+    target_resolve_time: float = 0
+    ask_count_bounds: list[int] = field(default_factory=lambda: [3, 6])
+    min_count_bounds: list[int] = field(default_factory=lambda: [2, 2])
+    count_window: int = 20
+    max_failure_rate: float = 0.05
+    # a request not resolved after the hedge_percentile of recent proof wait times, between hedge_min_delay and
+    # hedge_max_delay seconds, gets a second request for the same seed and time, while the most the hedges can cost
+    # over the last minute stays within hedge_fee_budget uband, 0 to disable
+    hedge_fee_budget: int = 0
+    hedge_percentile: float = 0.95
+    hedge_min_delay: float = 10
+    hedge_max_delay: float = 30
+    # the hashes of block_hash_cache_size blocks are kept in memory, and with a block_hash_cache_path, of
+    # block_hash_cache_persistent_size blocks in a SQLite database shared by the workers on a host
+    block_hash_cache_size: int = 256
+    block_hash_cache_path: Optional[str] = None
+    block_hash_cache_persistent_size: int = 10000
+    # requests per second to the gRPC endpoint with bursts of up to grpc_rate_burst, 0 for no limit
+    grpc_rate_limit: float = 0
+    grpc_rate_burst: int = 10
 
 
 @dataclass
@@ -26,9 +55,71 @@ class EvmConfig:
     whitelisted_callers: list[str]
     start_nonce: int = 0
     eip1559: bool = True
+    # requests per second to the RPC endpoint with bursts of up to rpc_rate_burst, 0 for no limit
+    rpc_rate_limit: float = 0
+    rpc_rate_burst: int = 10
+    # relay transactions still pending after target_inclusion_time seconds are replaced with fees raised by
+    # fee_bump_percent, up to max_fee_per_gas wei (4 times the initial fee by default); 0 disables replacement
+    target_inclusion_time: float = 0
+    fee_bump_percent: float = 12.5
+    max_fee_per_gas: Optional[int] = None
+    caller_weights: dict[str, float] = field(default_factory=dict)
+    caller_max_in_flight: dict[str, int] = field(default_factory=dict)
+    # "proof" relays every proof with its signatures, "block" relays each BandChain block once with relayBlock and
+    # then relays the proofs for it without signatures
+    relay_mode: str = "proof"
+    # how to choose the signatures kept in a proof: "power" takes the most powerful validators, "gas" minimizes the
+    # estimated calldata and verification gas of the signatures
+    signature_selection: str = "power"
+    # check every proof against the block hash and the Bridge validator set before relaying it, and retry the task
+    # like on a proof error instead of relaying one the Bridge would reject
+    verify_proofs: bool = True
+    # address of an aggregate3 batch relayer contract; proofs ready within batch_window seconds of each other are
+    # relayed together, up to batch_max_size proofs and batch_gas_cap gas per transaction
+    batch_relayer_address: Optional[str] = None
+    batch_window: float = 2.0
+    batch_max_size: int = 20
+    batch_gas_cap: int = 10_000_000
+
+
+@dataclass
+class WorkerConfig:
+    concurrency: int = 1
+    fee_per_second: int = 10**12
+    max_fee_bonus: float = 300
+    retry_penalty: float = 30
+    starvation_age: float = 900
+    metrics_port: Optional[int] = None
+    max_in_memory_tasks: int = 10000
+    spill_path: Optional[str] = None
+    snapshot_path: Optional[str] = None
+    # seconds between checks for tasks in progress that were resolved by someone else, 0 to disable
+    reconcile_interval: float = 2.0
+    # stalls of the event loop longer than this many seconds are logged with what caused them, 0 to disable
+    loop_lag_threshold: float = 0
+    # SIGUSR1 writes a profile of this many seconds to profile_dir. With profile_endpoint, GET
+    # /debug/profile?seconds=N on the metrics port, which anyone who can reach it may call, returns one of up to
+    # profile_seconds
+    profile_seconds: float = 30
+    profile_dir: str = "."
+    profile_endpoint: bool = False
+    # `main.py backfill` reads nonces from the lens contract backfill_chunk_size at a time and processes up to
+    # backfill_concurrency tasks at once
+    backfill_concurrency: int = 32
+    backfill_chunk_size: int = 200
+    # logs are written by a background thread, as "text" or one JSON object per line with the nonce, stage and
+    # duration of task lines as fields. Up to log_queue_size lines wait for it, 0 for no limit, and more are dropped
+    # unless log_queue_block is set. Beyond log_sample_limit of the same warning or error per log_sample_window
+    # seconds, lines are counted instead of logged, 0 to disable
+    log_format: str = "text"
+    log_queue_size: int = 10000
+    log_queue_block: bool = False
+    log_sample_limit: int = 10
+    log_sample_window: float = 60
 
 
 @dataclass
 class Config:
     evm_chain_config: EvmConfig
     band_chain_config: BandConfig
+    worker_config: WorkerConfig = field(default_factory=WorkerConfig)
@@ -64,6 +64,17 @@ VRF_LENS_ABI = [
 ]
 
 BRIDGE_ABI = [
+    {
+        "inputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "name": "blockDetails",
+        "outputs": [
+            {"internalType": "bytes32", "name": "oracleState", "type": "bytes32"},
+            {"internalType": "uint64", "name": "timeSecond", "type": "uint64"},
+            {"internalType": "uint32", "name": "timeNanoSecondFraction", "type": "uint32"},
+        ],
+        "stateMutability": "view",
+        "type": "function",
+    },
     {
         "inputs": [],
         "name": "encodedChainID",
@@ -205,3 +216,43 @@ BRIDGE_ABI = [
         "type": "function",
     },
 ]
+
+# A batch relayer contract owned by the worker account, which forwards it the task fees the VRF Provider pays to
+# msg.sender: the aggregate3 function of Multicall3 and the owner function of Ownable.
+BATCH_RELAYER_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    },
+    {
+        "inputs": [],
+        "name": "owner",
+        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+        "stateMutability": "view",
+        "type": "function",
+    },
+]
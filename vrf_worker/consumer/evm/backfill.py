@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+from logbook import Logger
+
+from vrf_worker.types import TaskRecord
+
+from .worker import Worker
+
+
+@dataclass
+class BackfillState:
+    """Progress of a backfill of the nonces `start` to `end`, inclusive, saved so that it can be resumed."""
+
+    start: int
+    end: int
+    # every nonce below this one is done
+    next_nonce: int
+    relayed: int = 0
+    resolved: int = 0
+    not_whitelisted: int = 0
+    failed: list[int] = field(default_factory=list)
+
+
+def load_backfill_state(path: str, start: int, end: int) -> BackfillState:
+    """Loads the state of a backfill of the same range from `path`, or returns a new one."""
+    try:
+        with open(path) as f:
+            state = BackfillState(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return BackfillState(start, end, start)
+
+    return state if (state.start, state.end) == (start, end) else BackfillState(start, end, start)
+
+
+def save_backfill_state(path: str, state: BackfillState) -> None:
+    """Atomically writes the state of a backfill to `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(asdict(state), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Backfill:
+    """Processes every unresolved task in a range of nonces, e.g. to catch up after an outage.
+
+    The range is read from the lens contract `chunk_size` nonces at a time, and the tasks that are unresolved and
+    from a whitelisted caller go through the worker's request, proof and relay stages, up to `concurrency` of them
+    at once. A task is tried up to `max_retries` times. Progress is logged and saved to `state_path` every
+    `progress_interval` seconds and on exit, and a backfill of the same range started later resumes from it,
+    trying the nonces that failed before first.
+    """
+
+    def __init__(
+        self,
+        worker: Worker,
+        start: int,
+        end: int,
+        state_path: str,
+        chunk_size: int = 200,
+        concurrency: int = 32,
+        logger: Logger = Logger("vrf_worker.backfill", 11),
+        progress_interval: float = 10,
+    ) -> None:
+        if end < start:
+            raise Exception(f"invalid nonce range: {start} to {end}")
+
+        self.worker = worker
+        self.state_path = state_path
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.logger = logger
+        self.progress_interval = progress_interval
+
+        self.state = load_backfill_state(state_path, start, end)
+        # nonces read from the contract that are not done yet, and the nonce to read from next
+        self.outstanding: set[int] = set()
+        self.scanned_to = self.state.next_nonce
+        self.completed = 0
+
+    async def run(self) -> BackfillState:
+        """Runs the backfill to the end of the range.
+
+        Returns:
+            BackfillState: The final state.
+        """
+        state = self.state
+        if state.next_nonce > state.start or state.failed:
+            self.logger.info("Resuming backfill from nonce {}, retrying {} failed", state.next_nonce, len(state.failed))
+        await self.worker.bootstrap()
+
+        started_at = time.monotonic()
+        progress = asyncio.create_task(self._report_progress(started_at))
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: set[asyncio.Task] = set()
+        try:
+            # failed nonces stay failed until they are relayed, so that they are not lost if this is interrupted
+            retry = list(state.failed)
+            chunks = [retry[i : i + self.chunk_size] for i in range(0, len(retry), self.chunk_size)]
+            for nonces in chunks:
+                await self._process_chunk(nonces, slots, tasks)
+
+            while self.scanned_to <= state.end:
+                nonces = list(range(self.scanned_to, min(self.scanned_to + self.chunk_size, state.end + 1)))
+                self.outstanding.update(nonces)
+                self.scanned_to = nonces[-1] + 1
+                await self._process_chunk(nonces, slots, tasks)
+
+            await asyncio.gather(*tasks)
+        finally:
+            progress.cancel()
+            for task in tasks:
+                task.cancel()
+            self._save()
+
+        elapsed = time.monotonic() - started_at
+        self.logger.info(
+            "Backfill of nonces {} to {} finished in {:.0f}s: {} relayed, {} already resolved, {} not whitelisted, "
+            "{} failed {}",
+            state.start,
+            state.end,
+            elapsed,
+            state.relayed,
+            state.resolved,
+            state.not_whitelisted,
+            len(state.failed),
+            state.failed[:20],
+        )
+        return state
+
+    async def _process_chunk(self, nonces: list[int], slots: asyncio.Semaphore, tasks: set[asyncio.Task]) -> None:
+        whitelisted_callers = self.worker.evm_config.whitelisted_callers
+        # a chunk that cannot be read fails the backfill, which can then be resumed from the last saved state
+        records = await asyncio.to_thread(self.worker.evm_client.get_task_records_by_nonces, nonces)
+
+        for is_resolved, record in records:
+            if is_resolved:
+                self.state.resolved += 1
+                self._done(record.nonce)
+            elif record.caller not in whitelisted_callers:
+                self.state.not_whitelisted += 1
+                self._done(record.nonce)
+            else:
+                await slots.acquire()
+                task = asyncio.create_task(self._process_task(record, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    async def _process_task(self, record: TaskRecord, slots: asyncio.Semaphore) -> None:
+        # a task that is cancelled is not done, and is processed again when the backfill resumes
+        relayed = False
+        try:
+            for _ in range(self.worker.max_retries):
+                if await self.worker.process_task(
+                    record, self.worker.oracle_script_id, self.worker.encoded_band_chain_id
+                ):
+                    relayed = True
+                    break
+        except Exception as e:
+            self.logger.error("Error processing nonce {}: {}", record.nonce, e)
+        finally:
+            slots.release()
+
+        if relayed:
+            self.state.relayed += 1
+            self.worker.metrics.inc("vrf_worker_backfill_tasks_total", result="relayed")
+        else:
+            self.logger.error("Failed to relay nonce {}, leaving it to a later backfill", record.nonce)
+            self.worker.metrics.inc("vrf_worker_backfill_tasks_total", result="failed")
+        self._done(record.nonce, failed=not relayed)
+
+    def _done(self, nonce: int, failed: bool = False) -> None:
+        if failed:
+            if nonce not in self.state.failed:
+                self.state.failed.append(nonce)
+        elif nonce in self.state.failed:
+            self.state.failed.remove(nonce)
+
+        self.completed += 1
+        self.outstanding.discard(nonce)
+        self.state.next_nonce = min(self.outstanding, default=self.scanned_to)
+
+    def _save(self) -> None:
+        try:
+            save_backfill_state(self.state_path, self.state)
+        except OSError as e:
+            self.logger.error("Error saving backfill state: {}", e)
+
+    async def _report_progress(self, started_at: float) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._log_progress(started_at)
+            self._save()
+
+    def _log_progress(self, started_at: float) -> None:
+        state = self.state
+        remaining = state.end + 1 - self.scanned_to + len(self.outstanding)
+        elapsed = time.monotonic() - started_at
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "unknown"
+        self.logger.info(
+            "Backfill done up to nonce {} of {}: {} relayed, {} already resolved, {} not whitelisted, {} failed, "
+            "{} in progress, {:.0f} nonces/min, ETA {}",
+            state.next_nonce - 1,
+            state.end,
+            state.relayed,
+            state.resolved,
+            state.not_whitelisted,
+            len(state.failed),
+            len(self.outstanding),
+            rate * 60,
+            eta,
+        )
@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+from eth_account.signers.base import BaseAccount
+from logbook import Logger
+
+from vrf_worker.logs import task_fields
+from vrf_worker.metrics import Metrics
+
+from .client import Client as EvmClient
+
+
+class RelayBatcher:
+    """Collects ready proofs over a short window and relays them together in one transaction.
+
+    Batches go through the `aggregate3` function of a batch relayer contract. Each batch is simulated first, so calls
+    that would fail are reported back to their tasks without costing the others. The rest are sent with failures
+    disallowed, so the transaction either relays all of them or reverts. A batch that reverts or exceeds `gas_cap`
+    is split in halves which are relayed the same way, down to a plain `relayProof` transaction for a single proof.
+
+    The VRF Provider pays task fees to `msg.sender`, which for a batch is the batch relayer contract, so it must be
+    a contract owned by the worker account that forwards them to it, not a plain Multicall3 deployment. The worker
+    checks its `owner()` at startup. Batches are relayed in tasks of their own, with the blocking client calls in
+    threads, so that the event loop keeps running while they wait for their receipts.
+    """
+
+    def __init__(
+        self,
+        client: EvmClient,
+        account: BaseAccount,
+        eip1559: bool,
+        window: float,
+        max_size: int,
+        gas_cap: int,
+        logger: Logger,
+        metrics: Metrics,
+    ) -> None:
+        self.client = client
+        self.account = account
+        self.eip1559 = eip1559
+        self.window = window
+        self.max_size = max_size
+        self.gas_cap = gas_cap
+        self.logger = logger
+        self.metrics = metrics
+
+        self._pending: list[tuple[int, bytes, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # batches being relayed, referenced until they are done
+        self._flushes: set[asyncio.Task] = set()
+
+    async def relay(self, nonce: int, proof: bytes) -> bool:
+        """Queues a proof for the next batch and waits for it to be relayed.
+
+        Args:
+            nonce (int): The task nonce.
+            proof (bytes): The proof to relay.
+
+        Returns:
+            bool: Whether the proof was relayed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((nonce, proof, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Takes the pending proofs as a batch and starts relaying it, while the next batch is collected."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # proofs of tasks cancelled while waiting are not relayed
+        (items, self._pending) = ([item for item in self._pending if not item[2].cancelled()], [])
+        if not items:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._relay_pending(items))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _relay_pending(self, items: list[tuple[int, bytes, asyncio.Future]]) -> None:
+        try:
+            results = await self._relay_items([(nonce, proof) for nonce, proof, _ in items])
+        except Exception as e:
+            self.logger.error("Error relaying batch: {}", e)
+            results = [False] * len(items)
+
+        for (_, _, future), relayed in zip(items, results):
+            if not future.done():
+                future.set_result(relayed)
+
+    async def _relay_items(self, items: list[tuple[int, bytes]]) -> list[bool]:
+        """Relays proofs in as few transactions as possible and returns whether each of them was relayed."""
+        if len(items) == 1:
+            return [await self._relay_single(*items[0])]
+
+        calls = [self.client.encode_relay_proof(proof, nonce) for nonce, proof in items]
+        try:
+            succeeded = await asyncio.to_thread(self.client.simulate_relay_batch, calls, self.account)
+        except Exception as e:
+            self.logger.error("Error simulating relay batch: {}", e)
+            succeeded = [True] * len(items)
+
+        results = [False] * len(items)
+        for (nonce, _), success in zip(items, succeeded):
+            if not success:
+                self.logger.error(
+                    "Relaying proof for nonce {} would fail, dropping it from the batch",
+                    nonce,
+                    extra=task_fields(nonce, "relay"),
+                )
+
+        batch = [i for i, success in enumerate(succeeded) if success]
+        if len(batch) == 1:
+            results[batch[0]] = await self._relay_single(*items[batch[0]])
+        elif batch:
+            relayed = await self._relay_batch([items[i] for i in batch], [calls[i] for i in batch])
+            for i, result in zip(batch, relayed):
+                results[i] = result
+        return results
+
+    async def _relay_batch(self, items: list[tuple[int, bytes]], calls: list[bytes]) -> list[bool]:
+        nonces = [nonce for nonce, _ in items]
+        try:
+            self.logger.info("Relaying VRF proofs for nonces {} in one batch", nonces)
+            tx_hash = await asyncio.to_thread(self.client.relay_batch, calls, self.account, self.eip1559, self.gas_cap)
+            if await asyncio.to_thread(self.client.get_tx_receipt_status, tx_hash) == 1:
+                self.logger.info("Successfully relayed proofs for nonces {}", nonces)
+                self.metrics.inc("vrf_worker_relay_transactions_total", kind="batch")
+                self.metrics.inc("vrf_worker_relay_batched_proofs_total", len(items))
+                return [True] * len(items)
+            self.logger.error("Relay batch for nonces {} reverted, splitting it", nonces)
+        except Exception as e:
+            self.logger.error("Error relaying batch for nonces {}, splitting it: {}", nonces, e)
+
+        half = len(items) // 2
+        return await self._relay_items(items[:half]) + await self._relay_items(items[half:])
+
+    async def _relay_single(self, nonce: int, proof: bytes) -> bool:
+        started = time.monotonic()
+        try:
+            self.logger.info("Relaying VRF proof for nonce: {}", nonce, extra=task_fields(nonce, "relay"))
+            tx_hash = await asyncio.to_thread(self.client.relay_proof, proof, nonce, self.account, self.eip1559)
+            status = await asyncio.to_thread(self.client.get_tx_receipt_status, tx_hash)
+            self.metrics.inc("vrf_worker_relay_transactions_total", kind="single")
+            if status == 1:
+                self.logger.info(
+                    "Successfully relayed proof for nonce {}", nonce, extra=task_fields(nonce, "relay", started)
+                )
+                return True
+            else:
+                self.logger.error(
+                    "Failed to relay proof for nonce {}", nonce, extra=task_fields(nonce, "relay", started)
+                )
+                return False
+        except Exception as e:
+            self.logger.error(
+                "Error relaying proof for nonce {}: {}", nonce, e, extra=task_fields(nonce, "relay", started)
+            )
+            return False
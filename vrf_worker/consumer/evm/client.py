@@ -1,5 +1,9 @@
-from typing import Dict, List, Literal, Tuple, Union
+import json
+import threading
+from functools import partial
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
+from eth_abi import decode
 from eth_account.signers.base import BaseAccount
 from eth_typing import (
     Address,
@@ -11,18 +15,78 @@ from hexbytes import (
     HexBytes,
 )
 from web3 import HTTPProvider, Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from web3.types import ENS
-
-from vrf_worker.types import Task
+from web3.middleware import ExtraDataToPOAMiddleware, Web3Middleware
+from web3.types import ENS, MakeRequestFn, RPCEndpoint, RPCResponse
+
+from vrf_worker.rpc import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    RateLimited,
+    RpcGate,
+    current_priority,
+    rpc_priority,
+)
+from vrf_worker.types import Task, TaskRecord
 
-from .abi import BRIDGE_ABI, VRF_LENS_ABI, VRF_PROVIDER_ABI
+from .abi import BATCH_RELAYER_ABI, BRIDGE_ABI, VRF_LENS_ABI, VRF_PROVIDER_ABI
+from .replacement import TransactionReplacer
+from .types import RELAY_DATA_TYPES
 
 # Custom typings
 Signature = Tuple[bytes, bytes, bytes, bytes]
 CEVP = Tuple[bytes, bytes]
 Web3Tx = Dict[str, Union[str, int]]
 
+# JSON-RPC methods that only read, so that identical requests in flight at the same time can share a response
+COALESCED_METHODS = {
+    "eth_blockNumber",
+    "eth_call",
+    "eth_chainId",
+    "eth_feeHistory",
+    "eth_gasPrice",
+    "eth_getBlockByNumber",
+    "eth_getTransactionReceipt",
+    "eth_maxPriorityFeePerGas",
+}
+# JSON-RPC methods that send transactions or wait on them, which go first unless the caller sets a priority
+HIGH_PRIORITY_METHODS = {
+    "eth_estimateGas",
+    "eth_feeHistory",
+    "eth_gasPrice",
+    "eth_getBlockByNumber",
+    "eth_getTransactionCount",
+    "eth_getTransactionReceipt",
+    "eth_maxPriorityFeePerGas",
+    "eth_sendRawTransaction",
+}
+# JSON-RPC error codes that providers answer rate limited requests with
+RATE_LIMIT_ERROR_CODES = {429, -32005}
+
+
+class RpcGateMiddleware(Web3Middleware):
+    """Sends every JSON-RPC request through an `RpcGate`, to merge identical reads and limit the request rate."""
+
+    def __init__(self, w3: Web3, gate: RpcGate) -> None:
+        super().__init__(w3)
+        self.gate = gate
+
+    def wrap_make_request(self, make_request: MakeRequestFn) -> MakeRequestFn:
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            key = (method, json.dumps(params, sort_keys=True, default=str)) if method in COALESCED_METHODS else None
+            priority = current_priority(PRIORITY_HIGH if method in HIGH_PRIORITY_METHODS else PRIORITY_NORMAL)
+
+            def send() -> RPCResponse:
+                response = make_request(method, params)
+                error = response.get("error")
+                if isinstance(error, dict) and error.get("code") in RATE_LIMIT_ERROR_CODES:
+                    raise RateLimited(f"{method} was rate limited: {error.get('message')}")
+                return response
+
+            return self.gate.call(key, priority, send)
+
+        return middleware
+
 
 class Client:
     """The class contains methods that interact with web3"""
@@ -33,18 +97,41 @@ class Client:
         vrf_provider_address: Union[Address, ChecksumAddress, ENS],
         vrf_lens_address: Union[Address, ChecksumAddress, ENS],
         bridge_address: Union[Address, ChecksumAddress, ENS],
+        check_connection: bool = True,
+        batch_relayer_address: Optional[Union[Address, ChecksumAddress, ENS]] = None,
+        target_inclusion_time: float = 0,
+        fee_bump_percent: float = 12.5,
+        max_fee_per_gas: Optional[int] = None,
+        rate_limit: float = 0,
+        rate_burst: int = 10,
     ):
         w3 = Web3(HTTPProvider(endpoint))
-        if not w3.is_connected():
-            raise Exception("unable to connect to rpc endpoint")
-
         w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        self.gate = RpcGate("evm", rate_limit, rate_burst)
+        w3.middleware_onion.inject(partial(RpcGateMiddleware, gate=self.gate), name="rpc_gate", layer=0)
 
         self.provider_contract = w3.eth.contract(vrf_provider_address, abi=VRF_PROVIDER_ABI)
         self.lens_contract = w3.eth.contract(vrf_lens_address, abi=VRF_LENS_ABI)
         self.bridge_contract = w3.eth.contract(bridge_address, abi=BRIDGE_ABI)
+        self.batch_relayer_contract = (
+            w3.eth.contract(batch_relayer_address, abi=BATCH_RELAYER_ABI) if batch_relayer_address else None
+        )
 
         self.w3 = w3
+        self.send_lock = threading.Lock()
+        self.replacer = TransactionReplacer(w3, target_inclusion_time, fee_bump_percent, max_fee_per_gas)
+
+        if check_connection:
+            self.check_connection()
+
+    def check_connection(self) -> None:
+        """Checks that the RPC endpoint is reachable.
+
+        Raises:
+            Exception: Unable to connect to rpc endpoint.
+        """
+        if not self.w3.is_connected():
+            raise Exception("unable to connect to rpc endpoint")
 
     def get_current_task_nonce_from_vrf_provider(self) -> int:
         """Retrieves the latest task nonce from the VRF Provider contract.
@@ -57,7 +144,8 @@ class Client:
             Exception: Failed to get current task nonce from vrf_provider.
         """
         try:
-            return self.provider_contract.functions.taskNonce().call()
+            with rpc_priority(PRIORITY_LOW):
+                return self.provider_contract.functions.taskNonce().call()
         except Exception as e:
             raise Exception(f"failed to get current task nonce from vrf_provider: {e}")
 
@@ -88,7 +176,8 @@ class Client:
             Exception: Failed to get tasks by nonces from lens.
         """
         try:
-            lens_tasks = self.lens_contract.functions.getTasksBulk(nonces).call()
+            with rpc_priority(PRIORITY_LOW):
+                lens_tasks = self.lens_contract.functions.getTasksBulk(nonces).call()
 
             # Convert any values with type bytes to hex
             tasks = [[e.hex() if type(e) is bytes else e for e in task] for task in lens_tasks]
@@ -98,6 +187,47 @@ class Client:
         except Exception as e:
             raise Exception(f"failed to get tasks by nonces from lens: {e}")
 
+    def get_task_records_by_nonces(self, nonces: List[int]) -> List[Tuple[bool, TaskRecord]]:
+        """Retrieves compact records of VRF request tasks given a list of task nonces.
+
+        Unlike `get_tasks_by_nonces`, the seed is kept as bytes and unused fields are dropped.
+
+        Args:
+            nonces (List[int]): A list of task nonces to filter.
+
+        Returns:
+            List[Tuple[bool, TaskRecord]]: A list of (is_resolved, task record) pairs.
+
+        Raises:
+            Exception: Failed to get tasks by nonces from lens.
+        """
+        try:
+            with rpc_priority(PRIORITY_LOW):
+                lens_tasks = self.lens_contract.functions.getTasksBulk(nonces).call()
+
+            return [
+                (is_resolved, TaskRecord(nonce, seed, time, caller, task_fee))
+                for nonce, (is_resolved, time, caller, task_fee, seed, _, _) in zip(nonces, lens_tasks)
+            ]
+
+        except Exception as e:
+            raise Exception(f"failed to get tasks by nonces from lens: {e}")
+
+    def get_block_number(self) -> int:
+        """Retrieves the latest block number.
+
+        Returns:
+            int: The latest block number.
+
+        Raises:
+            Exception: Failed to get block number.
+        """
+        try:
+            with rpc_priority(PRIORITY_LOW):
+                return self.w3.eth.block_number
+        except Exception as e:
+            raise Exception(f"failed to get block number: {e}")
+
     def get_encoded_band_chain_id_from_bridge(self) -> bytes:
         """Retrives encoded chain ID of BandChain for the Bridge contract.
 
@@ -156,44 +286,164 @@ class Client:
             Exception: Failed to relay proof.
         """
         try:
-            tx_params: Web3Tx = {}
-            if eip1559:
-                tx_params = {
-                    "from": account.address,
-                    "nonce": self.w3.eth.get_transaction_count(account.address),
-                    "maxPriorityFeePerGas": self.w3.eth.max_priority_fee,
-                }
-            else:
-                tx_params = {
-                    "from": account.address,
-                    "nonce": self.w3.eth.get_transaction_count(account.address),
-                    "gasPrice": self.w3.eth.gas_price,
-                }
-
             fn = self.provider_contract.functions.relayProof(proof, nonce)
+            return self._send_transaction(fn, account, eip1559)
+        except Exception as e:
+            raise Exception(f"failed to relay proof: {e}")
 
-            gas = fn.estimate_gas(tx_params)
-            tx_params["gas"] = gas
+    def encode_relay_proof(self, proof: bytes, nonce: int) -> bytes:
+        """Encodes a relayProof call to the VRF Provider contract.
 
-            tx = fn.build_transaction(tx_params)
-            signed_tx = account.sign_transaction(tx)
+        Args:
+            proof (bytes): the proof to relay.
+            nonce (int): the task nonce.
 
-            return self.w3.eth.send_raw_transaction(signed_tx.raw_transaction).to_0x_hex()
+        Returns:
+            bytes: The call data.
+        """
+        return bytes.fromhex(self.provider_contract.encode_abi("relayProof", [proof, nonce])[2:])
+
+    def simulate_relay_batch(self, calls: List[bytes], account: BaseAccount) -> List[bool]:
+        """Simulates relaying a batch of relayProof calls through the batch relayer contract.
+
+        Args:
+            calls (List[bytes]): relayProof call data, as returned by `encode_relay_proof`.
+            account (BaseAccount): Account that would send the transaction.
+
+        Returns:
+            List[bool]: Whether each call would succeed.
+
+        Raises:
+            Exception: Failed to simulate relay batch.
+        """
+        try:
+            fn = self.batch_relayer_contract.functions.aggregate3(
+                [(self.provider_contract.address, True, call) for call in calls]
+            )
+            return [success for success, _ in fn.call({"from": account.address})]
         except Exception as e:
-            raise Exception(f"failed to relay proof: {e}")
+            raise Exception(f"failed to simulate relay batch: {e}")
+
+    def get_batch_relayer_owner(self) -> str:
+        """Retrieves the owner of the batch relayer contract, which the task fees of batched relays are forwarded to.
+
+        Returns:
+            str: The owner address.
+
+        Raises:
+            Exception: Failed to get the owner, e.g. because the contract is not ownable.
+        """
+        try:
+            return self.batch_relayer_contract.functions.owner().call()
+        except Exception as e:
+            raise Exception(f"failed to get batch relayer owner: {e}")
+
+    def relay_batch(
+        self,
+        calls: List[bytes],
+        account: BaseAccount,
+        eip1559: bool = True,
+        gas_cap: Optional[int] = None,
+    ) -> str:
+        """Relay a batch of relayProof calls in one transaction through the batch relayer contract.
+
+        The transaction reverts unless every call succeeds.
+
+        Args:
+            calls (List[bytes]): relayProof call data, as returned by `encode_relay_proof`.
+            account (BaseAccount): Account to sign the transaction.
+            eip1559 (bool, optional): Whether to use EIP-1559 transaction format. Defaults to True.
+            gas_cap (Optional[int], optional): The most gas the transaction may use. Defaults to no cap.
+
+        Returns:
+            str: Transaction hash as a hex string.
+
+        Raises:
+            Exception: Failed to relay batch.
+        """
+        try:
+            fn = self.batch_relayer_contract.functions.aggregate3(
+                [(self.provider_contract.address, False, call) for call in calls]
+            )
+            return self._send_transaction(fn, account, eip1559, gas_cap)
+        except Exception as e:
+            raise Exception(f"failed to relay batch: {e}")
+
+    def relay_block(
+        self,
+        relay_data: bytes,
+        account: BaseAccount,
+        eip1559: bool = True,
+    ) -> str:
+        """Relay a BandChain block to the Bridge contract, so that proofs for it can be relayed without signatures.
+
+        Args:
+            relay_data (bytes): the relay data of a proof for the block.
+            account (BaseAccount): Account to sign the transaction.
+            eip1559 (bool, optional): Whether to use EIP-1559 transaction format. Defaults to True.
+
+        Returns:
+            str: Transaction hash as a hex string.
+
+        Raises:
+            Exception: Failed to relay block.
+        """
+        try:
+            fn = self.bridge_contract.functions.relayBlock(*decode(RELAY_DATA_TYPES, relay_data))
+            return self._send_transaction(fn, account, eip1559)
+        except Exception as e:
+            raise Exception(f"failed to relay block: {e}")
+
+    def get_block_detail(self, height: int) -> Tuple[bytes, int, int]:
+        """Retrieves the details the Bridge contract recorded for a relayed BandChain block.
+
+        Args:
+            height (int): The BandChain block height.
+
+        Returns:
+            Tuple[bytes, int, int]: The oracle state, time second and time nanosecond fraction of the block, which
+            are all zero if it was not relayed.
+
+        Raises:
+            Exception: Failed to get block detail from bridge.
+        """
+        try:
+            return tuple(self.bridge_contract.functions.blockDetails(height).call())
+        except Exception as e:
+            raise Exception(f"failed to get block detail from bridge: {e}")
+
+    def _send_transaction(self, fn, account: BaseAccount, eip1559: bool, gas_cap: Optional[int] = None) -> str:
+        tx_params: Web3Tx = {}
+        if eip1559:
+            tx_params = {"from": account.address, "maxPriorityFeePerGas": self.w3.eth.max_priority_fee}
+        else:
+            tx_params = {"from": account.address, "gasPrice": self.w3.eth.gas_price}
+
+        gas = fn.estimate_gas(tx_params)
+        if gas_cap is not None and gas > gas_cap:
+            raise Exception(f"estimated gas {gas} exceeds the cap of {gas_cap}")
+        tx_params["gas"] = gas
+
+        # transactions are sent from several threads, so the account nonce is read and used by one at a time,
+        # counting the transactions still pending
+        with self.send_lock:
+            tx_params["nonce"] = self.w3.eth.get_transaction_count(account.address, "pending")
+            tx = fn.build_transaction(tx_params)
+            return self.replacer.send(tx, account)
 
     def get_tx_receipt_status(self, tx_hash: Hash32 | HexBytes | HexStr) -> int:
         """Retrieves the transaction receipt.
 
+        A transaction that is not mined in time is replaced with higher fees, see `TransactionReplacer`.
+
         Args:
             tx_hash (bytes): Transaction hash.
 
         Returns:
-            int: Receipt status.
+            int: Receipt status of the transaction, or of the replacement that was mined.
         """
         try:
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            return receipt["status"]
+            return self.replacer.wait(tx_hash)
 
         except Exception as e:
             raise Exception(f"failed to get tx receipt status: {e}")
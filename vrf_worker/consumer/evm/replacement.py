@@ -0,0 +1,139 @@
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Union
+
+from eth_account.signers.base import BaseAccount
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+Web3Tx = Dict[str, Union[str, int]]
+
+# nodes only accept a replacement with the same nonce if it raises every fee by at least this much
+MIN_FEE_BUMP_PERCENT = 10
+
+
+@dataclass
+class PendingTransaction:
+    tx: Web3Tx
+    account: BaseAccount
+    ceiling: int
+    hashes: list[str] = field(default_factory=list)
+    sent_at: float = 0.0
+
+
+class TransactionReplacer:
+    """Sends transactions and waits for them, replacing those that are not included in time.
+
+    A transaction still pending `target_inclusion_time` seconds after it was (re)sent is sent again with the same
+    nonce and every fee raised by `fee_bump_percent` (at least 10%, which nodes require of a replacement). Fees never
+    exceed `max_fee_per_gas` on `maxFeePerGas` (or `gasPrice`), which defaults to `max_fee_multiplier` times the
+    initial fee of each transaction. Whichever of the versions gets mined is the outcome. A `target_inclusion_time`
+    of 0 disables replacement.
+    """
+
+    def __init__(
+        self,
+        w3: Web3,
+        target_inclusion_time: float = 0,
+        fee_bump_percent: float = 12.5,
+        max_fee_per_gas: Optional[int] = None,
+        max_fee_multiplier: float = 4,
+        poll_interval: float = 1.0,
+        timeout: float = 120,
+    ) -> None:
+        self.w3 = w3
+        self.target_inclusion_time = target_inclusion_time
+        self.fee_bump_percent = max(fee_bump_percent, MIN_FEE_BUMP_PERCENT)
+        self.max_fee_per_gas = max_fee_per_gas
+        self.max_fee_multiplier = max_fee_multiplier
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self.pending: dict[str, PendingTransaction] = {}
+        self.replacements = 0
+
+    def send(self, tx: Web3Tx, account: BaseAccount) -> str:
+        """Signs and sends a transaction.
+
+        Args:
+            tx (Web3Tx): The built transaction, with its nonce and fees.
+            account (BaseAccount): Account to sign the transaction.
+
+        Returns:
+            str: Transaction hash as a hex string.
+        """
+        signed_tx = account.sign_transaction(tx)
+        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction).to_0x_hex()
+
+        if self.target_inclusion_time > 0:
+            # a transaction that is never waited for would stay pending forever, drop those past their timeout
+            now = time.monotonic()
+            for sent_hash, pending in list(self.pending.items()):
+                if now - pending.sent_at >= self.timeout:
+                    self.pending.pop(sent_hash, None)
+
+            initial_fee = tx.get("maxFeePerGas", tx.get("gasPrice"))
+            ceiling = self.max_fee_per_gas or int(initial_fee * self.max_fee_multiplier)
+            self.pending[tx_hash] = PendingTransaction(tx, account, ceiling, [tx_hash], time.monotonic())
+        return tx_hash
+
+    def wait(self, tx_hash: str) -> int:
+        """Waits for a transaction sent by `send`, or any of its replacements, to be mined.
+
+        This blocks for up to `timeout` seconds, so callers on an event loop run it in a thread.
+
+        Args:
+            tx_hash (str): Hash of the transaction as first sent.
+
+        Returns:
+            int: Receipt status of the mined version.
+
+        Raises:
+            Exception: No version was mined within `timeout` seconds of the last one being sent.
+        """
+        pending = self.pending.get(tx_hash)
+        if pending is None:
+            return self.w3.eth.wait_for_transaction_receipt(tx_hash, self.timeout)["status"]
+
+        try:
+            while True:
+                for sent_hash in pending.hashes:
+                    try:
+                        return self.w3.eth.get_transaction_receipt(sent_hash)["status"]
+                    except TransactionNotFound:
+                        continue
+
+                waited = time.monotonic() - pending.sent_at
+                if waited >= self.timeout:
+                    raise Exception(f"transaction {tx_hash} was not mined after {waited:.0f}s")
+                if waited >= self.target_inclusion_time:
+                    self._replace(pending)
+
+                time.sleep(self.poll_interval)
+        finally:
+            self.pending.pop(tx_hash, None)
+
+    def _replace(self, pending: PendingTransaction) -> None:
+        tx = dict(pending.tx)
+        fee_fields = ["gasPrice"] if "gasPrice" in tx else ["maxFeePerGas", "maxPriorityFeePerGas"]
+        for name in fee_fields:
+            tx[name] = math.ceil(tx[name] * (100 + self.fee_bump_percent) / 100)
+
+        if pending.tx[fee_fields[0]] >= pending.ceiling:
+            # the fees are as high as they may go, keep waiting for one of the versions sent
+            return
+
+        # the last bump stops at the ceiling, which nodes reject if it is less than the minimum bump
+        for name in fee_fields:
+            tx[name] = min(tx[name], pending.ceiling)
+
+        try:
+            signed_tx = pending.account.sign_transaction(tx)
+            pending.hashes.append(self.w3.eth.send_raw_transaction(signed_tx.raw_transaction).to_0x_hex())
+            pending.tx = tx
+            pending.sent_at = time.monotonic()
+            self.replacements += 1
+        except Exception:
+            # e.g. a previous version was just mined and the nonce is used, which the next receipt check finds
+            pending.sent_at = time.monotonic()
@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Gas the bridge spends verifying one signature: the ecrecover precompile, the cold read of the signer's power and
+# the loop around them, plus hashing the signed message with the sha256 precompile.
+ECRECOVER_GAS = 3000
+VALIDATOR_POWER_READ_GAS = 2100
+SIGNATURE_OVERHEAD_GAS = 800
+SHA256_BASE_GAS = 60
+SHA256_WORD_GAS = 12
+
+# calldata gas per byte (EIP-2028)
+ZERO_BYTE_GAS = 4
+NONZERO_BYTE_GAS = 16
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """A signature that may be kept in a proof."""
+
+    index: int
+    address: str
+    power: int
+    # estimated gas of including the signature: its calldata plus its verification by the bridge
+    gas: int
+
+
+SignatureSelector = Callable[[list[Candidate], int], list[Candidate]]
+
+
+@dataclass(frozen=True)
+class SelectionReport:
+    """The estimated gas of the signatures kept in a proof, against that of the greedy selection by power."""
+
+    count: int
+    gas: int
+    baseline_count: int
+    baseline_gas: int
+
+    @property
+    def saved_gas(self) -> int:
+        return self.baseline_gas - self.gas
+
+
+def signature_gas(r: bytes, s: bytes, v: int, encoded_timestamp: bytes, message_size: int) -> int:
+    """Estimates the gas of including a signature in a proof.
+
+    Args:
+        r (bytes): The r value of the signature.
+        s (bytes): The s value of the signature.
+        v (int): The v value of the signature.
+        encoded_timestamp (bytes): The encoded timestamp of the vote.
+        message_size (int): The size of the signed message, which includes the encoded timestamp.
+
+    Returns:
+        int: The calldata gas of the ABI encoded element and its offset in the array, plus the verification gas.
+    """
+    padding = -len(encoded_timestamp) % 32
+    # r, s, v, the timestamp offset (0x80), the timestamp length and the timestamp, and the element offset
+    nonzero = (
+        _nonzero_bytes(r)
+        + _nonzero_bytes(s)
+        + (1 if v else 0)
+        + 1
+        + 1
+        + _nonzero_bytes(encoded_timestamp)
+        + 2  # element offsets are below 2^16
+    )
+    size = 6 * 32 + len(encoded_timestamp) + padding
+    calldata = nonzero * NONZERO_BYTE_GAS + (size - nonzero) * ZERO_BYTE_GAS
+    verification = (
+        ECRECOVER_GAS
+        + VALIDATOR_POWER_READ_GAS
+        + SIGNATURE_OVERHEAD_GAS
+        + SHA256_BASE_GAS
+        + SHA256_WORD_GAS * -(-message_size // 32)
+    )
+    return calldata + verification
+
+
+def required_power(total_power: int) -> int:
+    """Returns the least power that exceeds 2/3 of `total_power`."""
+    return total_power * 2 // 3 + 1
+
+
+def select_by_power(candidates: list[Candidate], total_power: int) -> list[Candidate]:
+    """Selects the fewest signatures by taking the most powerful until they exceed 2/3 of the total power.
+
+    Raises:
+        Exception: All the candidates together do not exceed 2/3 of the total power.
+    """
+    needed = required_power(total_power)
+    selected = []
+    accumulated_power = 0
+    for candidate in sorted(candidates, key=lambda c: c.power, reverse=True):
+        selected.append(candidate)
+        accumulated_power += candidate.power
+        if accumulated_power >= needed:
+            return selected
+    raise Exception("Accumulated power does not exceed 2/3 of total power")
+
+
+def select_by_gas(
+    candidates: list[Candidate],
+    total_power: int,
+    max_nodes: int = 2_000,
+    incumbent: Optional[list[Candidate]] = None,
+) -> list[Candidate]:
+    """Selects the signatures with the least total gas that exceed 2/3 of the total power.
+
+    This is a covering knapsack, solved by branch and bound over the candidates ordered by gas per unit of power,
+    with the fractional relaxation as the lower bound and the greedy selection by power, or `incumbent` if given,
+    as the first incumbent. Candidates with no power are dropped first. The search stops after `max_nodes` nodes and
+    returns the best selection found so far, which is never worse than the greedy one. The first nodes find nearly
+    all of the savings, so the search is kept short to bound the time spent on each proof.
+
+    Raises:
+        Exception: All the candidates together do not exceed 2/3 of the total power.
+    """
+    needed = required_power(total_power)
+    if incumbent is None:
+        incumbent = select_by_power(candidates, total_power)
+    best_gas = sum(c.gas for c in incumbent)
+    best = [c.index for c in incumbent]
+
+    items = sorted((c for c in candidates if c.power > 0), key=lambda c: (c.gas / c.power, -c.power))
+    # power of items[i:], to prune branches that can no longer reach the required power
+    suffix_power = [0] * (len(items) + 1)
+    for i in range(len(items) - 1, -1, -1):
+        suffix_power[i] = suffix_power[i + 1] + items[i].power
+
+    def lower_bound(i: int, gas: int, missing: int) -> float:
+        bound = gas
+        for item in items[i:]:
+            if item.power >= missing:
+                return bound + item.gas * missing / item.power
+            bound += item.gas
+            missing -= item.power
+        return float("inf")
+
+    nodes = 0
+    chosen: list[int] = []
+
+    def search(i: int, gas: int, missing: int) -> None:
+        nonlocal nodes, best_gas, best
+        if missing <= 0:
+            if gas < best_gas:
+                best_gas = gas
+                best = list(chosen)
+            return
+        nodes += 1
+        if nodes > max_nodes or suffix_power[i] < missing or lower_bound(i, gas, missing) >= best_gas:
+            return
+
+        item = items[i]
+        chosen.append(item.index)
+        search(i + 1, gas + item.gas, missing - item.power)
+        chosen.pop()
+        search(i + 1, gas, missing)
+
+    search(0, 0, needed)
+
+    by_index = {c.index: c for c in candidates}
+    return [by_index[i] for i in best]
+
+
+SELECTORS: dict[str, SignatureSelector] = {"power": select_by_power, "gas": select_by_gas}
+
+
+def _nonzero_bytes(data: bytes) -> int:
+    return len(data) - data.count(0)
@@ -4,3 +4,10 @@ RELAY_DATA_TYPES = [
     "(bytes,bytes)",  # CommonEncodedVotePartData
     "(bytes32,bytes32,uint8,bytes)[]",  # TMSignatureData[]
 ]
+
+VERIFY_DATA_TYPES = [
+    "uint256",  # blockHeight
+    "(string,uint64,bytes,uint64,uint64,uint64,uint64,uint64,uint64,uint8,bytes)",  # Result
+    "uint256",  # version
+    "(bool,uint8,uint256,uint256,bytes32)[]",  # IAVLMerklePathData[]
+]
@@ -1,69 +1,418 @@
 import hashlib
+from typing import Callable, Optional
 
-from eth_abi import decode, encode
+from eth_abi import decode
 from eth_account.account import Account
 
-from vrf_worker.consumer.evm.types import RELAY_DATA_TYPES
+from vrf_worker.diagnostics import timed
 
-Signature = tuple[bytes, bytes, bytes, bytes]
+from .selection import Candidate, SelectionReport, SignatureSelector, select_by_gas, select_by_power, signature_gas
+from .types import VERIFY_DATA_TYPES
 
+Signature = tuple[bytes, bytes, int, bytes]
 
+WORD_SIZE = 32
+
+# Word index of the CommonEncodedVotePartData and TMSignatureData[] offsets in the relay data head, which starts with
+# the static MultiStoreData (6 words) and BlockHeaderMerklePartsData (8 words) tuples.
+CEVP_OFFSET_WORD = 14
+SIGNATURES_OFFSET_WORD = 15
+
+# Word index of MultiStoreData.oracleIAVLStateHash and of BlockHeaderMerklePartsData.height, .timeSecond and
+# .timeNanoSecondFraction in the relay data head.
+ORACLE_STATE_WORD = 0
+HEIGHT_WORD = 7
+TIME_SECOND_WORD = 8
+TIME_NANO_SECOND_FRACTION_WORD = 9
+
+# Key and length prefix of the oracle store in the BandChain multistore, and of a result in the oracle store.
+ORACLE_STORE_PREFIX = bytes.fromhex("066f7261636c6520")
+RESULT_KEY_PREFIX = bytes([9, 255])
+
+
+@timed("evm.trim_proof")
 def trim_proof(
     evm_proof_bytes: bytes,
     block_hash: bytes,
     encoded_band_chain_id: str,
     validator_power: dict[str, int],
+    selector: SignatureSelector = select_by_power,
+    on_selection: Optional[Callable[[SelectionReport], None]] = None,
 ) -> bytes:
-    """Deconstructs the proof and reconstructs it with only the signatures to achieve 2/3 of the total power.
+    """Rebuilds the proof with only the signatures needed to achieve 2/3 of the total power.
+
+    Rather than decoding and re-encoding the whole proof, the ABI offsets are followed in place to find the
+    signatures, and the output is spliced together from the untouched parts of the input and the selected
+    signature elements. The result is identical to re-encoding the decoded proof with the selected signatures.
 
     Args:
         evm_proof_bytes (bytes): The EVM proof bytes.
         block_hash (str): The block hash.
         encoded_band_chain_id (str): The encoded BandChain ID.
+        validator_power (dict[str, int]): The power of each validator, by lowercase address.
+        selector (SignatureSelector): Chooses the signatures to keep among those of known validators.
+        on_selection (Callable[[SelectionReport], None], optional): Called with the estimated gas of the kept
+            signatures against that of the greedy selection by power.
 
     Returns:
         bytes: The trimmed proof.
     """
-    relay_data, verify_data = decode(("bytes", "bytes"), evm_proof_bytes)
-    multi_store, merkle_parts, cevp, sigs = decode(RELAY_DATA_TYPES, relay_data)
-    minimal_sigs = _trim_signatures_by_power(block_hash, cevp, sigs, encoded_band_chain_id, validator_power)
-    minimized_relay_data = encode(RELAY_DATA_TYPES, (multi_store, merkle_parts, cevp, minimal_sigs))
-    trimmed_proof = encode(("bytes", "bytes"), (minimized_relay_data, verify_data))
+    return _trim_proof(evm_proof_bytes, block_hash, encoded_band_chain_id, validator_power, selector, on_selection)[0]
+
 
+@timed("evm.trim_and_verify_proof")
+def trim_and_verify_proof(
+    evm_proof_bytes: bytes,
+    block_hash: bytes,
+    encoded_band_chain_id: bytes,
+    validator_power: dict[str, int],
+    selector: SignatureSelector = select_by_power,
+    on_selection: Optional[Callable[[SelectionReport], None]] = None,
+) -> bytes:
+    """Trims the proof like `trim_proof` and checks the result like `verify_proof`, recovering the signers once.
+
+    Raises:
+        Exception: If the proof cannot be trimmed or is invalid.
+    """
+    (trimmed_proof, signers) = _trim_proof(
+        evm_proof_bytes, block_hash, encoded_band_chain_id, validator_power, selector, on_selection
+    )
+    verify_proof(trimmed_proof, block_hash, encoded_band_chain_id, validator_power, signers)
     return trimmed_proof
 
 
-def _trim_signatures_by_power(
+def _trim_proof(
+    evm_proof_bytes: bytes,
     block_hash: bytes,
-    cevp: bytes,
+    encoded_band_chain_id: bytes,
+    validator_power: dict[str, int],
+    selector: SignatureSelector,
+    on_selection: Optional[Callable[[SelectionReport], None]],
+) -> tuple[bytes, list[str]]:
+    """Returns the trimmed proof and the signers of the signatures kept in it, in order."""
+    (relay_data, verify_data) = _split_proof(memoryview(evm_proof_bytes))
+
+    cevp_start = _read_uint(relay_data, CEVP_OFFSET_WORD * WORD_SIZE)
+    cevp = (
+        _read_bytes(relay_data, cevp_start + _read_uint(relay_data, cevp_start)),
+        _read_bytes(relay_data, cevp_start + _read_uint(relay_data, cevp_start + WORD_SIZE)),
+    )
+
+    (sigs_start, spans) = _signature_array(relay_data)
+    signatures = [_read_signature(relay_data, start) for start, _ in spans]
+
+    selected = _select_signatures_by_power(
+        block_hash, cevp, signatures, encoded_band_chain_id, validator_power, selector, on_selection
+    )
+
+    # The signature array is the last item of the relay data, so everything before it is kept as is and only the
+    # array length, element offsets and elements are rewritten.
+    parts = [relay_data[:sigs_start], _encode_uint(len(selected))]
+    elements = []
+    offset = len(selected) * WORD_SIZE
+    for candidate in selected:
+        start, end = spans[candidate.index]
+        parts.append(_encode_uint(offset))
+        elements.append(relay_data[start:end])
+        offset += end - start
+    parts.extend(elements)
+
+    return (_join_proof(parts, sigs_start + WORD_SIZE + offset, verify_data), [c.address for c in selected])
+
+
+def get_block_relay_data(evm_proof_bytes: bytes) -> bytes:
+    """Returns the relay data of a proof, which is the ABI encoded arguments of `Bridge.relayBlock`.
+
+    Args:
+        evm_proof_bytes (bytes): The EVM proof bytes.
+
+    Returns:
+        bytes: The relay data.
+    """
+    (relay_data, _) = _split_proof(memoryview(evm_proof_bytes))
+    return bytes(relay_data)
+
+
+@timed("evm.get_block_detail")
+def get_block_detail(evm_proof_bytes: bytes) -> tuple[int, tuple[bytes, int, int]]:
+    """Returns the BandChain block a proof is for, as recorded by `Bridge.relayBlock`.
+
+    Args:
+        evm_proof_bytes (bytes): The EVM proof bytes.
+
+    Returns:
+        tuple: (height, (oracle state, time second, time nanosecond fraction)), where the second item is what
+        `Bridge.blockDetails(height)` returns once the block is relayed.
+    """
+    (relay_data, _) = _split_proof(memoryview(evm_proof_bytes))
+    return (
+        _read_uint(relay_data, HEIGHT_WORD * WORD_SIZE),
+        (
+            bytes(relay_data[ORACLE_STATE_WORD * WORD_SIZE : (ORACLE_STATE_WORD + 1) * WORD_SIZE]),
+            _read_uint(relay_data, TIME_SECOND_WORD * WORD_SIZE),
+            _read_uint(relay_data, TIME_NANO_SECOND_FRACTION_WORD * WORD_SIZE),
+        ),
+    )
+
+
+@timed("evm.strip_signatures")
+def strip_signatures(evm_proof_bytes: bytes) -> bytes:
+    """Rebuilds the proof with an empty signature array.
+
+    The bridge skips verifying a block it has already relayed, so once `Bridge.relayBlock` succeeded for the block
+    of a proof, the signatures only add calldata.
+
+    Args:
+        evm_proof_bytes (bytes): The EVM proof bytes.
+
+    Returns:
+        bytes: The proof without signatures.
+    """
+    (relay_data, verify_data) = _split_proof(memoryview(evm_proof_bytes))
+    (sigs_start, _) = _signature_array(relay_data)
+    return _join_proof([relay_data[:sigs_start], _encode_uint(0)], sigs_start + WORD_SIZE, verify_data)
+
+
+@timed("evm.verify_proof")
+def verify_proof(
+    evm_proof_bytes: bytes,
+    block_hash: bytes,
+    encoded_band_chain_id: bytes,
+    validator_power: dict[str, int],
+    signers: Optional[list[str]] = None,
+) -> None:
+    """Checks a proof the way the Bridge contract does, so that one it would reject is never relayed.
+
+    The block header is rebuilt from the multistore and merkle parts and must hash to the block hash, the signers
+    recovered over it must be sorted by address and hold more than 2/3 of the validator power, and the result must
+    be included in the oracle store of the block.
+
+    Args:
+        evm_proof_bytes (bytes): The EVM proof bytes.
+        block_hash (bytes): The block hash.
+        encoded_band_chain_id (bytes): The encoded BandChain ID.
+        validator_power (dict[str, int]): The power of each validator, by lowercase address.
+        signers (list[str], optional): The lowercase addresses that made the signatures of the proof, in order, if
+            they were already recovered over the same block hash.
+
+    Raises:
+        Exception: If the proof is invalid.
+    """
+    (relay_data, verify_data) = _split_proof(memoryview(evm_proof_bytes))
+
+    words = [bytes(relay_data[i * WORD_SIZE : (i + 1) * WORD_SIZE]) for i in range(CEVP_OFFSET_WORD)]
+    (oracle_state, params, slashing_to_staking, gov_to_mint, auth_to_feegrant, transfer_to_upgrade) = words[:6]
+    # the named hashes are the subtrees of the multistore next to the oracle store leaf, from the nearest one up
+    app_hash = _inner_hash(
+        transfer_to_upgrade,
+        _inner_hash(
+            _inner_hash(
+                _inner_hash(
+                    _inner_hash(params, _leaf_hash(ORACLE_STORE_PREFIX + _sha256(oracle_state))), slashing_to_staking
+                ),
+                gov_to_mint,
+            ),
+            auth_to_feegrant,
+        ),
+    )
+
+    (version_and_chain_id, _, _, _, last_block_id_and_other, next_validators_and_consensus, last_results, evidence) = (
+        words[6:]
+    )
+    height = _read_uint(relay_data, HEIGHT_WORD * WORD_SIZE)
+    # the height, time and app hash leaves of the header, the other parts are the subtrees next to them
+    header_hash = _inner_hash(
+        _inner_hash(
+            _inner_hash(
+                version_and_chain_id,
+                _inner_hash(
+                    _leaf_hash(b"\x08" + _encode_varint(height)),
+                    _leaf_hash(
+                        _encode_time(
+                            _read_uint(relay_data, TIME_SECOND_WORD * WORD_SIZE),
+                            _read_uint(relay_data, TIME_NANO_SECOND_FRACTION_WORD * WORD_SIZE),
+                        )
+                    ),
+                ),
+            ),
+            last_block_id_and_other,
+        ),
+        _inner_hash(
+            _inner_hash(
+                next_validators_and_consensus, _inner_hash(_leaf_hash(bytes([10, 32]) + app_hash), last_results)
+            ),
+            evidence,
+        ),
+    )
+    if header_hash != bytes(block_hash):
+        raise Exception(f"invalid proof: block header hashes to {header_hash.hex()}, not {bytes(block_hash).hex()}")
+
+    if signers is None:
+        cevp_start = _read_uint(relay_data, CEVP_OFFSET_WORD * WORD_SIZE)
+        common = (
+            _read_bytes(relay_data, cevp_start + _read_uint(relay_data, cevp_start))
+            + header_hash
+            + _read_bytes(relay_data, cevp_start + _read_uint(relay_data, cevp_start + WORD_SIZE))
+        )
+        (_, spans) = _signature_array(relay_data)
+        signatures = [_read_signature(relay_data, start) for start, _ in spans]
+        signers = _recover_addresses(signatures, common, encoded_band_chain_id)
+    if any(int(a, 16) >= int(b, 16) for a, b in zip(signers, signers[1:])):
+        raise Exception("invalid proof: signers are not sorted by address")
+    signed_power = sum(validator_power.get(signer, 0) for signer in signers)
+    total_power = sum(validator_power.values())
+    if signed_power * 3 <= total_power * 2:
+        raise Exception(f"invalid proof: signers hold {signed_power} of {total_power} power, not more than 2/3")
+
+    (verify_height, result, version, merkle_paths) = decode(
+        VERIFY_DATA_TYPES, bytes(verify_data[WORD_SIZE : WORD_SIZE + _read_uint(verify_data, 0)])
+    )
+    if verify_height != height:
+        raise Exception(f"invalid proof: result is proven at height {verify_height}, not {height}")
+    if _oracle_state(result, version, merkle_paths) != oracle_state:
+        raise Exception(f"invalid proof: result of request {result[5]} is not in the oracle store")
+
+
+def _oracle_state(result: tuple, version: int, merkle_paths: list[tuple]) -> bytes:
+    """Returns the root of the oracle store IAVL tree given by the merkle paths of a result."""
+    request_id = result[5]
+    node = _sha256(
+        bytes([0, 2])
+        + _encode_varint_signed(version)
+        + RESULT_KEY_PREFIX
+        + request_id.to_bytes(8, "big")
+        + bytes([32])
+        + _sha256(_encode_result(result))
+    )
+    for is_data_on_right, subtree_height, subtree_size, subtree_version, sibling in merkle_paths:
+        (left, right) = (sibling, node) if is_data_on_right else (node, sibling)
+        node = _sha256(
+            _encode_varint_signed(subtree_height)
+            + _encode_varint_signed(subtree_size)
+            + _encode_varint_signed(subtree_version)
+            + bytes([32])
+            + left
+            + bytes([32])
+            + right
+        )
+    return node
+
+
+def _encode_result(result: tuple) -> bytes:
+    """Encodes an oracle result in protobuf, leaving out empty fields."""
+    encoded = []
+    for number, value in enumerate(result, start=1):
+        if isinstance(value, str):
+            value = value.encode()
+        if not value:
+            continue
+        if isinstance(value, bytes):
+            encoded.append(_encode_varint(number << 3 | 2) + _encode_varint(len(value)) + value)
+        else:
+            encoded.append(_encode_varint(number << 3) + _encode_varint(value))
+    return b"".join(encoded)
+
+
+def _encode_time(second: int, nano_second_fraction: int) -> bytes:
+    encoded = b"\x08" + _encode_varint(second)
+    if nano_second_fraction:
+        encoded += b"\x10" + _encode_varint(nano_second_fraction)
+    return encoded
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _encode_varint_signed(value: int) -> bytes:
+    return _encode_varint(value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _sha256(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def _leaf_hash(data: bytes) -> bytes:
+    return _sha256(b"\x00" + data)
+
+
+def _inner_hash(left: bytes, right: bytes) -> bytes:
+    return _sha256(b"\x01" + left + right)
+
+
+def _split_proof(proof: memoryview) -> tuple[memoryview, memoryview]:
+    """Returns the relay data contents and the encoded verify data, including its length, of a proof."""
+    # (bytes relayData, bytes verifyData)
+    relay_start = _read_uint(proof, 0) + WORD_SIZE
+    relay_data = proof[relay_start : relay_start + _read_uint(proof, relay_start - WORD_SIZE)]
+    verify_start = _read_uint(proof, WORD_SIZE)
+    verify_data = proof[verify_start : verify_start + WORD_SIZE + _padded(_read_uint(proof, verify_start))]
+    return relay_data, verify_data
+
+
+def _join_proof(relay_parts: list, relay_data_size: int, verify_data: memoryview) -> bytes:
+    return b"".join(
+        [
+            _encode_uint(2 * WORD_SIZE),
+            _encode_uint(3 * WORD_SIZE + relay_data_size),
+            _encode_uint(relay_data_size),
+            *relay_parts,
+            verify_data,
+        ]
+    )
+
+
+@timed("evm.select_signatures_by_power")
+def _select_signatures_by_power(
+    block_hash: bytes,
+    cevp: tuple[bytes, bytes],
     signatures: list[Signature],
     encoded_band_chain_id: bytes,
     validator_power: dict[str, int],
-) -> bytes:
+    selector: SignatureSelector = select_by_power,
+    on_selection: Optional[Callable[[SelectionReport], None]] = None,
+) -> list[Candidate]:
+    """Returns the signatures to keep, ordered by signer address."""
     total_power = sum(validator_power.values())
     try:
         common = cevp[0] + block_hash + cevp[1]
         addresses = _recover_addresses(signatures, common, encoded_band_chain_id)
 
-        vps = []
-        for addr, sig in zip(addresses, signatures):
+        candidates = []
+        for i, addr in enumerate(addresses):
             if addr.lower() in validator_power:
-                power = validator_power[addr]
-                vps.append((addr, sig, power))
-
-        # reorder by power in descending order
-        vps = sorted(vps, key=lambda vp: vp[2], reverse=True)
-        accumulated_power = 0
-        for i in range(len(vps)):
-            accumulated_power += vps[i][2]
-            if accumulated_power * 3 > total_power * 2:
-                ordered_by_address = sorted(vps[: i + 1], key=lambda vp: int(vp[0], 16))
-                return [vp[1] for vp in ordered_by_address]
-        raise Exception("Accumulated power does not exceed 2/3 of total power")
+                (r, s, v, encoded_timestamp) = signatures[i]
+                # the signed message is its length, the common part, the timestamp field and the chain ID
+                message_size = 1 + len(common) + 2 + len(encoded_timestamp) + len(encoded_band_chain_id)
+                gas = signature_gas(r, s, v, encoded_timestamp, message_size)
+                candidates.append(Candidate(i, addr, validator_power[addr], gas))
+
+        # the greedy selection is the baseline of the report, and the search by gas starts from it
+        baseline = select_by_power(candidates, total_power)
+        if selector is select_by_power:
+            selected = baseline
+        elif selector is select_by_gas:
+            selected = select_by_gas(candidates, total_power, incumbent=baseline)
+        else:
+            selected = selector(candidates, total_power)
+        if on_selection is not None:
+            on_selection(
+                SelectionReport(
+                    len(selected), sum(c.gas for c in selected), len(baseline), sum(c.gas for c in baseline)
+                )
+            )
+
+        return sorted(selected, key=lambda c: int(c.address, 16))
     except Exception as e:
         raise Exception(f"failed to trim necessary signatures: {e}")
 
 
+@timed("evm.recover_addresses")
 def _recover_addresses(signatures: list[Signature], common: bytes, encoded_band_chain_id: bytes) -> list[str]:
     try:
         return [_recover_address(signature, common, encoded_band_chain_id) for signature in signatures]
@@ -78,3 +427,59 @@ def _recover_address(signature: Signature, common: bytes, encoded_band_chain_id:
     msg_hash = hashlib.sha256(prefixed_msg).digest()
     address = Account._recover_hash(msg_hash, vrs=(v, r, s)).lower()
     return address
+
+
+def _signature_array(relay_data: memoryview) -> tuple[int, list[tuple[int, int]]]:
+    """Returns the position of the signature array and the spans of its elements, checking it ends the relay data."""
+    sigs_start = _read_uint(relay_data, SIGNATURES_OFFSET_WORD * WORD_SIZE)
+    spans = _signature_spans(relay_data, sigs_start)
+    if (spans[-1][1] if spans else sigs_start + WORD_SIZE) != len(relay_data):
+        raise Exception("failed to parse proof: signatures are not the last item of the relay data")
+    return sigs_start, spans
+
+
+def _signature_spans(relay_data: memoryview, sigs_start: int) -> list[tuple[int, int]]:
+    """Returns the (start, end) position of every encoded (bytes32,bytes32,uint8,bytes) element in the array."""
+    count = _read_uint(relay_data, sigs_start)
+    elements_start = sigs_start + WORD_SIZE
+
+    spans = []
+    for i in range(count):
+        start = elements_start + _read_uint(relay_data, elements_start + i * WORD_SIZE)
+        timestamp_start = start + _read_uint(relay_data, start + 3 * WORD_SIZE)
+        end = timestamp_start + WORD_SIZE + _padded(_read_uint(relay_data, timestamp_start))
+        if end > len(relay_data):
+            raise Exception("failed to parse proof: signature out of bounds")
+        spans.append((start, end))
+    return spans
+
+
+def _read_signature(relay_data: memoryview, start: int) -> Signature:
+    return (
+        bytes(relay_data[start : start + WORD_SIZE]),
+        bytes(relay_data[start + WORD_SIZE : start + 2 * WORD_SIZE]),
+        _read_uint(relay_data, start + 2 * WORD_SIZE),
+        _read_bytes(relay_data, start + _read_uint(relay_data, start + 3 * WORD_SIZE)),
+    )
+
+
+def _read_uint(data: memoryview, offset: int) -> int:
+    if offset < 0 or offset + WORD_SIZE > len(data):
+        raise Exception(f"failed to parse proof: word at {offset} out of bounds")
+    return int.from_bytes(data[offset : offset + WORD_SIZE], "big")
+
+
+def _read_bytes(data: memoryview, offset: int) -> bytes:
+    """Reads a length-prefixed dynamic `bytes` value starting at offset."""
+    size = _read_uint(data, offset)
+    if offset + WORD_SIZE + size > len(data):
+        raise Exception(f"failed to parse proof: bytes at {offset} out of bounds")
+    return bytes(data[offset + WORD_SIZE : offset + WORD_SIZE + size])
+
+
+def _encode_uint(value: int) -> bytes:
+    return value.to_bytes(WORD_SIZE, "big")
+
+
+def _padded(size: int) -> int:
+    return -(-size // WORD_SIZE) * WORD_SIZE
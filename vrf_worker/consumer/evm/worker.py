@@ -1,4 +1,9 @@
 import asyncio
+import functools
+import signal
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 
 from eth_account.signers.base import BaseAccount
 from logbook import Logger
@@ -7,11 +12,28 @@ from pyband.wallet import Wallet
 from vrf_worker.band.client import Client as BandClient
 from vrf_worker.band.types import TxParams
 from vrf_worker.band.utils import find_request_id
-from vrf_worker.config import EvmConfig
-from vrf_worker.consumer.evm.utils import trim_proof
-from vrf_worker.types import Task
+from vrf_worker.config import EvmConfig, WorkerConfig
+from vrf_worker.consumer.evm.utils import (
+    get_block_detail,
+    get_block_relay_data,
+    strip_signatures,
+    trim_and_verify_proof,
+    trim_proof,
+)
+from vrf_worker.diagnostics import LoopLagMonitor, SamplingProfiler
+from vrf_worker.logs import task_fields
+from vrf_worker.metrics import METRICS, Metrics, serve_metrics
+from vrf_worker.scheduler import TaskScheduler
+from vrf_worker.startup import ChainSnapshot, StartupProfile, load_snapshot, save_snapshot
+from vrf_worker.types import TaskRecord
 
 from .client import Client as EvmClient
+from .selection import SELECTORS, SelectionReport
+
+if TYPE_CHECKING:
+    # only built, and imported, by main.py when they are enabled
+    from vrf_worker.band.counts import CountController
+    from vrf_worker.band.hedging import HedgePolicy
 
 
 class Worker:
@@ -23,10 +45,15 @@ class Worker:
         band_wallet: Wallet,
         band_tx_params: TxParams,
         evm_config: EvmConfig,
+        worker_config: WorkerConfig = WorkerConfig(),
         logger: Logger = Logger("vrf_worker", 11),
+        metrics: Metrics = METRICS,
         poll_rate: int = 5,
         startup_nonce_check: int = 100,
         max_retries: int = 3,
+        startup_profile: StartupProfile | None = None,
+        count_controller: "CountController | None" = None,
+        hedge_policy: "HedgePolicy | None" = None,
     ) -> None:
         self.evm_client = evm_client
         self.band_client = band_client
@@ -36,110 +63,587 @@ class Worker:
 
         self.band_tx_params = band_tx_params
         self.evm_config = evm_config
+        self.worker_config = worker_config
 
         self.poll_rate = poll_rate
         self.startup_nonce_check = startup_nonce_check
         self.max_retries = max_retries
 
         self.logger = logger
+        self.metrics = metrics
+        self.startup_profile = startup_profile or StartupProfile()
+        # adjusts the ask and min counts of the requests to their resolve times, if set
+        self.count_controller = count_controller
+        # hedges requests that are slow to resolve with a second one, if set
+        self.hedge_policy = hedge_policy
+
+        self.oracle_script_id = 0
+        self.encoded_band_chain_id = b""
+
+        if evm_config.relay_mode not in ("proof", "block"):
+            raise Exception(f"unknown relay mode: {evm_config.relay_mode}")
+        if evm_config.signature_selection not in SELECTORS:
+            raise Exception(f"unknown signature selection: {evm_config.signature_selection}")
+        self.signature_selector = SELECTORS[evm_config.signature_selection]
+        # heights of the BandChain blocks known to be relayed to the bridge, with their details
+        self.relayed_blocks: OrderedDict[int, tuple[bytes, int, int]] = OrderedDict()
+        self.max_relayed_blocks = 1024
+        # the relay in progress of each block, shared by the tasks resolved in it
+        self.block_relays: dict[int, asyncio.Future] = {}
+
+        self.profiler = SamplingProfiler()
+
+        # the pipeline of every task in progress, by nonce
+        self.running: dict[int, asyncio.Task] = {}
+        # the nonces whose proof is being relayed, which the reconciler leaves to finish, as their own relay is then
+        # the likely resolution
+        self.relaying: set[int] = set()
+
+        self.batcher = None
+        if evm_config.batch_relayer_address:
+            # a batch only holds the proofs of the tasks in progress at once, so one task would only add latency
+            if worker_config.concurrency < 2:
+                raise Exception("batch relaying needs a worker concurrency of at least 2")
+            from .batcher import RelayBatcher
+
+            self.batcher = RelayBatcher(
+                evm_client,
+                evm_account,
+                evm_config.eip1559,
+                evm_config.batch_window,
+                evm_config.batch_max_size,
+                evm_config.batch_gas_cap,
+                logger,
+                metrics,
+            )
+
+        self.scheduler = TaskScheduler(
+            fee_per_second=worker_config.fee_per_second,
+            max_fee_bonus=worker_config.max_fee_bonus,
+            retry_penalty=worker_config.retry_penalty,
+            starvation_age=worker_config.starvation_age,
+            caller_weights=evm_config.caller_weights,
+            caller_max_in_flight=evm_config.caller_max_in_flight,
+            metrics=metrics,
+            max_in_memory=worker_config.max_in_memory_tasks,
+            spill_path=worker_config.spill_path or "",
+        )
 
     async def start(self) -> None:
         """Starts the worker."""
         self.logger.info("Starting worker")
 
-        queue: asyncio.Queue[(int, Task, int)] = asyncio.Queue(10000)
+        profile = self.startup_profile
+        loop = asyncio.get_running_loop()
 
-        # get bandchain encoded chain id
-        encoded_band_chain_id = self.evm_client.get_encoded_band_chain_id_from_bridge()
+        if self.worker_config.metrics_port is not None:
+            routes = {"/debug/profile": self._serve_profile} if self.worker_config.profile_endpoint else {}
+            await serve_metrics(self.metrics, self.worker_config.metrics_port, routes=routes)
+        if self.worker_config.loop_lag_threshold > 0:
+            monitor = LoopLagMonitor(
+                self.logger,
+                self.metrics,
+                interval=self.worker_config.loop_lag_threshold / 4,
+                threshold=self.worker_config.loop_lag_threshold,
+            )
+            loop.create_task(monitor.run())
+        loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(self._write_profile()))
 
-        # get oracle script id
-        oracle_script_id = self.evm_client.get_oracle_script_id()
+        current_nonce = await self.bootstrap()
 
-        # check latest nonce
-        current_nonce = self.evm_client.get_current_task_nonce_from_vrf_provider()
+        # check the latest nonces right away, then poll the contract for new tasks every 5 seconds
         start_nonce = max(current_nonce - self.startup_nonce_check, self.evm_config.start_nonce)
-
-        # poll the contract for new tasks every 5 seconds
-        loop = asyncio.get_running_loop()
+        with profile.step("first poll"):
+            start_nonce = await poll_once(
+                self.logger, self.evm_client, start_nonce, self.scheduler, self.evm_config.whitelisted_callers
+            )
         loop.create_task(
             poll_tasks(
-                self.logger, self.evm_client, start_nonce, self.poll_rate, queue, self.evm_config.whitelisted_callers
+                self.logger,
+                self.evm_client,
+                start_nonce,
+                self.poll_rate,
+                self.scheduler,
+                self.evm_config.whitelisted_callers,
             )
         )
+        if self.worker_config.reconcile_interval > 0:
+            loop.create_task(self.reconcile_tasks())
+        profile.report(self.logger)
 
+        # run up to `concurrency` tasks at once, in scheduler order
+        slots = asyncio.Semaphore(self.worker_config.concurrency)
         while True:
-            (nonce, task, retry) = await queue.get()
-            if retry >= self.max_retries:
-                self.logger.error(f"Max retries reached for nonce {nonce}. Skipping task.")
-                continue
+            await slots.acquire()
+            (record, retry) = await self.scheduler.get()
+            self.running[record.nonce] = loop.create_task(
+                self._run_task(slots, record, retry, self.oracle_script_id, self.encoded_band_chain_id)
+            )
 
-            self.logger.info(f"Received task: {nonce}")
+    async def bootstrap(self) -> int:
+        """Loads the chain ID and oracle script ID, from the chain snapshot if there is one.
 
-            # request VRF data on bandchain
-            try:
-                self.logger.info(f"Requesting VRF for nonce: {nonce}")
-                tx_resp = await self.band_client.request_vrf(
-                    oracle_script_id,
-                    self.evm_account.address,
-                    task.seed,
-                    task.time,
-                    self.band_tx_params,
-                    self.band_wallet,
+        Returns:
+            int: The current task nonce of the VRF provider.
+        """
+        profile = self.startup_profile
+
+        if self.batcher is not None:
+            owner = await profile.run("read batch relayer owner", self.evm_client.get_batch_relayer_owner)
+            if owner.lower() != self.evm_account.address.lower():
+                raise Exception(
+                    f"batch relayer {self.evm_config.batch_relayer_address} is owned by {owner}, not the worker "
+                    f"account {self.evm_account.address}, so it would keep the task fees"
                 )
-                self.logger.info(f"Successfully requested VRF for nonce: {nonce}")
-            except Exception as e:
-                self.logger.error(f"Error requesting VRF for nonce {nonce}: {e}")
-                await queue.put((nonce, task, retry + 1))
-                continue
 
-            try:
-                if tx_resp.code != 0:
-                    raise Exception(f"Transaction failed with code {tx_resp.code}: {tx_resp.raw_log}")
-                tx_resp = await self.band_client.get_transaction(tx_resp.txhash)
-            except Exception as e:
-                self.logger.error(f"Error getting transaction for nonce {nonce}: {e}")
-                await queue.put((nonce, task, retry + 1))
-                continue
+        # use the saved chain facts if there are any, and only wait for the latest nonce
+        snapshot_path = self.worker_config.snapshot_path
+        snapshot = load_snapshot(snapshot_path, self.evm_config) if snapshot_path else None
+        if snapshot is not None:
+            current_nonce = await profile.run(
+                "read task nonce", self.evm_client.get_current_task_nonce_from_vrf_provider
+            )
+            self.encoded_band_chain_id = bytes.fromhex(snapshot.encoded_band_chain_id)
+            self.oracle_script_id = snapshot.oracle_script_id
+            asyncio.get_running_loop().create_task(self._refresh_snapshot(snapshot))
+        else:
+            (current_nonce, snapshot) = await asyncio.gather(
+                profile.run("read task nonce", self.evm_client.get_current_task_nonce_from_vrf_provider),
+                self._read_snapshot(),
+            )
+            self.encoded_band_chain_id = bytes.fromhex(snapshot.encoded_band_chain_id)
+            self.oracle_script_id = snapshot.oracle_script_id
+            self._save_snapshot(snapshot)
+
+        return current_nonce
 
-            request_id = find_request_id(tx_resp)
-            self.logger.info(f"requested VRF with request_id {request_id}")
-            if not request_id:
-                self.logger.error(f"Request ID not found for nonce {nonce}. received tx with code: {tx_resp.code}")
-                await queue.put((nonce, task, retry + 1))
+    async def reconcile_tasks(self) -> None:
+        """Cancels the tasks in progress that were resolved on-chain, e.g. by another worker.
+
+        Each new EVM block, the in-flight nonces are checked with a single lens call. Tasks already relaying their
+        proof are left to finish, and are counted as relayed or retried by the outcome of their own relay.
+        """
+        last_block = None
+        while True:
+            await asyncio.sleep(self.worker_config.reconcile_interval)
+            if not self.running:
                 continue
 
             try:
-                self.logger.info(f"Generating VRF proof for nonce {nonce}")
-                (
-                    evm_proof_bytes,
-                    block_hash,
-                ) = await self.band_client.get_evm_proof_and_block_hash(request_id)
-                validators = self.evm_client.get_validators_from_bridge()
-                trimmed_proof = trim_proof(evm_proof_bytes, block_hash, encoded_band_chain_id, validators)
-                self.logger.info(f"Sucessfully generated VRF proof for nonce {nonce}")
+                # the reads may wait for the rate limit, which blocks, so they run in a thread
+                block = await asyncio.to_thread(self.evm_client.get_block_number)
+                if block == last_block:
+                    continue
+                last_block = block
+
+                nonces = [nonce for nonce in self.running if nonce not in self.relaying]
+                if not nonces:
+                    continue
+                records = await asyncio.to_thread(self.evm_client.get_task_records_by_nonces, nonces)
+                for nonce, (is_resolved, _) in zip(nonces, records):
+                    task = self.running.get(nonce)
+                    if is_resolved and task is not None and nonce not in self.relaying:
+                        self.logger.info("Task {} was resolved on-chain, cancelling it", nonce)
+                        task.cancel()
             except Exception as e:
-                self.logger.error(f"Error getting evm proof and block hash for nonce {nonce}: {e}")
-                await queue.put((nonce, task, retry + 1))
-                continue
+                self.logger.error("Error reconciling tasks: {}", e)
+
+    async def _write_profile(self) -> None:
+        """Writes a profile of the worker to `profile_dir`."""
+        seconds = self.worker_config.profile_seconds
+        self.logger.info("Profiling the worker for {}s", seconds)
+        try:
+            path = await asyncio.to_thread(self.profiler.profile_to_file, seconds, self.worker_config.profile_dir)
+            self.logger.info("Wrote profile to {}", path)
+        except Exception as e:
+            self.logger.error("Error profiling the worker: {}", e)
+
+    async def _serve_profile(self, params: dict[str, str]) -> str:
+        # the endpoint is not authenticated, so a request may not hold the profiler for longer than configured
+        seconds = min(
+            float(params.get("seconds", self.worker_config.profile_seconds)), self.worker_config.profile_seconds
+        )
+        return await asyncio.to_thread(self.profiler.profile, seconds)
+
+    async def ensure_block_relayed(self, proof: bytes) -> None:
+        """Relays the BandChain block of a proof to the bridge, unless it already was.
+
+        Args:
+            proof (bytes): A trimmed proof for the block.
+
+        Raises:
+            Exception: Failed to relay the block.
+        """
+        (height, detail) = get_block_detail(proof)
+        if self.relayed_blocks.get(height) == detail:
+            return
+
+        # tasks resolved in the same block wait for the first one to relay it, while other blocks are relayed
+        # alongside. The relay is shielded, so that a task cancelled while waiting does not cancel it for the others.
+        relay = self.block_relays.get(height)
+        if relay is None:
+            relay = asyncio.ensure_future(self._relay_block(height, detail, proof))
+            self.block_relays[height] = relay
+            relay.add_done_callback(functools.partial(self._block_relay_done, height))
+        await asyncio.shield(relay)
+
+    async def _relay_block(self, height: int, detail: tuple[bytes, int, int], proof: bytes) -> None:
+        if await asyncio.to_thread(self.evm_client.get_block_detail, height) != detail:
+            self.logger.info("Relaying BandChain block {}", height)
+            tx_hash = await asyncio.to_thread(
+                self.evm_client.relay_block,
+                get_block_relay_data(proof),
+                self.evm_account,
+                self.evm_config.eip1559,
+            )
+            if await asyncio.to_thread(self.evm_client.get_tx_receipt_status, tx_hash) != 1:
+                raise Exception(f"relay block transaction {tx_hash} failed")
+            self.logger.info("Successfully relayed BandChain block {}", height)
+
+        self.relayed_blocks[height] = detail
+        while len(self.relayed_blocks) > self.max_relayed_blocks:
+            self.relayed_blocks.popitem(last=False)
+
+    def _block_relay_done(self, height: int, relay: asyncio.Future) -> None:
+        if self.block_relays.get(height) is relay:
+            del self.block_relays[height]
+        # the waiting tasks each raise a failure, but if they were all cancelled nothing would retrieve it
+        if not relay.cancelled():
+            relay.exception()
+
+    async def _read_snapshot(self) -> ChainSnapshot:
+        """Reads the chain facts from the contracts, concurrently."""
+        profile = self.startup_profile
+        (encoded_band_chain_id, oracle_script_id) = await asyncio.gather(
+            profile.run("read encoded chain id", self.evm_client.get_encoded_band_chain_id_from_bridge),
+            profile.run("read oracle script id", self.evm_client.get_oracle_script_id),
+        )
+        return ChainSnapshot.create(self.evm_config, encoded_band_chain_id, oracle_script_id)
+
+    async def _refresh_snapshot(self, snapshot: ChainSnapshot) -> None:
+        """Checks the saved chain facts against the contracts, and switches to the current ones if they changed."""
+        try:
+            current = await self._read_snapshot()
+        except Exception as e:
+            self.logger.error("Error checking chain snapshot: {}", e)
+            return
+
+        if current == snapshot:
+            return
+
+        if (current.encoded_band_chain_id, current.oracle_script_id) != (
+            snapshot.encoded_band_chain_id,
+            snapshot.oracle_script_id,
+        ):
+            self.logger.warning("Chain snapshot is outdated, using the current chain ID and oracle script ID")
+            self.encoded_band_chain_id = bytes.fromhex(current.encoded_band_chain_id)
+            self.oracle_script_id = current.oracle_script_id
+        self._save_snapshot(current)
+
+    def _save_snapshot(self, snapshot: ChainSnapshot) -> None:
+        if not self.worker_config.snapshot_path:
+            return
+        try:
+            save_snapshot(self.worker_config.snapshot_path, snapshot)
+        except OSError as e:
+            self.logger.error("Error saving chain snapshot: {}", e)
+
+    def _report_selection(self, nonce: int, report: SelectionReport) -> None:
+        self.metrics.inc("vrf_worker_proof_signatures_total", report.count)
+        self.metrics.inc("vrf_worker_proof_signature_gas_total", report.gas)
+        self.metrics.inc("vrf_worker_proof_signature_gas_saved_total", report.saved_gas)
+        self.logger.debug(
+            "Kept {} signatures for nonce {}, estimated {} gas, {} less than the {} most powerful",
+            report.count,
+            nonce,
+            report.gas,
+            report.saved_gas,
+            report.baseline_count,
+            extra=task_fields(nonce, "proof"),
+        )
+
+    async def _run_task(
+        self,
+        slots: asyncio.Semaphore,
+        record: TaskRecord,
+        retry: int,
+        oracle_script_id: int,
+        encoded_band_chain_id: bytes,
+    ) -> None:
+        try:
+            if retry >= self.max_retries:
+                self.logger.error(
+                    "Max retries reached for nonce {}. Skipping task.",
+                    record.nonce,
+                    extra=task_fields(record.nonce, "retry"),
+                )
+                self.metrics.inc("vrf_worker_tasks_total", result="skipped")
+                return
+
+            if await self.process_task(record, oracle_script_id, encoded_band_chain_id):
+                self.metrics.inc("vrf_worker_tasks_total", result="relayed")
+            else:
+                self.metrics.inc("vrf_worker_tasks_total", result="retried")
+                await self.scheduler.put(record, retry + 1)
+        except asyncio.CancelledError:
+            # cancelled by the reconciler, the task needs no more work
+            self.metrics.inc("vrf_worker_tasks_total", result="cancelled")
+        finally:
+            self.running.pop(record.nonce, None)
+            await self.scheduler.done(record)
+            slots.release()
 
-            # relay proof
+    async def process_task(self, record: TaskRecord, oracle_script_id: int, encoded_band_chain_id: bytes) -> bool:
+        """Requests VRF on BandChain for a task and relays the proof.
+
+        Args:
+            record (TaskRecord): The task.
+            oracle_script_id (int): The VRF oracle script ID.
+            encoded_band_chain_id (bytes): The encoded BandChain ID.
+
+        Returns:
+            bool: Whether the proof was relayed. If not, the task should be retried.
+        """
+        nonce = record.nonce
+        self.logger.info("Received task: {}", nonce, extra=task_fields(nonce, "received"))
+
+        # request VRF data on bandchain
+        tx_params = self.band_tx_params
+        if self.count_controller is not None:
+            tx_params = self.count_controller.tx_params(tx_params)
+        request_id = await self.request_vrf(record, oracle_script_id, tx_params)
+        if not request_id:
+            return False
+
+        started = time.monotonic()
+        try:
+            self.logger.info("Generating VRF proof for nonce {}", nonce, extra=task_fields(nonce, "proof"))
+            (proof_request_id, evm_proof_bytes, block_hash) = await self.get_proof(
+                record, request_id, oracle_script_id, tx_params
+            )
+            validators = await asyncio.to_thread(self.evm_client.get_validators_from_bridge)
             try:
-                self.logger.info(f"Relaying VRF proof for nonce: {nonce}")
-                tx_hash = self.evm_client.relay_proof(
-                    trimmed_proof,
+                trimmed_proof = self._trim_proof(nonce, evm_proof_bytes, block_hash, encoded_band_chain_id, validators)
+            except Exception as e:
+                # the proof may have come from a faulty node, so it is fetched again before the task is retried,
+                # which pays for a new request
+                self.logger.warning(
+                    "Proof of request {} for nonce {} was rejected, fetching it again: {}",
+                    proof_request_id,
                     nonce,
-                    self.evm_account,
-                    self.evm_config.eip1559,
+                    e,
+                    extra=task_fields(nonce, "proof"),
+                )
+                (evm_proof_bytes, block_hash) = await self.band_client.get_evm_proof_and_block_hash(
+                    proof_request_id, refresh=True
                 )
-                status = self.evm_client.get_tx_receipt_status(tx_hash)
-                if status == 1:
-                    self.logger.info(f"Successfully relayed proof for nonce {nonce}")
-                else:
-                    self.logger.error(f"Failed to relay proof for nonce {nonce}")
-                    await queue.put((nonce, task, retry + 1))
+                trimmed_proof = self._trim_proof(nonce, evm_proof_bytes, block_hash, encoded_band_chain_id, validators)
+            self.logger.info(
+                "Sucessfully generated VRF proof for nonce {}", nonce, extra=task_fields(nonce, "proof", started)
+            )
+        except Exception as e:
+            self.logger.error(
+                "Error getting evm proof and block hash for nonce {}: {}",
+                nonce,
+                e,
+                extra=task_fields(nonce, "proof", started),
+            )
+            return False
+
+        if self.evm_config.relay_mode == "block":
+            started = time.monotonic()
+            try:
+                await self.ensure_block_relayed(trimmed_proof)
+                trimmed_proof = strip_signatures(trimmed_proof)
             except Exception as e:
-                self.logger.error(f"Error relaying proof for nonce {nonce}: {e}")
-                await queue.put((nonce, task, retry + 1))
+                self.logger.error(
+                    "Error relaying block for nonce {}: {}", nonce, e, extra=task_fields(nonce, "block", started)
+                )
+                return False
+
+        self.relaying.add(nonce)
+        try:
+            if self.batcher is not None:
+                return await self.batcher.relay(nonce, trimmed_proof)
+            return await self._relay_proof(nonce, trimmed_proof)
+        finally:
+            self.relaying.discard(nonce)
+
+    async def _relay_proof(self, nonce: int, trimmed_proof: bytes) -> bool:
+        """Relays a proof to the VRF provider, and returns whether its transaction succeeded."""
+        started = time.monotonic()
+        try:
+            self.logger.info("Relaying VRF proof for nonce: {}", nonce, extra=task_fields(nonce, "relay"))
+            # the EVM client blocks, so it runs in a thread to let the other tasks progress meanwhile
+            tx_hash = await asyncio.to_thread(
+                self.evm_client.relay_proof,
+                trimmed_proof,
+                nonce,
+                self.evm_account,
+                self.evm_config.eip1559,
+            )
+            status = await asyncio.to_thread(self.evm_client.get_tx_receipt_status, tx_hash)
+            if status == 1:
+                self.logger.info(
+                    "Successfully relayed proof for nonce {}", nonce, extra=task_fields(nonce, "relay", started)
+                )
+                return True
+            else:
+                self.logger.error(
+                    "Failed to relay proof for nonce {}", nonce, extra=task_fields(nonce, "relay", started)
+                )
+                return False
+        except Exception as e:
+            self.logger.error(
+                "Error relaying proof for nonce {}: {}", nonce, e, extra=task_fields(nonce, "relay", started)
+            )
+            return False
+
+    def _trim_proof(
+        self,
+        nonce: int,
+        evm_proof_bytes: bytes,
+        block_hash: bytes,
+        encoded_band_chain_id: bytes,
+        validators: dict[str, int],
+    ) -> bytes:
+        """Trims a proof to the signatures it needs, and checks it unless `verify_proofs` is off."""
+        args = (
+            evm_proof_bytes,
+            block_hash,
+            encoded_band_chain_id,
+            validators,
+            self.signature_selector,
+            lambda report: self._report_selection(nonce, report),
+        )
+        if not self.evm_config.verify_proofs:
+            return trim_proof(*args)
+        try:
+            return trim_and_verify_proof(*args)
+        except Exception:
+            self.metrics.inc("vrf_worker_proofs_rejected_total")
+            raise
+
+    async def request_vrf(self, record: TaskRecord, oracle_script_id: int, tx_params: TxParams) -> int:
+        """Requests VRF on BandChain for a task and waits for the request to be included.
+
+        Args:
+            record (TaskRecord): The task.
+            oracle_script_id (int): The VRF oracle script ID.
+            tx_params (TxParams): The parameters of the request transaction.
+
+        Returns:
+            int: The request ID, or 0 if the request failed.
+        """
+        nonce = record.nonce
+        started = time.monotonic()
+        try:
+            self.logger.info("Requesting VRF for nonce: {}", nonce, extra=task_fields(nonce, "request"))
+            tx_resp = await self.band_client.request_vrf(
+                oracle_script_id,
+                self.evm_account.address,
+                record.seed,
+                record.time,
+                tx_params,
+                self.band_wallet,
+            )
+            self.logger.info(
+                "Successfully requested VRF for nonce: {}", nonce, extra=task_fields(nonce, "request", started)
+            )
+        except Exception as e:
+            self.logger.error(
+                "Error requesting VRF for nonce {}: {}", nonce, e, extra=task_fields(nonce, "request", started)
+            )
+            return 0
+
+        try:
+            if tx_resp.code != 0:
+                raise Exception(f"Transaction failed with code {tx_resp.code}: {tx_resp.raw_log}")
+            tx_resp = await self.band_client.get_transaction(tx_resp.txhash)
+        except Exception as e:
+            self.logger.error(
+                "Error getting transaction for nonce {}: {}", nonce, e, extra=task_fields(nonce, "request", started)
+            )
+            return 0
+
+        request_id = find_request_id(tx_resp)
+        self.logger.info("requested VRF with request_id {}", request_id, extra=task_fields(nonce, "request", started))
+        if not request_id:
+            self.logger.error(
+                "Request ID not found for nonce {}. received tx with code: {}",
+                nonce,
+                tx_resp.code,
+                extra=task_fields(nonce, "request", started),
+            )
+            return 0
+        return request_id
+
+    async def get_proof(
+        self, record: TaskRecord, request_id: int, oracle_script_id: int, tx_params: TxParams
+    ) -> tuple[int, bytes, bytes]:
+        """Waits for the EVM proof of a VRF request, hedging it with a second request for the task if it is slow.
+
+        The hedge has the same seed and time, so either proof can be relayed for the task. It is requested in the
+        background while the first request is still awaited, and dropped before it is broadcast if that request
+        resolves first. The first proof to be ready is used and the wait for the other is abandoned.
+
+        Args:
+            record (TaskRecord): The task.
+            request_id (int): The ID of the request.
+            oracle_script_id (int): The VRF oracle script ID.
+            tx_params (TxParams): The parameters of the request transaction.
+
+        Returns:
+            tuple: (request_id, evm_proof_bytes, block_hash), with the ID of the request the proof is for.
+        """
+        on_result = None if self.count_controller is None else self.count_controller.observe
+
+        async def fetch(request_id: int) -> tuple[int, bytes, bytes]:
+            return (request_id, *await self.band_client.get_evm_proof_and_block_hash(request_id, on_result=on_result))
+
+        if self.hedge_policy is None:
+            return await fetch(request_id)
+
+        async def fetch_hedge() -> tuple[int, bytes, bytes]:
+            hedge_request_id = await self.request_vrf(record, oracle_script_id, tx_params)
+            if not hedge_request_id:
+                self.metrics.inc("vrf_worker_band_hedges_total", result="failed")
+                raise Exception(f"hedge request for nonce {record.nonce} failed")
+            self.metrics.inc("vrf_worker_band_hedges_total", result="sent")
+            return await fetch(hedge_request_id)
+
+        started = time.monotonic()
+        primary = asyncio.create_task(fetch(request_id))
+        pending = {primary}
+        hedge = None
+        try:
+            (done, _) = await asyncio.wait(pending, timeout=self.hedge_policy.delay())
+            if not done and self.hedge_policy.try_spend(tx_params):
+                self.logger.info(
+                    "Request {} for nonce {} is not resolved after {:.0f}s, hedging it",
+                    request_id,
+                    record.nonce,
+                    time.monotonic() - started,
+                    extra=task_fields(record.nonce, "hedge"),
+                )
+                hedge = asyncio.create_task(fetch_hedge())
+                pending.add(hedge)
+
+            # the first proof to be ready wins, and the task fails only if every request does
+            error: BaseException | None = None
+            while pending:
+                (done, pending) = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedge is not None:
+                            self.metrics.inc("vrf_worker_band_hedges_total", result="won" if task is hedge else "lost")
+                        self.hedge_policy.observe(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
 
 
 async def poll_tasks(
@@ -147,21 +651,38 @@ async def poll_tasks(
     client: EvmClient,
     current_nonce: int,
     poll_rate: int,
-    queue: asyncio.Queue[(int, Task)],
+    scheduler: TaskScheduler,
     whitelisted_callers: list[str],
 ) -> None:
     while True:
         await asyncio.sleep(poll_rate)
-        try:
-            latest_nonce = client.get_current_task_nonce_from_vrf_provider()
-            if latest_nonce > current_nonce:
-                nonces_to_check = list(range(current_nonce, latest_nonce))
-                tasks = client.get_tasks_by_nonces(nonces_to_check)
-                for nonce, task in zip(nonces_to_check, tasks):
-                    if not task.is_resolved and task.caller in whitelisted_callers:
-                        await queue.put((nonce, task, 0))
-
-                current_nonce = latest_nonce
-        except Exception as e:
-            logger.error(f"Error polling tasks: {e}")
-            continue
+        current_nonce = await poll_once(logger, client, current_nonce, scheduler, whitelisted_callers)
+
+
+async def poll_once(
+    logger: Logger,
+    client: EvmClient,
+    current_nonce: int,
+    scheduler: TaskScheduler,
+    whitelisted_callers: list[str],
+) -> int:
+    """Queues the unresolved tasks from `current_nonce` up to the latest nonce.
+
+    Returns:
+        int: The nonce to poll from next time.
+    """
+    try:
+        # the reads are low priority and may wait for the rate limit, which blocks, so they run in a thread
+        latest_nonce = await asyncio.to_thread(client.get_current_task_nonce_from_vrf_provider)
+        if latest_nonce > current_nonce:
+            nonces_to_check = list(range(current_nonce, latest_nonce))
+            records = await asyncio.to_thread(client.get_task_records_by_nonces, nonces_to_check)
+            for is_resolved, record in records:
+                if not is_resolved and record.caller in whitelisted_callers:
+                    await scheduler.put(record, 0)
+
+            current_nonce = latest_nonce
+    except Exception as e:
+        logger.error("Error polling tasks: {}", e, extra={"stage": "poll"})
+
+    return current_nonce
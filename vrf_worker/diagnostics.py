@@ -0,0 +1,180 @@
+import asyncio
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Callable, Optional
+
+from logbook import Logger
+
+from vrf_worker.metrics import METRICS, Metrics
+
+
+def timed(name: str, metrics: Metrics = METRICS) -> Callable:
+    """Decorates a function, or coroutine function, to count its calls and the time spent in them.
+
+    Adds to `vrf_worker_function_calls_total{function=name}` and `vrf_worker_function_seconds_total{function=name}`.
+    The time of a coroutine includes the time it spends waiting.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _record(metrics, name, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(metrics, name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def _record(metrics: Metrics, name: str, duration: float) -> None:
+    metrics.inc("vrf_worker_function_calls_total", function=name)
+    metrics.inc("vrf_worker_function_seconds_total", duration, function=name)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs, and reports what blocked it.
+
+    A heartbeat coroutine wakes every `interval` seconds and records how late it woke up. A watchdog thread checks
+    the heartbeat, and once the loop has not run for `threshold` seconds it captures the stack of the loop thread
+    and the task that was running. When the loop gets back, the stall is logged with that stack and counted in
+    `vrf_worker_loop_stalls_total{task}`.
+    """
+
+    def __init__(self, logger: Logger, metrics: Metrics = METRICS, interval: float = 0.1, threshold: float = 0.25):
+        self.logger = logger
+        self.metrics = metrics
+        self.interval = interval
+        self.threshold = threshold
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id = 0
+        self._beat = time.monotonic()
+        self._stall: Optional[tuple[str, list[str]]] = None
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+
+        max_lag = 0.0
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - self._beat - self.interval, 0.0)
+            self._beat = time.monotonic()
+
+            max_lag = max(max_lag, lag)
+            self.metrics.set("vrf_worker_loop_lag_seconds", lag)
+            self.metrics.set("vrf_worker_loop_lag_max_seconds", max_lag)
+
+            stall, self._stall = self._stall, None
+            if stall is not None and lag >= self.threshold:
+                (task_name, stack) = stall
+                self.metrics.inc("vrf_worker_loop_stalls_total", task=task_name)
+                self.metrics.inc("vrf_worker_loop_stall_seconds_total", lag, task=task_name)
+                self.logger.warning(
+                    "Event loop blocked for {:.3f}s by task {} in:\n{}", lag, task_name, "\n".join(stack[-8:])
+                )
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.threshold / 2)
+            beat = self._beat
+            if self._stall is None and time.monotonic() - beat >= self.threshold:
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is not None and self._beat == beat:
+                    self._stall = (self._current_task_name(), _format_stack(frame))
+
+    def _current_task_name(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is None:
+            return "callback"
+        return task.get_coro().__qualname__
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread of the process and aggregates them in the folded stack format.
+
+    The output is one `frame;frame;frame count` line per distinct stack, outermost frame first, which flame graph
+    tools such as flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float) -> str:
+        """Samples for `seconds` and returns the folded stacks. Blocks, so run it in a thread."""
+        if not self._lock.acquire(blocking=False):
+            raise Exception("a profile is already being taken")
+
+        try:
+            samples: Counter[str] = Counter()
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_thread:
+                        stack = ";".join(_frame_name(f) for f in _walk(frame))
+                        samples[f"{names.get(thread_id, thread_id)};{stack}"] += 1
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+    def profile_to_file(self, seconds: float, directory: str) -> str:
+        """Samples for `seconds` and writes the folded stacks to a new file in `directory`.
+
+        Returns:
+            str: The path of the file.
+        """
+        folded = self.profile(seconds)
+        path = os.path.join(directory, f"vrf_worker-{os.getpid()}-{int(time.time())}.folded")
+        with open(path, "w") as f:
+            f.write(folded)
+        return path
+
+
+def _walk(frame: Optional[FrameType]) -> list[FrameType]:
+    """Returns the frames of a stack, outermost first."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _format_stack(frame: FrameType) -> list[str]:
+    return [f"  {f.f_code.co_filename}:{f.f_lineno} in {f.f_code.co_qualname}" for f in _walk(frame)]
@@ -0,0 +1,202 @@
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+from logbook import NOTSET, WARNING, Handler, LogRecord, StreamHandler
+
+from vrf_worker.config import WorkerConfig
+from vrf_worker.metrics import METRICS, Metrics
+
+LOG_FORMATS = {"text", "json"}
+
+# put on the queue to stop the writer thread
+_STOP = object()
+
+
+def task_fields(nonce: int, stage: str, started: Optional[float] = None) -> dict:
+    """Returns the structured fields of a task log line, with the seconds since `started` if it is given.
+
+    Args:
+        nonce (int): The task nonce.
+        stage (str): The stage of the task, e.g. "request", "proof" or "relay".
+        started (Optional[float]): The `time.monotonic()` at which the stage started.
+
+    Returns:
+        dict: The fields, to pass as `extra` to a logger.
+    """
+    fields = {"nonce": nonce, "stage": stage}
+    if started is not None:
+        fields["duration"] = round(time.monotonic() - started, 3)
+    return fields
+
+
+class JsonFormatter:
+    """Formats a log record as one line of compact JSON, with the `extra` fields of the record at the top level."""
+
+    def __call__(self, record: LogRecord, handler: Handler) -> str:
+        line = {
+            "time": record.time.isoformat(),
+            "level": record.level_name,
+            "channel": record.channel,
+            "message": record.message,
+        }
+        line.update(record.extra)
+        if record.formatted_exception:
+            line["exception"] = record.formatted_exception
+        return json.dumps(line, separators=(",", ":"), default=str)
+
+
+class LogSampler:
+    """Limits how often the same warning or error is logged.
+
+    Records are keyed by channel and unformatted message, so lines that only differ in their arguments, like the
+    errors of a poll loop against an endpoint that is down, count as the same. Up to `limit` records of a key are
+    kept per `window` seconds and the rest are suppressed. The first record of a key in a new window is preceded by
+    a line telling how many were suppressed in the last one. Records below `level` are always kept.
+    """
+
+    def __init__(self, limit: int = 10, window: float = 60, level: int = WARNING) -> None:
+        self.limit = limit
+        self.window = window
+        self.level = level
+        # (channel, message) -> (window start, records seen in the window, level of the last one)
+        self._seen: dict[tuple[str, str], tuple[float, int, int]] = {}
+
+    def sample(self, record: LogRecord) -> list[LogRecord]:
+        """Returns the records to log in place of `record`: none if it is suppressed, otherwise the record, preceded
+        by a summary of the records of its key suppressed in the last window if there were any."""
+        if record.level < self.level or self.limit <= 0:
+            return [record]
+
+        key = (record.channel, str(record.msg))
+        now = time.monotonic()
+        (start, seen, _) = self._seen.get(key, (now, 0, record.level))
+        records = [record]
+        if now - start >= self.window:
+            if seen > self.limit:
+                records.insert(0, self._summary(key, record.level, seen - self.limit, now - start))
+            (start, seen) = (now, 0)
+
+        self._seen[key] = (start, seen + 1, record.level)
+        return records if seen < self.limit else []
+
+    def flush(self) -> list[LogRecord]:
+        """Returns the summaries of the records suppressed in the current windows, and starts new ones."""
+        now = time.monotonic()
+        summaries = []
+        for key, (start, seen, level) in self._seen.items():
+            if seen > self.limit:
+                summaries.append(self._summary(key, level, seen - self.limit, now - start))
+        self._seen.clear()
+        return summaries
+
+    def _summary(self, key: tuple[str, str], level: int, suppressed: int, elapsed: float) -> LogRecord:
+        (channel, msg) = key
+        summary = LogRecord(
+            channel, level, "Suppressed {} more lines like {!r} in the last {:.0f}s", args=(suppressed, msg, elapsed)
+        )
+        summary.heavy_init()
+        return summary
+
+
+class QueuedHandler(Handler):
+    """Hands records to another handler that runs in a background thread, so that logging never waits for output.
+
+    Records are passed through a queue of up to `maxsize` records, 0 for no limit, and formatted in the background
+    thread. When the queue is full, a record is dropped unless `block` is set, in which case the caller waits for
+    room. Dropped records are counted in `vrf_worker_log_records_dropped_total` and reported once the queue has room
+    again, and records suppressed by the `sampler` in `vrf_worker_log_records_suppressed_total`.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        maxsize: int = 10000,
+        block: bool = False,
+        sampler: Optional[LogSampler] = None,
+        metrics: Metrics = METRICS,
+        level: int = NOTSET,
+    ) -> None:
+        super().__init__(level)
+        self.handler = handler
+        self.block = block
+        self.sampler = sampler
+        self.metrics = metrics
+
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._write, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: LogRecord) -> None:
+        # the record is closed, losing its traceback, once it is handled, so the exception is formatted here
+        if record.exc_info:
+            _ = record.formatted_exception
+
+        records = [record] if self.sampler is None else self.sampler.sample(record)
+        if not records:
+            self.metrics.inc("vrf_worker_log_records_suppressed_total")
+        for sampled in records:
+            self._put(sampled)
+
+    def close(self) -> None:
+        """Writes out the queued records and stops the background thread."""
+        if not self._thread.is_alive():
+            return
+        for summary in self.sampler.flush() if self.sampler is not None else []:
+            self._put(summary)
+        self.queue.put(_STOP)
+        self._thread.join(timeout=5)
+        self.handler.close()
+
+    def _put(self, record: LogRecord) -> None:
+        try:
+            self.queue.put(record, block=self.block)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            self.metrics.inc("vrf_worker_log_records_dropped_total")
+
+    def _write(self) -> None:
+        while (record := self.queue.get()) is not _STOP:
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handle_error(record, sys.exc_info())
+
+            with self._lock:
+                (dropped, self._dropped) = (self._dropped, 0)
+            if dropped:
+                notice = LogRecord(
+                    record.channel, WARNING, "Dropped {} log lines while output was slow", args=(dropped,)
+                )
+                notice.heavy_init()
+                self.handler.handle(notice)
+
+
+def setup_logging(worker_config: WorkerConfig, stream: TextIO = sys.stdout) -> Handler:
+    """Builds the handler that writes the worker's logs to `stream` as configured.
+
+    Args:
+        worker_config (WorkerConfig): The worker config, with the log_* settings.
+        stream (TextIO): The stream to write to.
+
+    Returns:
+        Handler: The handler, to push to the application and close on exit.
+
+    Raises:
+        Exception: If the log format is unknown.
+    """
+    if worker_config.log_format not in LOG_FORMATS:
+        raise Exception(f"unknown log format {worker_config.log_format!r}, expected one of {sorted(LOG_FORMATS)}")
+
+    handler = StreamHandler(stream)
+    if worker_config.log_format == "json":
+        handler.formatter = JsonFormatter()
+
+    sampler = LogSampler(worker_config.log_sample_limit, worker_config.log_sample_window)
+    return QueuedHandler(handler, worker_config.log_queue_size, worker_config.log_queue_block, sampler)
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    """An in-process registry of gauges and counters, rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, dict[Labels, float]] = {}
+        self._collectors: list[Callable[["Metrics"], None]] = []
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Sets a gauge."""
+        self._values.setdefault(name, {})[_labels(labels)] = value
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Increments a counter."""
+        series = self._values.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def get(self, name: str, **labels: str) -> float | None:
+        return self._values.get(name, {}).get(_labels(labels))
+
+    def clear(self, name: str) -> None:
+        """Removes every series of a metric, e.g. before re-exporting a set of labels that changes over time."""
+        self._values.pop(name, None)
+
+    def add_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        """Registers a function that updates metrics right before they are rendered."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector(self)
+
+        lines = []
+        for name, series in sorted(self._values.items()):
+            for labels, value in series.items():
+                label_str = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+METRICS = Metrics()
+
+
+async def serve_metrics(
+    metrics: Metrics,
+    port: int,
+    host: str = "0.0.0.0",
+    routes: dict[str, Callable[[dict[str, str]], Awaitable[str]]] | None = None,
+) -> asyncio.Server:
+    """Serves the metrics over HTTP on every path, except for the paths in `routes`.
+
+    Args:
+        metrics (Metrics): The metrics registry.
+        port (int): The port to listen on.
+        host (str): The host to listen on.
+        routes (dict, optional): Handlers of other paths, called with the query parameters and returning the body.
+
+    Returns:
+        asyncio.Server: The running server.
+    """
+    routes = routes or {}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode(errors="replace").split()
+            # the rest of the request is ignored, only wait for the end of its headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            url = urlsplit(request_line[1] if len(request_line) > 1 else "/")
+            status = "200 OK"
+            if url.path in routes:
+                try:
+                    body = (await routes[url.path](dict(parse_qsl(url.query)))).encode()
+                except Exception as e:
+                    (status, body) = ("500 Internal Server Error", f"{e}\n".encode())
+            else:
+                body = metrics.render().encode()
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n".encode()
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
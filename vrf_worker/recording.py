@@ -0,0 +1,293 @@
+import asyncio
+import builtins
+import dataclasses
+import gzip
+import inspect
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import betterproto
+from pyband.proto.cosmos.base.abci.v1beta1 import TxResponse
+
+from vrf_worker.types import Task, TaskRecord
+
+RECORDING_VERSION = 2
+
+# the structured values a recording can hold, besides plain ones; any other value cannot be saved
+RECORDED_TYPES: dict[str, type] = {cls.__name__: cls for cls in (Task, TaskRecord, TxResponse)}
+
+
+@dataclass
+class Call:
+    client: str
+    method: str
+    key: tuple
+    is_async: bool
+    # seconds since the recording began
+    start: float
+    duration: float
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+class Recording:
+    """The calls made to the chain clients during a run, with their results and timing.
+
+    A recording is saved as gzipped JSON, so loading one only ever builds plain values, the types in
+    `RECORDED_TYPES` and exceptions, and never runs code from the file. Errors keep their message and, for built-in
+    exceptions, their type; any other is loaded as an `Exception`.
+    """
+
+    def __init__(self, calls: Optional[list[Call]] = None) -> None:
+        self.calls: list[Call] = calls or []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add(self, call: Call) -> None:
+        with self.lock:
+            self.calls.append(call)
+
+    def save(self, path: str) -> None:
+        """Writes the recording to `path` as gzipped JSON.
+
+        Raises:
+            Exception: A call has an argument key or a result that cannot be recorded.
+        """
+        with self.lock:
+            calls = list(self.calls)
+        data = {"version": RECORDING_VERSION, "calls": [_encode_call(call) for call in calls]}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        """Reads a recording written by `save`.
+
+        Raises:
+            Exception: The file was written by an incompatible version, or is not a recording.
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        version = data.get("version") if isinstance(data, dict) else None
+        if version != RECORDING_VERSION:
+            raise Exception(f"unsupported recording version {version}")
+        return cls([_decode_call(call) for call in data["calls"]])
+
+
+class RecordingClient:
+    """Wraps a chain client and records every public method call into a `Recording`.
+
+    Other attributes are passed through to the wrapped client, so it can stand in for the client anywhere.
+    """
+
+    def __init__(self, client: Any, name: str, recording: Recording) -> None:
+        self._client = client
+        self._name = name
+        self._recording = recording
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await attr(*args, **kwargs)
+                except Exception as e:
+                    self._record(name, args, kwargs, True, start, error=e)
+                    raise
+                self._record(name, args, kwargs, True, start, result=result)
+                return result
+
+            return async_wrapper
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._record(name, args, kwargs, False, start, error=e)
+                raise
+            self._record(name, args, kwargs, False, start, result=result)
+            return result
+
+        return wrapper
+
+    def _record(
+        self,
+        method: str,
+        args: tuple,
+        kwargs: dict,
+        is_async: bool,
+        start: float,
+        result: Any = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        self._recording.add(
+            Call(
+                self._name,
+                method,
+                call_key(args, kwargs),
+                is_async,
+                start - self._recording.origin,
+                time.perf_counter() - start,
+                result,
+                error,
+            )
+        )
+
+
+class ReplayClient:
+    """Serves the calls of one client from a `Recording`, in place of that client.
+
+    A call gets the result of the next recorded call of the same method with the same arguments. Once those run out
+    the last one is repeated, so a replay can poll for longer than the recording did. Arguments that are not plain
+    values, such as accounts and wallets, only match by type. A call that was never recorded raises, as the run has
+    diverged from the recording.
+
+    At a `speed` of 1 each call takes as long as it did when recorded, at 2 half as long, and at 0 it returns at once.
+    """
+
+    def __init__(self, recording: Recording, name: str, speed: float = 1.0) -> None:
+        self._speed = speed
+        self._lock = threading.Lock()
+        self._by_key: dict[tuple, deque[Call]] = defaultdict(deque)
+        self._is_async: dict[str, bool] = {}
+        for call in recording.calls:
+            if call.client == name:
+                self._by_key[(call.method, call.key)].append(call)
+                self._is_async[call.method] = call.is_async
+
+    def __getattr__(self, name: str) -> Callable:
+        if name.startswith("_") or name not in self._is_async:
+            raise AttributeError(f"{name} was not recorded")
+
+        if self._is_async[name]:
+
+            async def async_replay(*args, **kwargs):
+                call = self._next(name, args, kwargs)
+                if self._speed > 0:
+                    await asyncio.sleep(call.duration / self._speed)
+                return _outcome(call)
+
+            return async_replay
+
+        def replay(*args, **kwargs):
+            call = self._next(name, args, kwargs)
+            if self._speed > 0:
+                time.sleep(call.duration / self._speed)
+            return _outcome(call)
+
+        return replay
+
+    def _next(self, method: str, args: tuple, kwargs: dict) -> Call:
+        with self._lock:
+            calls = self._by_key.get((method, call_key(args, kwargs)))
+            if not calls:
+                raise Exception(f"no recorded call of {method} with arguments {args} {kwargs}")
+            return calls.popleft() if len(calls) > 1 else calls[0]
+
+
+def _outcome(call: Call) -> Any:
+    if call.error is not None:
+        raise call.error
+    return call.result
+
+
+def _encode_call(call: Call) -> dict:
+    return {
+        "client": call.client,
+        "method": call.method,
+        "key": _encode(call.key),
+        "is_async": call.is_async,
+        "start": call.start,
+        "duration": call.duration,
+        "result": _encode(call.result),
+        "error": None if call.error is None else {"type": type(call.error).__name__, "message": str(call.error)},
+    }
+
+
+def _decode_call(data: dict) -> Call:
+    error = data["error"]
+    return Call(
+        data["client"],
+        data["method"],
+        _decode(data["key"]),
+        data["is_async"],
+        data["start"],
+        data["duration"],
+        _decode(data["result"]),
+        None if error is None else _decode_error(error["type"], error["message"]),
+    )
+
+
+def _encode(value: Any) -> Any:
+    """Encodes a value as JSON, tagging those JSON has no type for, in a way `_decode` reverses."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": bytes(value).hex()}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, tuple):
+        return {"tuple": [_encode(item) for item in value]}
+    if isinstance(value, dict):
+        return {"dict": [[_encode(k), _encode(v)] for k, v in value.items()]}
+    name = type(value).__name__
+    if RECORDED_TYPES.get(name) is type(value):
+        if isinstance(value, betterproto.Message):
+            return {"message": name, "data": bytes(value).hex()}
+        fields = {field.name: _encode(getattr(value, field.name)) for field in dataclasses.fields(value)}
+        return {"dataclass": name, "fields": fields}
+    raise Exception(f"cannot record a value of type {name}")
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "bytes" in value:
+        return bytes.fromhex(value["bytes"])
+    if "tuple" in value:
+        return tuple(_decode(item) for item in value["tuple"])
+    if "dict" in value:
+        return {_decode(k): _decode(v) for k, v in value["dict"]}
+    if "message" in value:
+        return _recorded_type(value["message"])().parse(bytes.fromhex(value["data"]))
+    if "dataclass" in value:
+        return _recorded_type(value["dataclass"])(**{k: _decode(v) for k, v in value["fields"].items()})
+    raise Exception(f"unknown recorded value {value}")
+
+
+def _recorded_type(name: str) -> type:
+    if name not in RECORDED_TYPES:
+        raise Exception(f"unknown recorded type {name}")
+    return RECORDED_TYPES[name]
+
+
+def _decode_error(name: str, message: str) -> Exception:
+    cls = getattr(builtins, name, None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        return cls(message)
+    return Exception(f"{name}: {message}")
+
+
+def call_key(args: tuple, kwargs: dict) -> tuple:
+    """Returns a comparable key for the arguments of a call."""
+    return (_value_key(args), _value_key(sorted(kwargs.items())))
+
+
+def _value_key(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(_value_key(item) for item in value)
+    return type(value).__name__
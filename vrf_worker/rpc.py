@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Hashable, Iterator, Optional
+
+from vrf_worker.metrics import METRICS, Metrics
+
+# Request priorities, most urgent first. Transactions and their receipts go ahead of the reads that process tasks,
+# which go ahead of the reads that discover new tasks.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# share of the bucket, above the last token, that each priority leaves for the more urgent ones
+PRIORITY_RESERVE = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: 0.2, PRIORITY_LOW: 0.4}
+
+_priority: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("rpc_priority", default=None)
+
+
+@contextmanager
+def rpc_priority(priority: int) -> Iterator[None]:
+    """Sets the priority of the requests made in the block, including from threads started with `to_thread`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: int = PRIORITY_NORMAL) -> int:
+    priority = _priority.get()
+    return default if priority is None else priority
+
+
+class RateLimited(Exception):
+    """A request was rejected by the endpoint for exceeding its rate limit."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Returns whether an error is an endpoint rejecting a request for exceeding its rate limit.
+
+    Recognizes HTTP 429 responses, gRPC RESOURCE_EXHAUSTED statuses and `RateLimited`.
+    """
+    if isinstance(error, RateLimited):
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    status = getattr(error, "status", None)
+    if getattr(status, "name", None) == "RESOURCE_EXHAUSTED":
+        return True
+    message = str(error).lower()
+    return "too many requests" in message or "rate limit" in message
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Returns the delay an endpoint asked for before retrying a rate limited request, if it gave one."""
+    if isinstance(error, RateLimited):
+        return error.retry_after
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """A token bucket rate limiter, usable from threads and coroutines alike.
+
+    Tokens are added at `rate` per second, up to `burst`. A request of a given priority only takes a token if that
+    leaves its `PRIORITY_RESERVE` share of the bucket for more urgent requests, so under load urgent requests are
+    served first and the least urgent wait. A `rate` of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Waits for a token by sleeping, and returns how long it waited."""
+        waited = 0.0
+        while (delay := self._take(priority)) > 0:
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    async def acquire_async(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Waits for a token without blocking the event loop, and returns how long it waited."""
+        waited = 0.0
+        while (delay := self._take(priority)) > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+    def _take(self, priority: int) -> float:
+        """Takes a token and returns 0, or returns how long until one may be available for the priority."""
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            floor = PRIORITY_RESERVE.get(priority, PRIORITY_RESERVE[PRIORITY_LOW]) * (self.burst - 1)
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                return 0.0
+            return (floor + 1 - self.tokens) / self.rate
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class RpcGate:
+    """The shared layer under the chain clients that merges identical requests and limits their rate.
+
+    Requests made with the same key while one is in flight wait for and share its result instead of being sent
+    again. Every request that is sent takes a token from the endpoint's `TokenBucket`, and one that is rate limited
+    by the endpoint is retried up to `max_retries` times, after the delay the endpoint asked for or an exponential
+    backoff, instead of failing the task that made it.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        rate: float = 0,
+        burst: int = 10,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        metrics: Metrics = METRICS,
+    ) -> None:
+        self.endpoint = endpoint
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics
+
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    def call(self, key: Optional[Hashable], priority: int, fn: Callable[[], Any]) -> Any:
+        """Makes a blocking request, merged with any in flight with the same `key` unless it is None."""
+        if key is None:
+            return self._send(priority, fn)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self.metrics.inc("vrf_worker_rpc_coalesced_total", endpoint=self.endpoint)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._send(priority, fn)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def call_async(self, key: Optional[Hashable], priority: int, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Makes a request from a coroutine, merged with any in flight with the same `key` unless it is None."""
+        if key is None:
+            return await self._send_async(priority, fn)
+
+        task = self._tasks.get(key)
+        if task is not None:
+            self.metrics.inc("vrf_worker_rpc_coalesced_total", endpoint=self.endpoint)
+        else:
+            # the request runs as its own task, so that it outlives a caller that is cancelled while others wait
+            task = self._tasks[key] = asyncio.ensure_future(self._send_async(priority, fn))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _send(self, priority: int, fn: Callable[[], Any]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self._throttled(self.bucket.acquire(priority))
+            try:
+                self.metrics.inc("vrf_worker_rpc_requests_total", endpoint=self.endpoint)
+                return fn()
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt))
+
+    async def _send_async(self, priority: int, fn: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self._throttled(await self.bucket.acquire_async(priority))
+            try:
+                self.metrics.inc("vrf_worker_rpc_requests_total", endpoint=self.endpoint)
+                return await fn()
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Returns how long to wait before retrying a failed request, or raises the error if it is not retried."""
+        if attempt >= self.max_retries or not is_rate_limited(error):
+            raise error
+        self.metrics.inc("vrf_worker_rpc_rate_limited_total", endpoint=self.endpoint)
+        delay = retry_after(error)
+        return delay if delay is not None else self.backoff * 2**attempt
+
+    def _throttled(self, waited: float) -> None:
+        if waited > 0:
+            self.metrics.inc("vrf_worker_rpc_throttled_seconds_total", waited, endpoint=self.endpoint)
@@ -0,0 +1,310 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+from vrf_worker.metrics import Metrics
+from vrf_worker.types import TaskRecord
+
+
+class _Entry:
+    __slots__ = ("priority", "seq", "record", "retry", "removed")
+
+    def __init__(self, priority: float, seq: int, record: TaskRecord, retry: int) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.record = record
+        self.retry = retry
+        self.removed = False
+
+
+class _SpillQueue:
+    """A disk-backed store of queued entries, indexed by priority and by age.
+
+    Its methods block on SQLite, so the scheduler calls them in a thread, and they use the connection one at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        import sqlite3  # only needed once the queue overflows
+
+        # An empty path is a private temporary database on disk, deleted when it is closed. The spill queue does not
+        # need to survive a crash, so durability is traded for speed.
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("PRAGMA journal_mode = MEMORY")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "seq INTEGER PRIMARY KEY, priority REAL, nonce INTEGER, seed BLOB, time INTEGER, caller TEXT, "
+            "fee TEXT, retry INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_priority ON entries (priority, seq)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_time ON entries (time, seq)")
+        self.conn.execute("DELETE FROM entries")
+        self.size = 0
+
+    def push(self, entry: _Entry) -> None:
+        record = entry.record
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.seq,
+                    entry.priority,
+                    record.nonce,
+                    record.seed,
+                    record.time,
+                    record.caller,
+                    str(record.fee),
+                    entry.retry,
+                ),
+            )
+            self.size += 1
+
+    def peek(self, order: str, blocked: set[str], max_time: float | None = None) -> _Entry | None:
+        """Returns the first entry by `order` ("priority" or "time") whose caller is not blocked."""
+        query = "SELECT seq, priority, nonce, seed, time, caller, fee, retry FROM entries"
+        conditions, params = [], []
+        if blocked:
+            conditions.append(f"lower(caller) NOT IN ({','.join('?' * len(blocked))})")
+            params.extend(blocked)
+        if max_time is not None:
+            conditions.append("time <= ?")
+            params.append(max_time)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {order}, seq LIMIT 1"
+
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        seq, priority, nonce, seed, task_time, caller, fee, retry = row
+        return _Entry(priority, seq, TaskRecord(nonce, seed, task_time, caller, int(fee)), retry)
+
+    def head(self, order: str, limit: int) -> list[_Entry]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, priority, nonce, seed, time, caller, fee, retry FROM entries "
+                f"ORDER BY {order}, seq LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            _Entry(priority, seq, TaskRecord(nonce, seed, task_time, caller, int(fee)), retry)
+            for seq, priority, nonce, seed, task_time, caller, fee, retry in rows
+        ]
+
+    def count_older(self, max_time: float) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries WHERE time <= ?", (max_time,)).fetchone()[0]
+
+    def remove(self, seq: int) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE seq = ?", (seq,))
+            self.size -= 1
+
+
+class TaskScheduler:
+    """A priority queue of tasks, ordered by task fee, age, retry count and caller weight.
+
+    A task's priority is its age plus a bonus of one second for every `fee_per_second` of task fee (scaled by its
+    caller's weight and capped at `max_fee_bonus` seconds), minus `retry_penalty` seconds for every retry. Since
+    every task ages at the same rate, the ordering only depends on `task.time - bonus + retries * retry_penalty`,
+    which is fixed when the task is queued.
+
+    The cap on the bonus bounds how long a task can be overtaken by newer ones. On top of that, any task older than
+    `starvation_age` seconds is served before all others, oldest first. Tasks of a caller that already has
+    `caller_max_in_flight` tasks in progress are held back until one of them is marked done.
+
+    Up to `max_in_memory` tasks are kept in memory. Past that, new tasks spill to an SQLite database at `spill_path`
+    (a temporary file by default), so `put` never blocks and memory stays flat however large the backlog grows.
+    """
+
+    def __init__(
+        self,
+        fee_per_second: int,
+        max_fee_bonus: float,
+        retry_penalty: float,
+        starvation_age: float,
+        caller_weights: dict[str, float] | None = None,
+        caller_max_in_flight: dict[str, int] | None = None,
+        metrics: Metrics | None = None,
+        exported_positions: int = 20,
+        max_in_memory: int = 10000,
+        spill_path: str = "",
+    ) -> None:
+        self.fee_per_second = fee_per_second
+        self.max_fee_bonus = max_fee_bonus
+        self.retry_penalty = retry_penalty
+        self.starvation_age = starvation_age
+        self.caller_weights = {caller.lower(): weight for caller, weight in (caller_weights or {}).items()}
+        self.caller_max_in_flight = {caller.lower(): limit for caller, limit in (caller_max_in_flight or {}).items()}
+        self.exported_positions = exported_positions
+        self.max_in_memory = max_in_memory
+        self.spill_path = spill_path
+
+        self._by_priority: list[tuple[float, int, _Entry]] = []
+        self._by_age: list[tuple[int, int, _Entry]] = []
+        self._in_memory = 0
+        self._spilled: _SpillQueue | None = None
+        self._seq = itertools.count()
+        self._in_flight: dict[str, int] = defaultdict(int)
+        self._changed = asyncio.Condition()
+
+        if metrics is not None:
+            metrics.add_collector(self._collect)
+
+    def __len__(self) -> int:
+        return self._in_memory + self.spilled
+
+    @property
+    def spilled(self) -> int:
+        """The number of queued tasks held on disk."""
+        return self._spilled.size if self._spilled is not None else 0
+
+    def priority(self, record: TaskRecord, retry: int) -> float:
+        """Returns the scheduling key of a task. Lower keys are served first."""
+        weight = self.caller_weights.get(record.caller.lower(), 1.0)
+        fee_bonus = min(record.fee / self.fee_per_second * weight, self.max_fee_bonus)
+        return record.time - fee_bonus + retry * self.retry_penalty
+
+    async def put(self, record: TaskRecord, retry: int) -> None:
+        """Queues a task. Never blocks on a full queue."""
+        entry = _Entry(self.priority(record, retry), next(self._seq), record, retry)
+        async with self._changed:
+            if self._in_memory < self.max_in_memory:
+                heapq.heappush(self._by_priority, (entry.priority, entry.seq, entry))
+                heapq.heappush(self._by_age, (record.time, entry.seq, entry))
+                self._in_memory += 1
+            else:
+                # SQLite blocks on disk, so the spill queue is used from a thread while the queue is locked
+                if self._spilled is None:
+                    self._spilled = await asyncio.to_thread(_SpillQueue, self.spill_path)
+                await asyncio.to_thread(self._spilled.push, entry)
+            self._changed.notify_all()
+
+    async def get(self) -> tuple[TaskRecord, int]:
+        """Waits for and removes the next task that may run, and counts it as in flight for its caller.
+
+        Returns:
+            tuple: (task record, retry)
+        """
+        async with self._changed:
+            while (entry := await self._pop_next(time.time())) is None:
+                await self._changed.wait()
+
+        self._in_flight[entry.record.caller.lower()] += 1
+        return entry.record, entry.retry
+
+    async def done(self, record: TaskRecord) -> None:
+        """Marks a task returned by `get` as no longer in flight."""
+        caller = record.caller.lower()
+        self._in_flight[caller] -= 1
+        if self._in_flight[caller] <= 0:
+            del self._in_flight[caller]
+
+        async with self._changed:
+            self._changed.notify_all()
+
+    def ordered(self, now: float | None = None, limit: int | None = None) -> list[tuple[TaskRecord, int]]:
+        """Returns the first queued tasks in the order they would be served, ignoring per-caller limits."""
+        now = time.time() if now is None else now
+        entries = [entry for _, _, entry in self._by_priority if not entry.removed]
+        if self._spilled is not None:
+            spilled_limit = limit if limit is not None else self._spilled.size
+            entries += self._spilled.head("priority", spilled_limit) + self._spilled.head("time", spilled_limit)
+
+        seen = set()
+        ordered = []
+        for entry in sorted(entries, key=lambda entry: self._sort_key(entry, now)):
+            if entry.seq not in seen:
+                seen.add(entry.seq)
+                ordered.append((entry.record, entry.retry))
+        return ordered[:limit]
+
+    def _is_starving(self, entry: _Entry, now: float) -> bool:
+        return now - entry.record.time >= self.starvation_age
+
+    def _sort_key(self, entry: _Entry, now: float) -> tuple:
+        if self._is_starving(entry, now):
+            return (0, entry.record.time, entry.seq)
+        return (1, entry.priority, entry.seq)
+
+    async def _pop_next(self, now: float) -> _Entry | None:
+        blocked = {
+            caller
+            for caller, limit in self.caller_max_in_flight.items()
+            if limit is not None and self._in_flight[caller] >= limit
+        }
+        cutoff = now - self.starvation_age
+
+        # serve the oldest starving task first, then the best priority, from memory or disk whichever comes first
+        for heap, order, max_time, key in (
+            (self._by_age, "time", cutoff, lambda entry: (entry.record.time, entry.seq)),
+            (self._by_priority, "priority", None, lambda entry: (entry.priority, entry.seq)),
+        ):
+            candidates = []
+            in_memory = self._peek(
+                heap, blocked, lambda entry, max_time=max_time: max_time is None or entry.record.time <= max_time
+            )
+            if in_memory is not None:
+                candidates.append(in_memory)
+            if self._spilled is not None and self._spilled.size:
+                on_disk = await asyncio.to_thread(self._spilled.peek, order, blocked, max_time)
+                if on_disk is not None:
+                    candidates.append(on_disk)
+            if not candidates:
+                continue
+
+            entry = min(candidates, key=key)
+            if entry is in_memory:
+                entry.removed = True
+                self._in_memory -= 1
+            else:
+                await asyncio.to_thread(self._spilled.remove, entry.seq)
+            return entry
+
+        return None
+
+    def _peek(self, heap: list, blocked: set[str], eligible: Callable[[_Entry], bool]) -> _Entry | None:
+        """Returns the first live, eligible entry of a heap whose caller is not blocked, without removing it."""
+        skipped = []
+        found = None
+        while heap:
+            entry = heap[0][2]
+            if entry.removed:
+                heapq.heappop(heap)
+                continue
+            if not eligible(entry):
+                break
+            if entry.record.caller.lower() in blocked:
+                skipped.append(heapq.heappop(heap))
+                continue
+            found = entry
+            break
+
+        for item in skipped:
+            heapq.heappush(heap, item)
+        return found
+
+    def _collect(self, metrics: Metrics) -> None:
+        now = time.time()
+        metrics.set("vrf_worker_queue_depth", len(self))
+        metrics.set("vrf_worker_queue_spilled", self.spilled)
+        starving = sum(1 for _, _, entry in self._by_age if not entry.removed and self._is_starving(entry, now))
+        if self._spilled is not None:
+            starving += self._spilled.count_older(now - self.starvation_age)
+        metrics.set("vrf_worker_queue_starving", starving)
+
+        metrics.clear("vrf_worker_in_flight")
+        for caller, count in self._in_flight.items():
+            metrics.set("vrf_worker_in_flight", count, caller=caller)
+
+        metrics.clear("vrf_worker_queue_position")
+        for position, (record, retry) in enumerate(self.ordered(now, self.exported_positions)):
+            metrics.set(
+                "vrf_worker_queue_position", position, nonce=record.nonce, caller=record.caller.lower(), retry=retry
+            )
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterator, Optional
+
+from logbook import Logger
+
+from vrf_worker.config import EvmConfig
+
+SNAPSHOT_VERSION = 2
+
+
+@dataclass
+class ChainSnapshot:
+    """Chain facts that rarely change, saved locally so that startup does not wait on them."""
+
+    version: int
+    chain_id: str
+    vrf_provider_address: str
+    bridge_address: str
+    encoded_band_chain_id: str
+    oracle_script_id: int
+
+    @classmethod
+    def create(cls, evm_config: EvmConfig, encoded_band_chain_id: bytes, oracle_script_id: int) -> "ChainSnapshot":
+        return cls(
+            SNAPSHOT_VERSION,
+            evm_config.chain_id,
+            evm_config.vrf_provider_address,
+            evm_config.bridge_address,
+            encoded_band_chain_id.hex(),
+            oracle_script_id,
+        )
+
+    def matches(self, evm_config: EvmConfig) -> bool:
+        """Returns whether the snapshot was taken with the current format, chain and contracts."""
+        return (
+            self.version == SNAPSHOT_VERSION
+            and self.chain_id == evm_config.chain_id
+            and self.vrf_provider_address.lower() == evm_config.vrf_provider_address.lower()
+            and self.bridge_address.lower() == evm_config.bridge_address.lower()
+        )
+
+
+def load_snapshot(path: str, evm_config: EvmConfig) -> Optional[ChainSnapshot]:
+    """Loads the chain snapshot at `path`.
+
+    Args:
+        path (str): Path to the snapshot file.
+        evm_config (EvmConfig): The EVM config the snapshot must match.
+
+    Returns:
+        Optional[ChainSnapshot]: The snapshot, or None if it is missing, unreadable, of another version or taken
+        for other contracts.
+    """
+    try:
+        with open(path) as f:
+            snapshot = ChainSnapshot(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+    return snapshot if snapshot.matches(evm_config) else None
+
+
+def save_snapshot(path: str, snapshot: ChainSnapshot) -> None:
+    """Atomically writes the chain snapshot to `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(asdict(snapshot), f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class StartupProfile:
+    """Records when each startup step began and how long it took.
+
+    Steps may overlap; offsets are relative to the creation of the profile, which should be as early as possible.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.steps: list[tuple[str, float, float]] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, start - self.origin, time.perf_counter() - start))
+
+    async def run(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking call in a thread as a timed step."""
+        with self.step(name):
+            return await asyncio.to_thread(func, *args)
+
+    def report(self, logger: Logger) -> None:
+        if not self.enabled:
+            return
+
+        logger.info("Startup profile ({:.3f}s to ready):", time.perf_counter() - self.origin)
+        for name, offset, duration in sorted(self.steps, key=lambda step: step[1]):
+            logger.info("  +{:7.3f}s {:7.3f}s  {}", offset, duration, name)
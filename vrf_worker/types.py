@@ -10,3 +10,14 @@ class Task:
     seed: bytes
     result: bytes
     client_seed: str
+
+
+@dataclass(slots=True)
+class TaskRecord:
+    """A compact record of a queued task, holding only what the pipeline needs."""
+
+    nonce: int
+    seed: bytes
+    time: int
+    caller: str
+    fee: int